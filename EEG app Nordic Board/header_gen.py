@@ -18,8 +18,11 @@ def load_data(filename, max_samples):
             raise ValueError("Invalid file: Header too short")
         
         # Parse header
-        numArrays, dim1, dim2, labelsPresent = struct.unpack('<iiii', header_bytes)
-        print(f"numArrays: {numArrays}, dim1: {dim1}, dim2: {dim2}, labelsPresent: {labelsPresent}")
+        # flags: bit 0 = labels present, bits 8-15 = layout (0 channel-major, 1 time-major)
+        numArrays, dim1, dim2, flags = struct.unpack('<iiii', header_bytes)
+        labelsPresent = flags & 0x1
+        layout = (flags >> 8) & 0xFF
+        print(f"numArrays: {numArrays}, dim1: {dim1}, dim2: {dim2}, labelsPresent: {labelsPresent}, layout: {layout}")
 
         # Validate dimensions
         if dim1 != 18:
@@ -28,6 +31,8 @@ def load_data(filename, max_samples):
             raise ValueError(f"Invalid dim2: Expected 1024, got {dim2}")
         if labelsPresent != 1:
             raise ValueError(f"Invalid labelsPresent: Expected 1, got {labelsPresent}")
+        if layout not in (0, 1):
+            raise ValueError(f"Invalid layout: Expected 0 or 1, got {layout}")
 
         # Calculate total number of floats
         totalFloats = numArrays * dim1 * dim2
@@ -41,7 +46,11 @@ def load_data(filename, max_samples):
 
         # Convert to NumPy array for efficient processing
         eeg_data = np.frombuffer(eeg_data_bytes, dtype='<f4')  # Little-endian float32
-        eeg_data = eeg_data.reshape((numArrays, dim2, dim1))  # Shape: (numArrays, dim2, dim1)
+        if layout == 1:
+            eeg_data = eeg_data.reshape((numArrays, dim2, dim1))  # Already time-major
+        else:
+            # Channel-major windows, read sample by sample through a transposed view
+            eeg_data = eeg_data.reshape((numArrays, dim1, dim2)).transpose(0, 2, 1)
         print("EEG data loaded successfully.")
 
         # Read all labels
@@ -0,0 +1,37 @@
+# %%
+# %load_ext autoreload
+# %autoreload 2
+# %%
+import os
+from utils.binfile import load_arrays_and_labels_memmap
+from utils.cascade import PreFilter, evaluate_cascade, format_cascade_report
+from utils.streaming import load_score_fn
+
+
+# %%
+def main():
+    checkpoint_dir = "models/"
+    target_recall = 0.99
+
+    # Fit the pre-filter on the training recording
+    data_file = "data/data_20.bin"
+    data, labels = load_arrays_and_labels_memmap(data_file)
+    prefilter = PreFilter.fit(data, labels, target_recall=target_recall)
+    prefilter_path = os.path.join(checkpoint_dir, "prefilter.npz")
+    prefilter.save(prefilter_path)
+    print(
+        f"pre-filter saved to {prefilter_path} "
+        f"(threshold {prefilter.threshold:.4f})"
+    )
+
+    # Compare FCN2 alone with the cascade on the test recording
+    test_file = "data/data_21.bin"
+    score_fn = load_score_fn(os.path.join(checkpoint_dir, "base_pat_02.pth"))
+    result = evaluate_cascade(test_file, prefilter, score_fn)
+    print(format_cascade_report(result))
+
+
+# %%
+if __name__ == "__main__":
+    main()
+# %%
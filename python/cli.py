@@ -0,0 +1,655 @@
+"""
+Single entry point for the SeizureGuard Python tooling.
+
+    python cli.py inspect data/data_20.bin
+    python cli.py eval --data data/data_21.bin --model models/base_pat_02.onnx
+    python cli.py train --data data/data_20.bin --epochs 20
+    python cli.py export --checkpoint models/base_pat_02.pth
+    python cli.py bench --model models/base_pat_02.pth
+    python cli.py stats data/data_20.bin
+    python cli.py score --data data/data_21.bin --out logs/predictions.csv
+    python cli.py check --data data/data_21.bin
+    python cli.py convert data/data_20.bin
+    python cli.py synth data/synthetic.bin --windows 100000
+    python cli.py score --model models/base_pat_02.pth models/best_model.pth
+    python cli.py simulate --data data/data_21.bin --hop 256 1024
+    python cli.py head-export models/best_model.pth --out best.head.npz
+    python cli.py head-apply best.head.npz --out patient.onnx
+
+Heavy backends (torch, sklearn, onnxruntime) are imported inside the
+subcommand that needs them, so e.g. `inspect` only pays for NumPy.
+"""
+import argparse
+import os
+import sys
+import time
+
+
+def cmd_inspect(args):
+    from utils.binfile import (
+        HEADER_SIZE,
+        has_labels,
+        layout_of,
+        read_bin_header,
+        read_bin_labels,
+    )
+
+    for filename in args.files:
+        num_arrays, dim1, dim2, flags = read_bin_header(filename)
+        expected = HEADER_SIZE + num_arrays * dim1 * dim2 * 4
+        if has_labels(flags):
+            expected += num_arrays * 4
+        size = os.path.getsize(filename)
+
+        print(f"{filename}:")
+        print(
+            f"  windows: {num_arrays} x ({dim1}, {dim2}) float32, "
+            f"stored {layout_of(flags)}-major"
+        )
+        print(f"  size: {size} bytes (expected {expected})")
+        if size != expected:
+            print("  WARNING: file size does not match the header")
+        if has_labels(flags):
+            labels = read_bin_labels(filename)
+            n_pos = int((labels == 1).sum())
+            print(
+                f"  labels: {n_pos} positive / {num_arrays - n_pos} negative "
+                f"({100.0 * n_pos / max(num_arrays, 1):.2f}% positive)"
+            )
+        else:
+            print("  labels: none")
+
+
+def cmd_stats(args):
+    from utils.stats import (
+        compute_channel_stats,
+        get_channel_stats,
+        stats_path,
+    )
+
+    for filename in args.files:
+        if args.force:
+            stats = compute_channel_stats(filename, n_workers=args.workers)
+        else:
+            stats = get_channel_stats(filename, n_workers=args.workers)
+        print(f"{filename} -> {stats_path(filename)}")
+        print(
+            f"  {'ch':>3} {'mean':>10} {'std':>10} {'min':>10} {'max':>10}"
+        )
+        for c in range(len(stats["mean"])):
+            print(
+                f"  {c:>3} {stats['mean'][c]:>10.4f} "
+                f"{stats['std'][c]:>10.4f} {stats['min'][c]:>10.4f} "
+                f"{stats['max'][c]:>10.4f}"
+            )
+
+
+def cmd_convert(args):
+    from utils.recording import bin_to_recording
+
+    for filename in args.files:
+        out = os.path.splitext(filename)[0] + ".rec"
+        bin_to_recording(filename, out, hop=args.hop, fs=args.fs)
+
+
+def cmd_synth(args):
+    from utils.synthetic import write_synthetic_bin
+
+    result = write_synthetic_bin(
+        args.out,
+        args.windows,
+        seed=args.seed,
+        seizure_fraction=args.seizure_fraction,
+        artifact_prob=args.artifact_prob,
+        n_workers=args.workers,
+    )
+    print(
+        f"{args.out}: {result['windows']} windows "
+        f"({result['positives']} seizure), "
+        f"{result['bytes'] / 2**30:.2f} GiB in {result['seconds']:.1f} s"
+    )
+
+
+def _load_stats(filename):
+    # Sidecar of the *training* file, reused as is by train/eval/export
+    if not filename:
+        return None
+    from utils.stats import get_channel_stats
+
+    return get_channel_stats(filename)
+
+
+def _has_baked_stats(model_path):
+    # ONNX exports with --normalize z-score their input themselves
+    from utils.artifacts import read_manifest
+
+    manifest = read_manifest(model_path + ".manifest.json") or {}
+    return bool(manifest.get("normalized") or manifest.get("stats_file"))
+
+
+def _preprocess_fn(normalize, model_paths):
+    # `utils.transforms.ZScore` on NumPy batches, None without --normalize
+    stats = _load_stats(normalize)
+    if stats is None:
+        return None
+    for path in model_paths:
+        if _has_baked_stats(path):
+            sys.exit(
+                f"{path} was exported with its normalization baked in, "
+                "drop --normalize"
+            )
+    import torch
+    from utils.transforms import ZScore
+
+    zscore = ZScore.from_stats(stats)
+
+    def preprocess(batch):
+        with torch.no_grad():
+            return zscore(torch.from_numpy(batch)).numpy()
+
+    return preprocess
+
+
+def _start_telemetry(args):
+    if args.metrics_port:
+        from utils.telemetry import start_http_server
+
+        start_http_server(args.metrics_port)
+        print(f"metrics on http://127.0.0.1:{args.metrics_port}/metrics")
+
+
+def _write_telemetry(args):
+    if args.metrics_file:
+        from utils.telemetry import write_textfile
+
+        write_textfile(args.metrics_file)
+
+
+def cmd_eval(args):
+    import numpy as np
+    from utils.binfile import load_arrays_and_labels_memmap, iter_bin_batches
+    from utils.metrics import compute_metrics
+    from utils.streaming import load_score_fn
+    from utils.telemetry import InferenceMetrics
+
+    _start_telemetry(args)
+    preprocess = _preprocess_fn(args.normalize, [args.model])
+    # The score functions record model time, the loop the rest, as in
+    # `utils.streaming.stream_score`
+    score = load_score_fn(args.model)
+    telemetry = InferenceMetrics(score.backend)
+    data, labels = load_arrays_and_labels_memmap(args.data)
+    if labels is None:
+        sys.exit(f"{args.data} has no labels")
+
+    all_preds = []
+    start = loaded = time.perf_counter()
+    for batch, _ in iter_bin_batches(data, None, args.batch_size):
+        telemetry.load_seconds.observe(time.perf_counter() - loaded)
+        if preprocess is not None:
+            batch = preprocess(batch)
+        logits = score(batch)
+        done = time.perf_counter()
+        preds = logits.argmax(axis=1)
+        telemetry.record_predictions(preds)
+        all_preds.append(preds)
+        loaded = time.perf_counter()
+        telemetry.postprocess_seconds.observe(loaded - done)
+    elapsed = time.perf_counter() - start
+
+    metrics = compute_metrics(labels, np.concatenate(all_preds))
+    print(
+        f"F1 = {metrics['f1']:.4f},"
+        f"Precision = {metrics['precision']:.4f}, "
+        f"Recall = {metrics['recall']:.4f}, FPR = {metrics['fpr']:.4f}"
+    )
+    print(f"{len(data) / elapsed:.1f} windows/s")
+    _write_telemetry(args)
+
+
+def cmd_score(args):
+    from utils.streaming import load_score_fn, stream_score
+
+    _start_telemetry(args)
+    preprocess = _preprocess_fn(args.normalize, args.model)
+    if len(args.model) > 1:
+        from utils.ensemble import ensemble_score_fn
+
+        score_fn = ensemble_score_fn(args.model, method=args.combine)
+    else:
+        score_fn = load_score_fn(args.model[0])
+    if args.prefilter:
+        from utils.cascade import PreFilter, cascade_score_fn
+
+        # The pre-filter scores raw windows, only the network normalized ones
+        score_fn = cascade_score_fn(
+            PreFilter.load(args.prefilter), score_fn, preprocess=preprocess
+        )
+        preprocess = None
+    result = stream_score(
+        args.data,
+        score_fn,
+        out_path=args.out,
+        chunk_size=args.chunk_size,
+        preprocess=preprocess,
+    )
+    if "f1" in result:
+        print(
+            f"F1 = {result['f1']:.4f},"
+            f"Precision = {result['precision']:.4f}, "
+            f"Recall = {result['recall']:.4f}, FPR = {result['fpr']:.4f}"
+        )
+    print(
+        f"{result['windows']} windows, {result['windows_per_s']:.1f} "
+        f"windows/s, {result['bytes_read'] / 2**20:.1f} MiB read"
+    )
+    _write_telemetry(args)
+
+
+def cmd_check(args):
+    from utils.consistency import (
+        check_consistency,
+        format_consistency_report,
+        load_backend,
+    )
+
+    score_fns = {}
+    for path in args.models:
+        if not os.path.exists(path):
+            print(f"skipping {path}: not found")
+            continue
+        try:
+            score_fns[path] = load_backend(path)
+        except ImportError as e:
+            print(f"skipping {path}: {e}")
+    if len(score_fns) < 2:
+        sys.exit("need at least two backends to compare")
+
+    results = check_consistency(args.data, score_fns, args.chunk_size)
+    print(format_consistency_report(results))
+
+    failed = [
+        name
+        for name, r in results.items()
+        if name != "wall_clock"
+        and (
+            r["max_rel_diff"] > args.tolerance
+            or r["disagreement"] > args.max_disagreement
+        )
+    ]
+    if failed:
+        sys.exit(f"inconsistent backends: {', '.join(failed)}")
+
+
+def cmd_train(args):
+    import torch
+    from torch.utils.data import DataLoader
+    from utils.dataset import SeizureDataset
+    from utils.models import fcn2_from_state_dict
+    from utils.binfile import load_arrays_and_labels_memmap
+    from utils.tools import file_signature, train
+    from utils.transforms import ZScore
+    from utils.samplers import BalancedBatchSampler, ResumableRandomSampler
+
+    data, labels = load_arrays_and_labels_memmap(args.data)
+    seizure_dataset = SeizureDataset(data=data, labels=labels)
+    n_train = int(0.8 * len(seizure_dataset))
+    seizure_train, seizure_val = torch.utils.data.random_split(
+        seizure_dataset,
+        [n_train, len(seizure_dataset) - n_train],
+        generator=torch.Generator().manual_seed(0),
+    )
+    if args.pos_ratio:
+        train_loader = DataLoader(
+            seizure_train,
+            batch_sampler=BalancedBatchSampler(
+                labels[seizure_train.indices],
+                args.batch_size,
+                pos_ratio=args.pos_ratio,
+            ),
+        )
+    else:
+        train_loader = DataLoader(
+            seizure_train,
+            batch_size=args.batch_size,
+            sampler=ResumableRandomSampler(len(seizure_train)),
+        )
+    val_loader = DataLoader(
+        seizure_val, batch_size=args.batch_size, shuffle=False
+    )
+
+    model = fcn2_from_state_dict(
+        torch.load(args.checkpoint, map_location=torch.device("cpu"))[
+            "state_dict"
+        ]
+    )
+    stats = _load_stats(args.normalize)
+    train(
+        train_loader,
+        val_loader,
+        model,
+        device="cpu",
+        epochs=args.epochs,
+        patience=args.patience,
+        save_path=args.out,
+        transform=ZScore.from_stats(stats) if stats is not None else None,
+        state_path=args.state,
+        checkpoint_every=args.checkpoint_every,
+        run_config={
+            "data": file_signature(args.data),
+            "checkpoint": file_signature(args.checkpoint),
+            "normalize": args.normalize,
+            "batch_size": args.batch_size,
+            "pos_ratio": args.pos_ratio,
+        },
+    )
+
+
+def cmd_export(args):
+    from utils.artifacts import export_onnx_cached, build_training_artifacts
+
+    if args.training_artifacts:
+        build_training_artifacts(
+            args.checkpoint,
+            args.requires_grad,
+            artifact_directory=args.training_artifacts,
+            model_name=os.path.splitext(os.path.basename(args.checkpoint))[0],
+            force=args.force,
+        )
+    else:
+        out = args.out or os.path.splitext(args.checkpoint)[0] + ".onnx"
+        stats_file = None
+        if args.normalize:
+            from utils.stats import stats_path
+
+            _load_stats(args.normalize)
+            stats_file = stats_path(args.normalize)
+        export_onnx_cached(
+            args.checkpoint, out, force=args.force, stats_file=stats_file
+        )
+
+
+def cmd_bench(args):
+    import numpy as np
+    from utils.streaming import load_score_fn
+
+    score = load_score_fn(args.model)
+    batch = np.random.default_rng(0).standard_normal(
+        (args.batch_size, 18, 1024), dtype=np.float32
+    )
+    timings = []
+    for i in range(args.warmup + args.runs):
+        start = time.perf_counter()
+        score(batch).argmax(axis=1)
+        if i >= args.warmup:
+            timings.append(time.perf_counter() - start)
+    per_window = 1000.0 * float(np.median(timings)) / args.batch_size
+    print(
+        f"{args.model}: {per_window:.3f} ms/window "
+        f"(batch {args.batch_size}, median of {args.runs} runs)"
+    )
+
+
+def cmd_simulate(args):
+    import itertools
+
+    from utils.simulator import format_simulation_report, run_simulations
+
+    configs = [
+        {
+            "name": f"h{hop}-b{batch}-t{train:g}",
+            "hop": hop,
+            "batch_size": batch,
+            "train_every_s": train,
+            "buffer_s": args.buffer,
+            "slowdown": args.slowdown,
+            "max_seconds": args.max_seconds,
+            "inference_model": args.model,
+            "training_artifacts": args.training_artifacts,
+        }
+        for hop, batch, train in itertools.product(
+            args.hop, args.batch_size, args.train_every
+        )
+    ]
+    results = run_simulations(args.data, configs)
+    print(format_simulation_report(results))
+
+
+def cmd_head_export(args):
+    from utils.head_delta import export_head_delta, head_state
+
+    out = args.out or os.path.splitext(args.model)[0] + ".head.npz"
+    result = export_head_delta(
+        head_state(args.model), head_state(args.base), out
+    )
+    print(
+        f"{out}: {result['bytes'] / 1024:.1f} KiB, "
+        f"max quantization error {result['max_error']:.2e}"
+    )
+
+
+def cmd_head_apply(args):
+    from utils.head_delta import head_state, load_head_delta, patch_onnx
+
+    head = load_head_delta(args.delta, head_state(args.base))
+    patch_onnx(args.base, head, args.out)
+    print(f"{args.delta} + {args.base} -> {args.out}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="SeizureGuard tooling")
+    sub = parser.add_subparsers(dest="command", required=True)
+    normalize_help = "z-score inputs with the cached stats of this .bin file"
+
+    def add_telemetry_arguments(p):
+        p.add_argument(
+            "--metrics-file",
+            metavar="PATH",
+            help="write Prometheus metrics to PATH when done",
+        )
+        p.add_argument(
+            "--metrics-port",
+            type=int,
+            help="serve Prometheus metrics on this local port meanwhile",
+        )
+
+    p = sub.add_parser("inspect", help="print .bin headers (NumPy only)")
+    p.add_argument("files", nargs="+")
+    p.set_defaults(func=cmd_inspect)
+
+    p = sub.add_parser("convert", help=".bin windows to a continuous .rec")
+    p.add_argument("files", nargs="+")
+    p.add_argument(
+        "--hop",
+        type=int,
+        default=None,
+        help="step between the stored windows (default: window length)",
+    )
+    p.add_argument("--fs", type=int, default=256)
+    p.set_defaults(func=cmd_convert)
+
+    p = sub.add_parser("synth", help="write a synthetic labelled .bin file")
+    p.add_argument("out")
+    p.add_argument("--windows", type=int, default=10000)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--seizure-fraction", type=float, default=0.1)
+    p.add_argument("--artifact-prob", type=float, default=0.05)
+    p.add_argument("--workers", type=int, default=None)
+    p.set_defaults(func=cmd_synth)
+
+    p = sub.add_parser("eval", help="evaluate a .pth or .onnx model")
+    p.add_argument("--data", default="data/data_21.bin")
+    p.add_argument("--model", default="models/base_pat_02.pth")
+    p.add_argument("--batch-size", type=int, default=32)
+    p.add_argument("--normalize", metavar="BIN", help=normalize_help)
+    add_telemetry_arguments(p)
+    p.set_defaults(func=cmd_eval)
+
+    p = sub.add_parser("score", help="stream a .bin file through a model")
+    p.add_argument("--data", default="data/data_21.bin")
+    p.add_argument(
+        "--model",
+        nargs="+",
+        default=["models/base_pat_02.pth"],
+        help="several .pth checkpoints are run as one stacked ensemble",
+    )
+    p.add_argument(
+        "--combine",
+        choices=["mean", "vote"],
+        default="mean",
+        help="ensemble: average probabilities or majority vote",
+    )
+    p.add_argument(
+        "--prefilter",
+        metavar="NPZ",
+        help="skip the model on windows this pre-filter declares negative",
+    )
+    p.add_argument("--out", help="CSV of per-window predictions")
+    p.add_argument("--chunk-size", type=int, default=256)
+    p.add_argument("--normalize", metavar="BIN", help=normalize_help)
+    add_telemetry_arguments(p)
+    p.set_defaults(func=cmd_score)
+
+    p = sub.add_parser("check", help="compare backends on one data pass")
+    p.add_argument("--data", default="data/data_21.bin")
+    p.add_argument(
+        "models",
+        nargs="*",
+        default=[
+            "models/base_pat_02.pth",
+            "models/base_pat_02.onnx",
+            "inference_artifacts/inference.onnx",
+            "training_artifacts",
+        ],
+        help=".pth, .onnx or ORT training artifact directory; the first "
+        "one is the reference",
+    )
+    p.add_argument("--chunk-size", type=int, default=256)
+    p.add_argument(
+        "--tolerance",
+        type=float,
+        default=1e-3,
+        help="largest accepted logit deviation, relative to the largest "
+        "reference logit of the window",
+    )
+    p.add_argument(
+        "--max-disagreement",
+        type=float,
+        default=0.0,
+        help="largest accepted share of differing predictions",
+    )
+    p.set_defaults(func=cmd_check)
+
+    p = sub.add_parser("train", help="fine-tune FCN2 on a .bin file")
+    p.add_argument("--data", default="data/data_20.bin")
+    p.add_argument("--checkpoint", default="models/base_pat_02.pth")
+    p.add_argument("--out", default="models/best_model.pth")
+    p.add_argument("--epochs", type=int, default=20)
+    p.add_argument("--patience", type=int, default=7)
+    p.add_argument("--batch-size", type=int, default=32)
+    p.add_argument("--normalize", metavar="BIN", help=normalize_help)
+    p.add_argument(
+        "--pos-ratio",
+        type=float,
+        default=0.25,
+        help="share of seizure windows per batch (0: plain shuffling)",
+    )
+    p.add_argument(
+        "--state",
+        metavar="PATH",
+        help="resumable training state (continued from if it exists)",
+    )
+    p.add_argument(
+        "--checkpoint-every",
+        type=int,
+        default=100,
+        help="batches between two --state checkpoints",
+    )
+    p.set_defaults(func=cmd_train)
+
+    p = sub.add_parser("export", help="cached ONNX / ORT artifact export")
+    p.add_argument("--checkpoint", default="models/base_pat_02.pth")
+    p.add_argument("--out", help="ONNX path (default: next to checkpoint)")
+    p.add_argument(
+        "--training-artifacts",
+        metavar="DIR",
+        help="generate ORT training artifacts into DIR instead",
+    )
+    p.add_argument(
+        "--requires-grad",
+        nargs="+",
+        default=[
+            "classifier.0.weight",
+            "classifier.0.bias",
+            "classifier.1.weight",
+            "classifier.1.bias",
+        ],
+    )
+    p.add_argument("--normalize", metavar="BIN", help=normalize_help)
+    p.add_argument("--force", action="store_true")
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser("bench", help="per-window latency of a model")
+    p.add_argument("--model", default="models/base_pat_02.pth")
+    p.add_argument("--batch-size", type=int, default=1)
+    p.add_argument("--runs", type=int, default=50)
+    p.add_argument("--warmup", type=int, default=10)
+    p.set_defaults(func=cmd_bench)
+
+    p = sub.add_parser(
+        "simulate", help="replay a .bin file through the phone pipeline"
+    )
+    p.add_argument("--data", default="data/data_21.bin")
+    p.add_argument("--model", default="inference_artifacts/inference.onnx")
+    p.add_argument("--training-artifacts", default="training_artifacts")
+    p.add_argument("--hop", type=int, nargs="+", default=[256])
+    p.add_argument("--batch-size", type=int, nargs="+", default=[1])
+    p.add_argument(
+        "--train-every",
+        type=float,
+        nargs="+",
+        default=[0.0],
+        help="seconds between two fine-tuning rounds (0: never)",
+    )
+    p.add_argument("--buffer", type=float, default=30.0, help="seconds")
+    p.add_argument(
+        "--slowdown",
+        type=float,
+        default=1.0,
+        help="device seconds per host second of compute",
+    )
+    p.add_argument("--max-seconds", type=float, default=None)
+    p.set_defaults(func=cmd_simulate)
+
+    p = sub.add_parser(
+        "head-export", help="classifier head as a compact delta to a base"
+    )
+    p.add_argument("model", help="fine-tuned .pth or .onnx model")
+    p.add_argument("--base", default="models/base_pat_02.pth")
+    p.add_argument("--out", help="default: <model>.head.npz")
+    p.set_defaults(func=cmd_head_export)
+
+    p = sub.add_parser(
+        "head-apply", help="patch a head delta into the base ONNX model"
+    )
+    p.add_argument("delta")
+    p.add_argument("--base", default="models/base_pat_02.onnx")
+    p.add_argument("--out", required=True)
+    p.set_defaults(func=cmd_head_apply)
+
+    p = sub.add_parser("stats", help="per-channel stats sidecar of .bin")
+    p.add_argument("files", nargs="+")
+    p.add_argument("--workers", type=int, default=None)
+    p.add_argument("--force", action="store_true", help="ignore the cache")
+    p.set_defaults(func=cmd_stats)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
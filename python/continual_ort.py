@@ -0,0 +1,87 @@
+# %%
+# %load_ext autoreload
+# %autoreload 2
+# %%
+import os
+
+import numpy as np
+
+from utils.artifacts import build_training_artifacts, load_checkpoint_model
+from utils.binfile import iter_bin_batches, load_arrays_and_labels_memmap
+from utils.ort_training import OrtTrainer
+from utils.replay import ReplayBuffer, feature_fn
+
+
+# %%
+def main():
+    checkpoint_path = "models/base_pat_02.pth"
+    artifact_dir = "training_artifacts_head"
+    buffer_path = os.path.join(artifact_dir, "replay_buffer.npz")
+    state_path = os.path.join(artifact_dir, "continual_checkpoint")
+    capacity = 2048  # items kept across all sessions
+    session_windows = 256  # new labelled windows per personalization round
+    batch_size = 32
+    steps_per_round = 20  # same cost every round
+
+    # The backbone is frozen on the device: store its features and train
+    # the classifier head alone on them
+    build_training_artifacts(
+        checkpoint_path,
+        [
+            "classifier.0.weight",
+            "classifier.0.bias",
+            "classifier.1.weight",
+            "classifier.1.bias",
+        ],
+        artifact_directory=artifact_dir,
+        additional_output_names=["output"],
+        head_only=True,
+    )
+    features = feature_fn(load_checkpoint_model(checkpoint_path))
+
+    trainer = OrtTrainer(
+        artifact_dir,
+        checkpoint_path=state_path if os.path.exists(state_path) else None,
+    )
+    if os.path.exists(buffer_path):
+        buffer = ReplayBuffer.load(buffer_path)
+    else:
+        shape = features(np.zeros((1, 18, 1024), np.float32)).shape[1:]
+        buffer = ReplayBuffer(capacity, shape)
+    print(
+        f"Replay buffer: {buffer.capacity} items, "
+        f"{buffer.nbytes / 2**20:.1f} MiB"
+    )
+
+    data, labels = load_arrays_and_labels_memmap("data/data_20.bin")
+    test_data, test_labels = load_arrays_and_labels_memmap("data/data_21.bin")
+    test_features = features(test_data)
+
+    # Every chunk of the recording stands for the events of one session;
+    # after a restart, the windows already in the buffer's history are skipped
+    first = sum(buffer.seen.values())
+    for start in range(first, len(data), session_windows):
+        session = start // session_windows
+        stop = start + session_windows
+        buffer.add(features(data[start:stop]), labels[start:stop])
+        stats = trainer.train_epoch(
+            buffer.batches(batch_size, steps_per_round),
+            checkpoint_path=state_path,
+        )
+        buffer.save(buffer_path)
+        metrics = trainer.evaluate(
+            iter_bin_batches(test_features, test_labels, batch_size)
+        )
+        print(
+            f"Session {session + 1}: {len(buffer)} items "
+            f"({buffer.count(1)} seizure), Loss = {stats['loss']:.6f}, "
+            f"F1 = {metrics.get('f1', float('nan')):.4f}, "
+            f"Recall = {metrics.get('recall', float('nan')):.4f}, "
+            f"FPR = {metrics.get('fpr', float('nan')):.4f}"
+        )
+
+
+# %%
+if __name__ == "__main__":
+    main()
+# %%
@@ -0,0 +1,43 @@
+# %%
+# %load_ext autoreload
+# %autoreload 2
+# %%
+import time
+from utils.cv import (
+    recording_folds,
+    time_block_folds,
+    run_cross_validation,
+    format_cv_report,
+)
+
+
+# %%
+def main():
+    files = ["data/data_20.bin", "data/data_21.bin"]
+    config = {
+        "checkpoint": "models/base_pat_02.pth",
+        "epochs": 20,
+        "patience": 5,
+        "batch_size": 32,
+        "pos_ratio": 0.25,
+        "val_fraction": 0.1,
+        "output_dir": "models/cv",
+    }
+
+    # Split by recording when there are several, otherwise by contiguous
+    # blocks of time within the single recording
+    if len(files) > 1:
+        folds = recording_folds(files)
+    else:
+        folds = time_block_folds(files[0], k=5, gap=1)
+
+    start = time.perf_counter()
+    results = run_cross_validation(folds, config, threads_per_worker=2)
+    print(format_cv_report(results))
+    print(f"Wall-clock: {time.perf_counter() - start:.1f} s")
+
+
+# %%
+if __name__ == "__main__":
+    main()
+# %%
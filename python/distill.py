@@ -0,0 +1,111 @@
+# %%
+# %load_ext autoreload
+# %autoreload 2
+# %%
+import torch
+import os
+from utils.models import FCN2 as Net, TinyFCN
+from utils.tools import (
+    validate,
+    load_arrays_and_labels_from_bin,
+    cache_teacher_logits,
+    distill,
+    export_onnx,
+)
+from utils.dataset import SeizureDataset, DistillationDataset
+from utils.pruning import count_parameters, measure_latency
+from torch.utils.data import DataLoader
+
+
+# %%
+def main():
+    device = "cpu"
+    checkpoint_dir = "models/"
+    n_filters = 32
+    n_hidden = 32
+
+    data_file = "data/data_20.bin"
+    data, labels = load_arrays_and_labels_from_bin(data_file)
+
+    # Teacher logits are computed once per data file and teacher checkpoint
+    # and reused afterwards
+    teacher_path = os.path.join(checkpoint_dir, "base_pat_02.pth")
+    teacher = Net(in_channels=18)
+    teacher.load_state_dict(
+        torch.load(teacher_path, map_location=torch.device("cpu"))[
+            "state_dict"
+        ]
+    )
+    teacher.to(device)
+    teacher_logits = cache_teacher_logits(
+        teacher,
+        SeizureDataset(data=data, labels=labels),
+        "cache/data_20.base_pat_02.logits.npy",
+        device=device,
+        teacher_path=teacher_path,
+        data_file=data_file,
+    )
+    del teacher
+
+    seizure_dataset = DistillationDataset(
+        data=data, labels=labels, teacher_logits=teacher_logits
+    )
+    n_train = int(0.8 * len(seizure_dataset))
+    seizure_train, seizure_val = torch.utils.data.random_split(
+        seizure_dataset, [n_train, len(seizure_dataset) - n_train]
+    )
+    train_loader = DataLoader(seizure_train, batch_size=32, shuffle=True)
+    # validate() expects plain (data, target) batches
+    val_loader = DataLoader(
+        torch.utils.data.Subset(
+            SeizureDataset(data=data, labels=labels), seizure_val.indices
+        ),
+        batch_size=32,
+        shuffle=False,
+    )
+
+    student = TinyFCN(in_channels=18, n_filters=n_filters, n_hidden=n_hidden)
+    student.to(device)
+    student_path = os.path.join(checkpoint_dir, "student.pth")
+    distill(
+        train_loader,
+        val_loader,
+        student,
+        device=device,
+        epochs=30,
+        patience=7,
+        save_path=student_path,
+    )
+
+    print(f"Testing the student")
+    test_file = "data/data_21.bin"
+    data, labels = load_arrays_and_labels_from_bin(test_file)
+    test_loader = DataLoader(
+        SeizureDataset(data=data, labels=labels), batch_size=32, shuffle=False
+    )
+
+    student.load_state_dict(
+        torch.load(student_path, map_location=torch.device("cpu"))[
+            "state_dict"
+        ]
+    )
+    f1_score, metrics = validate(test_loader, student, device=device)
+    print(
+        f"F1 = {f1_score:.4f},"
+        f"Precision = {metrics['precision']:.4f}, "
+        f"Recall = {metrics['recall']:.4f}, FPR = {metrics['fpr']:.4f}"
+    )
+    print(
+        f"Student: {count_parameters(student)} parameters, "
+        f"{measure_latency(student):.3f} ms/window"
+    )
+
+    student.eval()
+    export_onnx(student, os.path.join(checkpoint_dir, "student.onnx"))
+    print("onnx model exported.")
+
+
+# %%
+if __name__ == "__main__":
+    main()
+# %%
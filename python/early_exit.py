@@ -0,0 +1,85 @@
+# %%
+# %load_ext autoreload
+# %autoreload 2
+# %%
+import os
+import torch
+from torch.utils.data import DataLoader
+from utils.dataset import SeizureDataset
+from utils.early_exit import (
+    EarlyExitLoss,
+    calibrate_exits,
+    evaluate_early_exit,
+    export_early_exit_onnx,
+    format_early_exit_report,
+)
+from utils.models import EarlyExitFCN2
+from utils.registry import MODELS
+from utils.samplers import BalancedBatchSampler
+from utils.tools import (
+    load_arrays_and_labels_from_bin,
+    save_checkpoint,
+    train,
+)
+
+
+# %%
+def main():
+    device = "cpu"
+    checkpoint_dir = "models/"
+    save_path = os.path.join(checkpoint_dir, "early_exit.pth")
+    target_recall = 0.99
+
+    data_file = "data/data_20.bin"
+    data, labels = load_arrays_and_labels_from_bin(data_file)
+    seizure_dataset = SeizureDataset(data=data, labels=labels)
+    n_train = int(0.8 * len(seizure_dataset))
+    seizure_train, seizure_val = torch.utils.data.random_split(
+        seizure_dataset,
+        [n_train, len(seizure_dataset) - n_train],
+        generator=torch.Generator().manual_seed(0),
+    )
+    train_sampler = BalancedBatchSampler.from_bin(
+        data_file, batch_size=32, indices=seizure_train.indices, pos_ratio=0.25
+    )
+    train_loader = DataLoader(seizure_train, batch_sampler=train_sampler)
+    val_loader = DataLoader(seizure_val, batch_size=32, shuffle=False)
+
+    # Start from the trained FCN2; the exits are new and trained jointly
+    # with the rest of the network
+    base_path = os.path.join(checkpoint_dir, "base_pat_02.pth")
+    model = EarlyExitFCN2.from_fcn2(MODELS.get(base_path))
+    model.to(device)
+    train(
+        train_loader,
+        val_loader,
+        model,
+        device=device,
+        epochs=10,
+        patience=3,
+        save_path=save_path,
+        criterion=EarlyExitLoss(),
+    )
+    model.load_state_dict(
+        torch.load(save_path, map_location=torch.device("cpu"))["state_dict"]
+    )
+
+    # Thresholds on the validation windows, saved with the weights
+    val_idx = seizure_val.indices
+    thresholds = calibrate_exits(
+        model, data[val_idx], labels[val_idx], target_recall
+    )
+    save_checkpoint(save_path, {"state_dict": model.state_dict()})
+    print(f"exit thresholds: {thresholds}, saved to {save_path}")
+
+    result = evaluate_early_exit("data/data_21.bin", model)
+    print(format_early_exit_report(result, target_recall))
+
+    paths = export_early_exit_onnx(model, "inference_artifacts/early_exit")
+    print(f"ONNX stages: {', '.join(paths)}")
+
+
+# %%
+if __name__ == "__main__":
+    main()
+# %%
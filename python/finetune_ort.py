@@ -0,0 +1,68 @@
+# %%
+# %load_ext autoreload
+# %autoreload 2
+# %%
+import os
+from utils.artifacts import build_training_artifacts
+from utils.ort_training import OrtTrainer
+from utils.binfile import load_arrays_and_labels_memmap, iter_bin_batches
+
+
+# %%
+def main():
+    checkpoint_dir = "models/"
+    artifact_dir = "training_artifacts_sim"
+    batch_size = 32
+    epochs = 5
+
+    # Same trainable head as the app, plus the logits as an extra output so
+    # the eval graph can report F1/recall/FPR
+    build_training_artifacts(
+        os.path.join(checkpoint_dir, "base_pat_02.pth"),
+        [
+            "classifier.0.weight",
+            "classifier.0.bias",
+            "classifier.1.weight",
+            "classifier.1.bias",
+        ],
+        artifact_directory=artifact_dir,
+        additional_output_names=["output"],
+    )
+
+    state_path = os.path.join(artifact_dir, "finetuned_checkpoint")
+    trainer = OrtTrainer(
+        artifact_dir,
+        checkpoint_path=state_path if os.path.exists(state_path) else None,
+    )
+
+    data_file = "data/data_20.bin"
+    data, labels = load_arrays_and_labels_memmap(data_file)
+    test_file = "data/data_21.bin"
+    test_data, test_labels = load_arrays_and_labels_memmap(test_file)
+
+    print(f"Fine-tuning on {data_file}")
+    for epoch in range(trainer.epoch, epochs):
+        # Seeded by the epoch, so a resumed epoch replays the same batches
+        stats = trainer.train_epoch(
+            iter_bin_batches(
+                data, labels, batch_size, shuffle=True, seed=epoch
+            ),
+            checkpoint_path=state_path,
+            checkpoint_every=100,
+        )
+        metrics = trainer.evaluate(
+            iter_bin_batches(test_data, test_labels, batch_size)
+        )
+        print(
+            f"Epoch {epoch+1}: Loss = {stats['loss']:.6f}, "
+            f"{stats['windows_per_s']:.1f} windows/s, "
+            f"F1 = {metrics.get('f1', float('nan')):.4f}, "
+            f"Recall = {metrics.get('recall', float('nan')):.4f}, "
+            f"FPR = {metrics.get('fpr', float('nan')):.4f}"
+        )
+
+
+# %%
+if __name__ == "__main__":
+    main()
+# %%
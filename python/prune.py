@@ -0,0 +1,96 @@
+# %%
+# %load_ext autoreload
+# %autoreload 2
+# %%
+import torch
+import os
+from utils.models import FCN2 as Net, fcn2_from_state_dict
+from utils.tools import validate, load_arrays_and_labels_from_bin, train
+from utils.dataset import SeizureDataset
+from utils.pruning import (
+    prune_fcn2,
+    count_parameters,
+    count_macs,
+    measure_latency,
+    format_report,
+)
+from torch.utils.data import DataLoader
+
+
+# %%
+def main():
+    device = "cpu"
+    checkpoint_dir = "models/"
+    widths = [128, 96, 64, 32, 16]
+    epochs = 10
+
+    data_file = "data/data_20.bin"
+    data, labels = load_arrays_and_labels_from_bin(data_file)
+    seizure_dataset = SeizureDataset(data=data, labels=labels)
+    seizure_train, seizure_val = torch.utils.data.random_split(
+        seizure_dataset,
+        [
+            int(0.8 * len(seizure_dataset)),
+            len(seizure_dataset) - int(0.8 * len(seizure_dataset)),
+        ],
+    )
+    train_loader = DataLoader(seizure_train, batch_size=32, shuffle=True)
+    val_loader = DataLoader(seizure_val, batch_size=32, shuffle=False)
+
+    test_file = "data/data_21.bin"
+    data, labels = load_arrays_and_labels_from_bin(test_file)
+    test_loader = DataLoader(
+        SeizureDataset(data=data, labels=labels), batch_size=32, shuffle=False
+    )
+
+    model_path = os.path.join(checkpoint_dir, "base_pat_02.pth")
+    base = Net(in_channels=18)
+    base.load_state_dict(
+        torch.load(model_path, map_location=torch.device("cpu"))["state_dict"]
+    )
+
+    rows = []
+    for n_filters in widths:
+        print(f"Pruning to {n_filters} filters")
+        model = prune_fcn2(base, n_filters)
+        model.to(device)
+        save_path = os.path.join(checkpoint_dir, f"pruned_{n_filters}.pth")
+
+        # Fine-tune the pruned model, then reload its best checkpoint
+        train(
+            train_loader,
+            val_loader,
+            model,
+            device=device,
+            epochs=epochs,
+            patience=5,
+            save_path=save_path,
+        )
+        if os.path.exists(save_path):
+            model = fcn2_from_state_dict(
+                torch.load(save_path, map_location=torch.device("cpu"))[
+                    "state_dict"
+                ]
+            )
+
+        f1_score, metrics = validate(test_loader, model, device=device)
+        rows.append(
+            {
+                "n_filters": n_filters,
+                "n_hidden": model.classifier[0].out_channels,
+                "params": count_parameters(model),
+                "macs": count_macs(model),
+                "latency_ms": measure_latency(model),
+                "f1": f1_score,
+                "recall": metrics["recall"],
+                "fpr": metrics["fpr"],
+            }
+        )
+
+    print(format_report(rows))
+
+
+# %%
+if __name__ == "__main__":
+    main()
+# %%
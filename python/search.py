@@ -0,0 +1,35 @@
+# %%
+# %load_ext autoreload
+# %autoreload 2
+# %%
+import time
+from utils.search import (
+    DEFAULT_SPACE,
+    sample_configs,
+    run_search,
+    format_search_report,
+)
+
+
+# %%
+def main():
+    settings = {
+        "data_file": "data/data_20.bin",
+        "checkpoint": "models/base_pat_02.pth",
+        "epochs": 20,
+        "patience": 5,
+        "val_fraction": 0.2,
+        "cache_dir": "cache",
+        "output_dir": "models/search",
+    }
+    configs = sample_configs(DEFAULT_SPACE, n_trials=16, seed=0)
+
+    start = time.perf_counter()
+    results = run_search(configs, settings, threads_per_worker=2)
+    print(format_search_report(results, time.perf_counter() - start))
+
+
+# %%
+if __name__ == "__main__":
+    main()
+# %%
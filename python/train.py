@@ -5,8 +5,15 @@
 import torch
 import os
 from utils.models import FCN2 as Net
-from utils.tools import validate, load_arrays_and_labels_from_bin, train
+from utils.tools import (
+    validate,
+    load_arrays_and_labels_from_bin,
+    train,
+    file_signature,
+)
 from utils.dataset import SeizureDataset
+from utils.samplers import BalancedBatchSampler
+from utils.registry import MODELS
 from torch.utils.data import DataLoader
 
 
@@ -28,24 +35,46 @@ def main():
             int(0.8 * len(seizure_dataset)),
             len(seizure_dataset) - int(0.8 * len(seizure_dataset)),
         ],
+        # Fixed split, so that a resumed run trains on the same windows
+        generator=torch.Generator().manual_seed(0),
     )
 
-    train_loader = DataLoader(seizure_train, batch_size=32, shuffle=True)
+    # Oversample the rare seizure windows so every batch contains positives
+    train_sampler = BalancedBatchSampler.from_bin(
+        data_file, batch_size=32, indices=seizure_train.indices, pos_ratio=0.25
+    )
+    train_loader = DataLoader(seizure_train, batch_sampler=train_sampler)
     val_loader = DataLoader(seizure_val, batch_size=32, shuffle=False)
 
     model_path = os.path.join(checkpoint_dir, "base_pat_02.pth")
     model = Net(in_channels=18)
     model.to(device)
-    model.load_state_dict(
-        torch.load(model_path, map_location=torch.device("cpu"))["state_dict"]
-    )
+    # Copied out of the memory-mapped checkpoint: this model gets trained
+    model.load_state_dict(MODELS.state_dict(model_path))
 
     # # Training the model
+    # Restarting the script after an interruption resumes from the state
     train(
-        train_loader, val_loader, model, device=device, epochs=20, patience=7
+        train_loader,
+        val_loader,
+        model,
+        device=device,
+        epochs=20,
+        patience=7,
+        state_path=os.path.join(checkpoint_dir, "train_state.pth"),
+        checkpoint_every=50,
+        # A state saved for other data or settings is not resumed
+        run_config={
+            "data": file_signature(data_file),
+            "checkpoint": file_signature(model_path),
+            "batch_size": 32,
+            "pos_ratio": 0.25,
+        },
     )
 
     print(f"Testing the model")
+    # Both checkpoints load in the background while the test set is read
+    MODELS.prewarm([model_path, "models/best_model.pth"])
     test_file = "data/data_21.bin"
     data, labels = load_arrays_and_labels_from_bin(test_file)
 
@@ -54,14 +83,9 @@ def main():
     test_loader = DataLoader(seizure_dataset, batch_size=32, shuffle=False)
 
     # Loading the best model
-    model.load_state_dict(
-        torch.load("models/base_pat_02.pth", map_location=torch.device("cpu"))[
-            "state_dict"
-        ]
-    )
     f1_score, metrics = validate(
         test_loader,
-        model,
+        MODELS.get(model_path),
         device=device,
     )
 
@@ -71,14 +95,9 @@ def main():
         f"Recall = {metrics['recall']:.4f}, FPR = {metrics['fpr']:.4f}"
     )
 
-    model.load_state_dict(
-        torch.load("models/best_model.pth", map_location=torch.device("cpu"))[
-            "state_dict"
-        ]
-    )
     f1_score, metrics = validate(
         test_loader,
-        model,
+        MODELS.get("models/best_model.pth"),
         device=device,
     )
 
@@ -0,0 +1,253 @@
+import hashlib
+import inspect
+import json
+import os
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+import utils.models
+from utils.models import FCN2Head, fcn2_from_state_dict
+from utils.hashing import sha256_file  # noqa: F401  (re-exported)
+from utils.tools import export_onnx
+from utils.transforms import ZScore
+
+
+MANIFEST_NAME = "manifest.json"
+
+
+def artifact_hash(checkpoint_path, **options):
+    """
+    Hash everything an exported artifact depends on: the checkpoint bytes,
+    the model code in utils/models.py, the export code (this module and
+    `tools.export_onnx`) and the export options (e.g. the `requires_grad`
+    list).
+    """
+    digest = hashlib.sha256()
+    digest.update(sha256_file(checkpoint_path).encode())
+    digest.update(sha256_file(utils.models.__file__).encode())
+    digest.update(sha256_file(__file__).encode())
+    digest.update(inspect.getsource(export_onnx).encode())
+    digest.update(json.dumps(options, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def read_manifest(manifest_path):
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def write_manifest(manifest_path, manifest):
+    # Write to a temporary file first so an interrupted build never leaves
+    # a manifest that claims a cache hit
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def output_files(paths):
+    """
+    `paths` plus the external data files (`<model>.onnx.data`) the ONNX
+    exporter wrote next to them.
+    """
+    return list(paths) + [
+        path + ".data" for path in paths if os.path.exists(path + ".data")
+    ]
+
+
+def is_cache_hit(manifest, digest, files):
+    """
+    A build is up to date when the manifest hash matches and every output
+    file it records, including `files`, is still on disk with the SHA-256
+    it had when the build finished (a truncated or edited file is a miss).
+    """
+    if manifest is None or manifest.get("hash") != digest:
+        return False
+    recorded = manifest.get("files", {})
+    if not set(files) <= set(recorded):
+        return False
+    return all(
+        os.path.exists(path) and sha256_file(path) == sha256
+        for path, sha256 in recorded.items()
+    )
+
+
+def load_checkpoint_model(checkpoint_path):
+    """
+    FCN2 of a checkpoint in eval mode, with the widths it was saved with
+    (e.g. pruned by `utils.pruning`).
+    """
+    model = fcn2_from_state_dict(
+        torch.load(checkpoint_path, map_location=torch.device("cpu"))[
+            "state_dict"
+        ]
+    )
+    model.eval()
+    return model
+
+
+def export_onnx_cached(
+    checkpoint_path,
+    onnx_model_path,
+    opset_version=11,
+    force=False,
+    stats_file=None,
+):
+    """
+    Export the FCN2 checkpoint to ONNX unless an identical export already
+    exists. A `<onnx_model_path>.manifest.json` records the inputs hash.
+
+    If `stats_file` (a `.stats.npz` sidecar, see `utils.stats`) is given,
+    per-channel z-scoring with those statistics is baked into the graph.
+
+    Returns:
+        bool: True if the model was (re)exported, False on a cache hit.
+    """
+    manifest_path = onnx_model_path + ".manifest.json"
+    digest = artifact_hash(
+        checkpoint_path,
+        opset_version=opset_version,
+        stats=sha256_file(stats_file) if stats_file else None,
+    )
+    if not force and is_cache_hit(
+        read_manifest(manifest_path), digest, [onnx_model_path]
+    ):
+        print(f"{onnx_model_path} is up to date, skipping export")
+        return False
+
+    model = load_checkpoint_model(checkpoint_path)
+    in_shape = (model.conv1.in_channels, 1024)
+    if stats_file:
+        with np.load(stats_file) as stats:
+            model = nn.Sequential(ZScore.from_stats(stats), model).eval()
+    export_onnx(
+        model, onnx_model_path, in_shape=in_shape, opset_version=opset_version
+    )
+    write_manifest(
+        manifest_path,
+        {
+            "hash": digest,
+            "checkpoint": checkpoint_path,
+            "stats_file": stats_file,
+            # Input z-scoring is part of the graph
+            "normalized": bool(stats_file),
+            "opset_version": opset_version,
+            "files": {
+                path: sha256_file(path)
+                for path in output_files([onnx_model_path])
+            },
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+    )
+    return True
+
+
+def build_training_artifacts(
+    checkpoint_path,
+    requires_grad,
+    artifact_directory="training_artifacts",
+    model_name="base_pat_02",
+    additional_output_names=None,
+    opset_version=17,
+    force=False,
+    head_only=False,
+):
+    """
+    Export the checkpoint to ONNX and generate the ORT on-device training
+    artifacts, skipping both steps when the checkpoint, the model code and
+    the `requires_grad` list are unchanged since the last build.
+
+    Args:
+        checkpoint_path (str): Path to the FCN2 .pth checkpoint.
+        requires_grad (list): Names of the trainable ONNX initializers.
+        artifact_directory (str): Output directory, also holds the manifest.
+        model_name (str): Basename of the exported ONNX model.
+        additional_output_names (list, optional): Extra graph outputs (e.g.
+                                                  ["output"]) to expose from
+                                                  the training/eval models.
+        opset_version (int): ONNX opset of the exported model.
+        force (bool): Rebuild even on a cache hit.
+        head_only (bool): Export only the classifier (`FCN2Head`), trained
+                          on cached `get_features` outputs instead of raw
+                          windows.
+
+    Returns:
+        bool: True if the artifacts were (re)built, False on a cache hit.
+    """
+    onnx_model_path = os.path.join(artifact_directory, f"{model_name}.onnx")
+    outputs = [onnx_model_path] + [
+        os.path.join(artifact_directory, name)
+        for name in (
+            "training_model.onnx",
+            "eval_model.onnx",
+            "optimizer_model.onnx",
+            "checkpoint",
+        )
+    ]
+    manifest_path = os.path.join(artifact_directory, MANIFEST_NAME)
+    digest = artifact_hash(
+        checkpoint_path,
+        requires_grad=sorted(requires_grad),
+        additional_output_names=additional_output_names,
+        opset_version=opset_version,
+        # Only hashed when set, so existing builds stay cache hits
+        **({"head_only": True} if head_only else {}),
+    )
+    if not force and is_cache_hit(
+        read_manifest(manifest_path), digest, outputs
+    ):
+        print(f"{artifact_directory} is up to date, skipping generation")
+        return False
+
+    # Only needed on a cache miss, and slow to import
+    import onnx
+    from onnxruntime.training import artifacts
+
+    os.makedirs(artifact_directory, exist_ok=True)
+    model = load_checkpoint_model(checkpoint_path)
+    in_shape = (model.conv1.in_channels, 1024)
+    if head_only:
+        in_shape = tuple(model.get_features(torch.zeros(1, *in_shape)).shape)
+        in_shape = in_shape[1:]
+        model = FCN2Head(model).eval()
+    export_onnx(
+        model, onnx_model_path, in_shape=in_shape, opset_version=opset_version
+    )
+
+    onnx_model = onnx.load(onnx_model_path)
+    frozen_params = [
+        param.name
+        for param in onnx_model.graph.initializer
+        if param.name not in requires_grad
+    ]
+    artifacts.generate_artifacts(
+        onnx_model,
+        requires_grad=requires_grad,
+        frozen_params=frozen_params,
+        loss=artifacts.LossType.CrossEntropyLoss,
+        optimizer=artifacts.OptimType.AdamW,
+        artifact_directory=artifact_directory,
+        additional_output_names=additional_output_names,
+    )
+
+    write_manifest(
+        manifest_path,
+        {
+            "hash": digest,
+            "checkpoint": checkpoint_path,
+            "requires_grad": list(requires_grad),
+            "additional_output_names": additional_output_names,
+            "head_only": head_only,
+            "files": {
+                path: sha256_file(path) for path in output_files(outputs)
+            },
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+    )
+    print(f"Training artifacts written to {artifact_directory}")
+    return True
@@ -0,0 +1,384 @@
+import os
+
+import numpy as np
+
+
+HEADER_SIZE = 16  # 4 x int32
+
+# The 4th header field holds flags: bit 0 is set when labels follow the
+# data, bits 8-15 give the layout of every stored array. Files written
+# before the layout existed have flags 0 or 1, i.e. channel-major.
+LABELS_FLAG = 0x1
+LAYOUT_SHIFT = 8
+CHANNEL_MAJOR = 0  # (num_arrays, dim1, dim2): windows as FCN2 reads them
+TIME_MAJOR = 1  # (num_arrays, dim2, dim1): one dim1-channel sample at a time
+LAYOUTS = {"channel": CHANNEL_MAJOR, "time": TIME_MAJOR}
+
+
+def make_flags(labels_present, layout="channel"):
+    return (LABELS_FLAG if labels_present else 0) | (
+        LAYOUTS[layout] << LAYOUT_SHIFT
+    )
+
+
+def has_labels(flags):
+    return bool(flags & LABELS_FLAG)
+
+
+def layout_of(flags):
+    """
+    Layout name ("channel" or "time") of the header flags.
+    """
+    code = (flags >> LAYOUT_SHIFT) & 0xFF
+    for name, value in LAYOUTS.items():
+        if value == code:
+            return name
+    raise ValueError(f"Unknown array layout {code} in header.")
+
+
+def stored_shape(dim1, dim2, layout):
+    # Shape of one array as stored; dim1, dim2 are always (channels, time)
+    return (dim1, dim2) if layout == "channel" else (dim2, dim1)
+
+
+def transpose_windows(src, out=None, chunk_size=64):
+    """
+    (n, a, b) -> (n, b, a) copy, `chunk_size` arrays at a time.
+
+    Every chunk is read and written sequentially (e.g. from a memmap) and
+    each (a, b) array fits in the CPU cache on its own, so the transpose
+    of an array never goes back to main memory. Tiling inside an array
+    was measured slower for 18 x 1024 windows.
+    """
+    n, a, b = src.shape
+    if out is None:
+        out = np.empty((n, b, a), dtype=src.dtype)
+    for start in range(0, n, chunk_size):
+        chunk = np.asarray(src[start:start + chunk_size])
+        out[start:start + chunk_size] = chunk.transpose(0, 2, 1)
+    return out
+
+
+def save_arrays_and_labels_to_bin(array_list, labels_list, filename):
+    """
+    Saves a list of NumPy arrays and corresponding labels to a binary file with a header.
+
+    Parameters:
+    - array_list: List of NumPy arrays, each array should have the same shape and dtype.
+    - labels_list: List or NumPy array of labels corresponding to each array in array_list.
+    - filename: Name of the binary file to save the data to.
+    """
+    # Check that array_list and labels_list are not empty and have the same length
+    if len(array_list) != len(labels_list):
+        raise ValueError(
+            "array_list and labels_list must have the same length"
+        )
+
+    # Verify that all arrays have the same shape and dtype
+    first_shape = array_list[0].shape
+    first_dtype = array_list[0].dtype
+    for idx, arr in enumerate(array_list):
+        if arr.shape != first_shape:
+            raise ValueError(
+                f"All arrays must have the same shape. Array at index {idx} has shape {arr.shape}, expected {first_shape}"
+            )
+        if arr.dtype != first_dtype:
+            raise ValueError(
+                f"All arrays must have the same dtype. Array at index {idx} has dtype {arr.dtype}, expected {first_dtype}"
+            )
+
+    # Convert array_list to a single NumPy array
+    data = np.stack(array_list)  # Shape will be (num_arrays, dim1, dim2)
+
+    # Convert labels_list to a NumPy array
+    labels = np.array(labels_list, dtype=np.int32)
+
+    # Get the dimensions
+    num_arrays, dim1, dim2 = data.shape
+
+    # Prepare header: [num_arrays, dim1, dim2, labels_present (1 for True)], stored as int32
+    header = np.array(
+        [num_arrays, dim1, dim2, 1], dtype=np.int32
+    )  # The '1' indicates labels are present
+
+    # Open file in binary write mode
+    with open(filename, "wb") as f:
+        # Write header
+        header.tofile(f)
+        # Write data
+        data.tofile(f)
+        # Write labels
+        labels.tofile(f)
+
+    print(f"Data and labels saved to {filename}")
+
+
+class BinWriter:
+    """
+    Writes a .bin file chunk by chunk, in the same format as
+    `save_arrays_and_labels_to_bin`, without holding the data in memory.
+
+    The number of arrays in the header is patched when the writer is
+    closed; the labels (4 bytes per array) are kept until then and appended
+    after the data.
+
+        with BinWriter("data/synthetic.bin", 18, 1024) as writer:
+            writer.write(chunk, chunk_labels)
+
+    With layout="time", arrays are given and stored as (dim2, dim1).
+    """
+
+    def __init__(self, filename, dim1, dim2, labels=True, layout="channel"):
+        self.filename = filename
+        self.dim1 = dim1
+        self.dim2 = dim2
+        self.layout = layout
+        self.shape = stored_shape(dim1, dim2, layout)
+        self.labels = [] if labels else None
+        self.num_arrays = 0
+        self.f = open(filename, "wb")
+        np.zeros(4, dtype="<i4").tofile(self.f)
+
+    def write(self, arrays, labels=None):
+        """
+        Append arrays of shape (n, *self.shape) and, if the file has
+        labels, their n labels.
+        """
+        arrays = np.asarray(arrays, dtype="<f4")
+        if arrays.shape[1:] != self.shape:
+            raise ValueError(
+                f"arrays must have shape (n, {self.shape[0]}, "
+                f"{self.shape[1]}), got {arrays.shape}"
+            )
+        if self.labels is not None:
+            if labels is None or len(labels) != len(arrays):
+                raise ValueError("every array needs a label")
+            self.labels.append(np.asarray(labels, dtype="<i4"))
+        arrays.tofile(self.f)
+        self.num_arrays += len(arrays)
+
+    def close(self):
+        if self.f.closed:
+            return
+        if self.labels is not None and self.labels:
+            np.concatenate(self.labels).tofile(self.f)
+        self.f.seek(0)
+        np.array(
+            [
+                self.num_arrays,
+                self.dim1,
+                self.dim2,
+                make_flags(self.labels is not None, self.layout),
+            ],
+            dtype="<i4",
+        ).tofile(self.f)
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load_arrays_and_labels_from_bin(filename, layout="channel"):
+    """
+    Loads data and labels from a binary file with a header.
+
+    Parameters:
+    - filename: Name of the binary file to read the data from.
+    - layout: "channel" for (num_arrays, dim1, dim2) arrays, "time" for
+      (num_arrays, dim2, dim1); converted if the file is stored otherwise.
+
+    Returns:
+    - data: NumPy array of shape (num_arrays, dim1, dim2) for
+      layout="channel", (num_arrays, dim2, dim1) for layout="time"
+    - labels: NumPy array of shape (num_arrays,) containing the labels
+    """
+    with open(filename, "rb") as f:
+        # Read header
+        header = np.fromfile(f, dtype=np.int32, count=4)
+        if len(header) < 4:
+            raise ValueError("Header is incomplete or file is corrupted.")
+        num_arrays, dim1, dim2, flags = header
+        stored = layout_of(flags)
+
+        # Read data
+        num_floats = num_arrays * dim1 * dim2
+        data = np.fromfile(f, dtype="<f4", count=num_floats)
+        if data.size < num_floats:
+            raise ValueError("Data is incomplete or file is corrupted.")
+        data = data.reshape((num_arrays, *stored_shape(dim1, dim2, stored)))
+        if stored != layout:
+            data = transpose_windows(data)
+
+        # Read labels if present
+        if has_labels(flags):
+            labels = np.fromfile(f, dtype="<i4", count=num_arrays)
+            if labels.size < num_arrays:
+                raise ValueError("Labels are incomplete or file is corrupted.")
+        else:
+            labels = None  # Or set default labels if necessary
+
+    return data, labels
+
+
+def read_bin_header(filename):
+    """
+    Reads only the header of a binary data file.
+
+    Parameters:
+    - filename: Name of the binary file.
+
+    Returns:
+    - Tuple (num_arrays, dim1, dim2, flags) as Python ints; see `has_labels`
+      and `layout_of` for the flags. dim1, dim2 are (channels, samples)
+      whatever the layout.
+    """
+    with open(filename, "rb") as f:
+        header = np.fromfile(f, dtype="<i4", count=4)
+    if len(header) < 4:
+        raise ValueError("Header is incomplete or file is corrupted.")
+    return tuple(int(v) for v in header)
+
+
+def read_bin_labels(filename):
+    """
+    Reads only the label section of a binary data file, without touching
+    the data section.
+
+    Returns:
+    - labels: NumPy array of shape (num_arrays,), or None if the file has no
+      labels.
+    """
+    num_arrays, dim1, dim2, flags = read_bin_header(filename)
+    if not has_labels(flags):
+        return None
+    labels = np.fromfile(
+        filename,
+        dtype="<i4",
+        count=num_arrays,
+        offset=HEADER_SIZE + num_arrays * dim1 * dim2 * 4,
+    )
+    if labels.size < num_arrays:
+        raise ValueError("Labels are incomplete or file is corrupted.")
+    return labels
+
+
+def load_arrays_and_labels_memmap(filename, layout="channel", cache=False):
+    """
+    Memory-maps the data section of a binary file instead of reading it, so
+    only the windows that are actually accessed are paged in.
+
+    Parameters:
+    - filename: Name of the binary file to read the data from.
+    - layout: "channel" for (num_arrays, dim1, dim2) arrays, "time" for
+      (num_arrays, dim2, dim1).
+    - cache: When the file is stored in the other layout, map a transposed
+      copy kept next to it (see `transposed_path`), written on first use.
+      It is as large as the file and needs a writable directory, so it is
+      opt-in; by default the data is transposed into memory.
+
+    Returns:
+    - data: read-only np.memmap in the requested layout, or an in-memory
+      array if it had to be transposed without cache
+    - labels: NumPy array of shape (num_arrays,) or None
+    """
+    num_arrays, dim1, dim2, flags = read_bin_header(filename)
+    stored = layout_of(flags)
+    if stored != layout and cache:
+        path = transposed_path(filename, layout)
+        if not _is_fresh(path, filename):
+            write_transposed(filename, path, layout)
+        return load_arrays_and_labels_memmap(path, layout, cache=False)
+
+    data_bytes = num_arrays * dim1 * dim2 * 4
+    expected = HEADER_SIZE + data_bytes
+    if has_labels(flags):
+        expected += num_arrays * 4
+    if os.path.getsize(filename) < expected:
+        raise ValueError("Data is incomplete or file is corrupted.")
+
+    data = np.memmap(
+        filename,
+        dtype="<f4",
+        mode="r",
+        offset=HEADER_SIZE,
+        shape=(num_arrays, *stored_shape(dim1, dim2, stored)),
+    )
+    if stored != layout:
+        data = transpose_windows(data)
+    labels = read_bin_labels(filename)
+
+    return data, labels
+
+
+def transposed_path(filename, layout):
+    return f"{filename}.{layout}.bin"
+
+
+def _is_fresh(path, filename):
+    # The copy takes the mtime of its source when written, so a rewritten
+    # source invalidates it
+    if not os.path.exists(path):
+        return False
+    num_arrays, dim1, dim2, _ = read_bin_header(path)
+    return (
+        os.stat(path).st_mtime_ns == os.stat(filename).st_mtime_ns
+        and (num_arrays, dim1, dim2) == read_bin_header(filename)[:3]
+    )
+
+
+def write_transposed(filename, out_path, layout, chunk_size=256):
+    """
+    Write a copy of a .bin file stored in `layout`, chunk by chunk.
+    """
+    data, labels = load_arrays_and_labels_memmap(
+        filename, layout=layout_of(read_bin_header(filename)[3])
+    )
+    num_arrays, dim1, dim2, _ = read_bin_header(filename)
+    tmp_path = out_path + ".tmp"
+    with BinWriter(tmp_path, dim1, dim2, labels is not None, layout) as out:
+        for start in range(0, num_arrays, chunk_size):
+            stop = start + chunk_size
+            out.write(
+                transpose_windows(data[start:stop]),
+                None if labels is None else labels[start:stop],
+            )
+    source = os.stat(filename)
+    os.utime(tmp_path, ns=(source.st_atime_ns, source.st_mtime_ns))
+    os.replace(tmp_path, out_path)
+    print(f"{filename} -> {out_path} ({layout}-major copy)")
+
+
+def iter_bin_batches(
+    data, labels, batch_size, shuffle=False, seed=None, drop_last=False
+):
+    """
+    Yields contiguous (float32, int64) NumPy batches from (memmapped) arrays.
+
+    Without `shuffle` each batch is a slice of consecutive windows, so reads
+    stay sequential on disk. With `shuffle` every batch draws its windows
+    from a permutation of all of them (neighbouring windows overlap and are
+    strongly correlated); the indices of a batch are sorted so the memmap
+    gather still reads forward through the file.
+    """
+    num_arrays = len(data)
+    starts = np.arange(0, num_arrays, batch_size)
+    if drop_last and num_arrays % batch_size:
+        starts = starts[:-1]
+    order = None
+    if shuffle:
+        order = np.random.default_rng(seed).permutation(num_arrays)
+
+    for start in starts:
+        stop = min(start + batch_size, num_arrays)
+        if order is None:
+            idx = slice(start, stop)
+        else:
+            idx = np.sort(order[start:stop])
+        batch = np.ascontiguousarray(data[idx], dtype=np.float32)
+        if labels is None:
+            yield batch, None
+        else:
+            yield batch, np.asarray(labels[idx], dtype=np.int64)
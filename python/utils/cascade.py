@@ -0,0 +1,275 @@
+import time
+
+import numpy as np
+
+from utils.streaming import BinChunkReader
+from utils.telemetry import REGISTRY
+
+
+# (low, high) edges in Hz of the band powers
+BANDS = ((0.5, 4.0), (4.0, 8.0), (8.0, 13.0), (13.0, 30.0), (30.0, 70.0))
+
+
+def window_features(batch, fs=256.0, bands=BANDS):
+    """
+    Per-channel log line-length, log energy and log band powers of a batch
+    of windows, all computed at once over the whole batch.
+
+    Args:
+        batch (numpy.ndarray): (B, C, T) windows.
+        fs (float): Sampling rate in Hz.
+        bands (tuple): (low, high) frequency bands.
+
+    Returns:
+        numpy.ndarray: (B, C * (2 + len(bands))) float32 features.
+    """
+    batch = np.asarray(batch, dtype=np.float32)
+    n_samples = batch.shape[-1]
+    line_length = np.abs(np.diff(batch, axis=-1)).mean(axis=-1)
+    energy = np.square(batch).mean(axis=-1)
+
+    power = np.square(np.abs(np.fft.rfft(batch, axis=-1)))
+    freqs = np.fft.rfftfreq(n_samples, d=1.0 / fs)
+    # (n_bands, n_freqs) 0/1 matrix, so all bands are one matmul
+    masks = np.stack(
+        [(freqs >= low) & (freqs < high) for low, high in bands]
+    ).astype(np.float32)
+    band_power = power @ masks.T / n_samples  # (B, C, n_bands)
+
+    features = np.concatenate(
+        [line_length[..., None], energy[..., None], band_power], axis=-1
+    )
+    return np.log(features + 1e-6).reshape(len(batch), -1)
+
+
+class PreFilter:
+    """
+    First stage of the cascade: a logistic regression on `window_features`.
+
+    Windows whose seizure probability is below `threshold` are declared
+    negative without running the network. The threshold is calibrated so
+    that at least `target_recall` of the seizure windows of a calibration
+    set pass through.
+    """
+
+    def __init__(self, mean, scale, coef, intercept, threshold, fs=256.0):
+        self.mean = mean
+        self.scale = scale
+        self.coef = coef
+        self.intercept = intercept
+        self.threshold = threshold
+        self.fs = fs
+
+    @classmethod
+    def fit(
+        cls,
+        data,
+        labels,
+        target_recall=0.99,
+        val_fraction=0.2,
+        fs=256.0,
+        chunk_size=256,
+        seed=0,
+    ):
+        """
+        Fit on (memmapped) windows: the classifier is trained on a random
+        part of them and the threshold calibrated on the rest.
+
+        Args:
+            data (numpy.ndarray): (N, C, T) windows.
+            labels (numpy.ndarray): (N,) labels.
+            target_recall (float): Share of seizure windows of the
+                                   calibration set that must be kept.
+            val_fraction (float): Share of windows used for calibration.
+            fs (float): Sampling rate in Hz.
+            chunk_size (int): Windows per feature batch.
+            seed (int): Seed of the train/calibration split.
+        """
+        # sklearn is slow to import, it is only needed for fitting
+        from sklearn.linear_model import LogisticRegression
+
+        features = np.concatenate(
+            [
+                window_features(data[start:start + chunk_size], fs)
+                for start in range(0, len(data), chunk_size)
+            ]
+        )
+        labels = (np.asarray(labels) == 1).astype(np.int64)
+
+        order = np.random.default_rng(seed).permutation(len(labels))
+        n_val = max(1, int(len(labels) * val_fraction))
+        val_idx, train_idx = order[:n_val], order[n_val:]
+        if labels[val_idx].sum() == 0:
+            # No seizure to calibrate on, calibrate on everything instead
+            val_idx = order
+
+        mean = features[train_idx].mean(axis=0)
+        scale = 1.0 / (features[train_idx].std(axis=0) + 1e-6)
+        classifier = LogisticRegression(class_weight="balanced", max_iter=1000)
+        classifier.fit((features[train_idx] - mean) * scale, labels[train_idx])
+
+        prefilter = cls(
+            mean.astype(np.float32),
+            scale.astype(np.float32),
+            classifier.coef_[0].astype(np.float32),
+            np.float32(classifier.intercept_[0]),
+            threshold=0.0,
+            fs=fs,
+        )
+        prefilter.calibrate(
+            features[val_idx], labels[val_idx], target_recall, features=True
+        )
+        return prefilter
+
+    def calibrate(self, data, labels, target_recall=0.99, features=False):
+        """
+        Set the threshold to the highest value that keeps `target_recall` of
+        the positive windows of `data` (windows, or features if `features`).
+        """
+        scores = self.predict_proba(data, features=features)
+        positive = np.sort(scores[np.asarray(labels) == 1])
+        if len(positive) == 0:
+            raise ValueError("calibration needs seizure windows")
+        n_missed = int(np.floor((1.0 - target_recall) * len(positive)))
+        self.threshold = float(positive[n_missed])
+        return self.threshold
+
+    def predict_proba(self, batch, features=False):
+        """
+        Seizure probability of every window (NumPy only).
+        """
+        if not features:
+            batch = window_features(batch, self.fs)
+        logits = ((batch - self.mean) * self.scale) @ self.coef
+        return 1.0 / (1.0 + np.exp(-(logits + self.intercept)))
+
+    def keep(self, batch):
+        """
+        Boolean mask of the windows that must go to the second stage.
+        """
+        return self.predict_proba(batch) >= self.threshold
+
+    def save(self, path):
+        np.savez(
+            path,
+            mean=self.mean,
+            scale=self.scale,
+            coef=self.coef,
+            intercept=self.intercept,
+            threshold=np.float32(self.threshold),
+            fs=np.float32(self.fs),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            return cls(
+                f["mean"],
+                f["scale"],
+                f["coef"],
+                f["intercept"],
+                float(f["threshold"]),
+                float(f["fs"]),
+            )
+
+
+def cascade_score_fn(prefilter, score_fn, preprocess=None):
+    """
+    Score function (see `utils.streaming`) running `score_fn` only on the
+    windows the pre-filter keeps. Skipped windows get logits (1, 0), i.e.
+    they are predicted negative.
+
+    The pre-filter is fitted and calibrated on raw windows, so it always
+    sees the raw batch; `preprocess` (e.g. z-scoring) is only applied to
+    the windows passed on to `score_fn`.
+    """
+    skipped = REGISTRY.counter(
+        "seizureguard_prefilter_skipped_total",
+        "Windows declared negative by the pre-filter",
+    )
+
+    def score(batch):
+        keep = prefilter.keep(batch)
+        logits = np.zeros((len(batch), 2), dtype=np.float32)
+        logits[:, 0] = 1.0
+        if keep.any():
+            kept = np.ascontiguousarray(batch[keep])
+            if preprocess is not None:
+                kept = preprocess(kept)
+            logits[keep] = score_fn(kept)
+        skipped.inc(int(len(batch) - keep.sum()))
+        return logits
+
+    score.backend = getattr(score_fn, "backend", "custom")
+    return score
+
+
+def evaluate_cascade(filename, prefilter, score_fn, chunk_size=256):
+    """
+    Run the network alone and the cascade over a labelled .bin file.
+
+    Returns:
+        dict: skip_rate, recall of the network alone and of the cascade,
+              recall_loss (seizure windows the network detects but the
+              pre-filter drops, as a share of all seizure windows), and the
+              per-window cost in ms of both pipelines.
+    """
+    counts = {"windows": 0, "skipped": 0, "positives": 0}
+    detected = {"model": 0, "cascade": 0}
+    false_alarms = {"model": 0, "cascade": 0}
+    seconds = {"model": 0.0, "cascade": 0.0}
+
+    for _, batch, labels in BinChunkReader(filename, chunk_size):
+        if labels is None:
+            raise ValueError(f"{filename} has no labels")
+        positive = labels == 1
+
+        start = time.perf_counter()
+        model_preds = np.asarray(score_fn(batch)).argmax(axis=1) == 1
+        seconds["model"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        keep = prefilter.keep(batch)
+        cascade_preds = np.zeros(len(batch), dtype=bool)
+        if keep.any():
+            kept = np.ascontiguousarray(batch[keep])
+            cascade_preds[keep] = score_fn(kept).argmax(axis=1) == 1
+        seconds["cascade"] += time.perf_counter() - start
+
+        counts["windows"] += len(batch)
+        counts["skipped"] += int((~keep).sum())
+        counts["positives"] += int(positive.sum())
+        for name, preds in zip(detected, (model_preds, cascade_preds)):
+            detected[name] += int((preds & positive).sum())
+            false_alarms[name] += int((preds & ~positive).sum())
+
+    n_pos = max(counts["positives"], 1)
+    n_neg = max(counts["windows"] - counts["positives"], 1)
+    return {
+        "windows": counts["windows"],
+        "skip_rate": counts["skipped"] / max(counts["windows"], 1),
+        "model_recall": detected["model"] / n_pos,
+        "cascade_recall": detected["cascade"] / n_pos,
+        "recall_loss": (detected["model"] - detected["cascade"]) / n_pos,
+        "model_fpr": false_alarms["model"] / n_neg,
+        "cascade_fpr": false_alarms["cascade"] / n_neg,
+        "model_ms": 1000.0 * seconds["model"] / max(counts["windows"], 1),
+        "cascade_ms": 1000.0 * seconds["cascade"] / max(counts["windows"], 1),
+    }
+
+
+def format_cascade_report(result):
+    speedup = result["model_ms"] / max(result["cascade_ms"], 1e-9)
+    return "\n".join(
+        [
+            f"windows: {result['windows']}, "
+            f"skipped by the pre-filter: {100.0 * result['skip_rate']:.1f}%",
+            f"recall: {result['model_recall']:.4f} (network) -> "
+            f"{result['cascade_recall']:.4f} (cascade), "
+            f"loss {result['recall_loss']:.4f}",
+            f"FPR: {result['model_fpr']:.4f} (network) -> "
+            f"{result['cascade_fpr']:.4f} (cascade)",
+            f"cost: {result['model_ms']:.3f} -> {result['cascade_ms']:.3f} "
+            f"ms/window ({speedup:.1f}x)",
+        ]
+    )
@@ -0,0 +1,168 @@
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from utils.streaming import BinChunkReader, load_score_fn
+
+
+def ort_eval_score_fn(artifact_directory="training_artifacts"):
+    """
+    Score function running the eval graph of ORT training artifacts on the
+    parameters of their CheckpointState.
+
+    Artifacts generated without `additional_output_names=["output"]` only
+    output the loss; a copy of their eval graph that also outputs the
+    logits (the first input of the loss node) is used instead.
+    """
+    import onnx
+    import onnxruntime.training.api as orttraining
+
+    eval_path = os.path.join(artifact_directory, "eval_model.onnx")
+    eval_model = onnx.load(eval_path)
+    patched = len(eval_model.graph.output) < 2
+    if patched:
+        loss_node = next(
+            node
+            for node in eval_model.graph.node
+            if node.output[0] == eval_model.graph.output[0].name
+        )
+        eval_model.graph.output.append(
+            onnx.helper.make_tensor_value_info(
+                loss_node.input[0], onnx.TensorProto.FLOAT, ["batch_size", 2]
+            )
+        )
+        handle, eval_path = tempfile.mkstemp(suffix=".onnx")
+        os.close(handle)
+        onnx.save(eval_model, eval_path)
+
+    state = orttraining.CheckpointState.load_checkpoint(
+        os.path.join(artifact_directory, "checkpoint")
+    )
+    module = orttraining.Module(
+        os.path.join(artifact_directory, "training_model.onnx"),
+        state,
+        eval_path,
+    )
+    if patched:
+        os.remove(eval_path)
+    module.eval()
+
+    def score(batch):
+        # The labels only feed the loss, which is ignored
+        labels = np.zeros(len(batch), dtype=np.int64)
+        return module(batch, labels)[1]
+
+    score.backend = "ort-eval"
+    return score
+
+
+def load_backend(path):
+    """
+    Score function of a .pth checkpoint, an .onnx model or a directory of
+    ORT training artifacts (its eval graph).
+    """
+    if os.path.isdir(path):
+        return ort_eval_score_fn(path)
+    return load_score_fn(path)
+
+
+def check_consistency(filename, score_fns, chunk_size=256):
+    """
+    Stream `filename` once and run every batch through all backends
+    concurrently (one thread each), comparing their logits to the first one.
+
+    Args:
+        filename (str): .bin file to score.
+        score_fns (dict): Name -> score function, see `load_backend`. The
+                          first entry is the reference.
+        chunk_size (int): Windows per batch.
+
+    Returns:
+        dict: Name -> windows, seconds (time spent in the backend),
+              windows_per_s, max_abs_diff, mean_abs_diff, max_rel_diff
+              (deviation relative to the largest reference logit of the
+              window) and disagreement (share of windows whose prediction
+              differs from the reference), plus "wall_clock".
+    """
+    names = list(score_fns)
+    reference = names[0]
+    results = {
+        name: {
+            "windows": 0,
+            "seconds": 0.0,
+            "max_abs_diff": 0.0,
+            "max_rel_diff": 0.0,
+            "abs_diff_sum": 0.0,
+            "disagreements": 0,
+        }
+        for name in names
+    }
+
+    def run(name, batch):
+        start = time.perf_counter()
+        logits = np.asarray(score_fns[name](batch), dtype=np.float32)
+        return logits, time.perf_counter() - start
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(names)) as pool:
+        for _, batch, _ in BinChunkReader(filename, chunk_size):
+            futures = {name: pool.submit(run, name, batch) for name in names}
+            outputs = {name: f.result() for name, f in futures.items()}
+            ref_logits = outputs[reference][0]
+            ref_preds = ref_logits.argmax(axis=1)
+            ref_scale = np.abs(ref_logits).max(axis=1) + 1e-6
+            for name, (logits, seconds) in outputs.items():
+                diff = np.abs(logits - ref_logits)
+                r = results[name]
+                r["windows"] += len(batch)
+                r["seconds"] += seconds
+                r["max_abs_diff"] = max(r["max_abs_diff"], float(diff.max()))
+                r["max_rel_diff"] = max(
+                    r["max_rel_diff"],
+                    float((diff.max(axis=1) / ref_scale).max()),
+                )
+                r["abs_diff_sum"] += float(diff.mean(axis=1).sum())
+                r["disagreements"] += int(
+                    (logits.argmax(axis=1) != ref_preds).sum()
+                )
+    wall_clock = time.perf_counter() - start_time
+
+    for r in results.values():
+        windows = max(r["windows"], 1)
+        r["mean_abs_diff"] = r.pop("abs_diff_sum") / windows
+        r["disagreement"] = r.pop("disagreements") / windows
+        r["windows_per_s"] = (
+            r["windows"] / r["seconds"] if r["seconds"] > 0 else 0.0
+        )
+    results["wall_clock"] = wall_clock
+    return results
+
+
+def format_consistency_report(results):
+    reference = next(iter(results))
+    width = max(len(name) for name in results)
+    header = (
+        f"{'backend':<{width}} {'windows/s':>10} {'max|d|':>10} "
+        f"{'mean|d|':>10} {'max rel':>10} {'disagree':>9}"
+    )
+    lines = [header, "-" * len(header)]
+    for name, r in results.items():
+        if name == "wall_clock":
+            continue
+        if name == reference:
+            lines.append(
+                f"{name:<{width}} {r['windows_per_s']:>10.1f} "
+                f"{'(reference)':>10}"
+            )
+            continue
+        lines.append(
+            f"{name:<{width}} {r['windows_per_s']:>10.1f} "
+            f"{r['max_abs_diff']:>10.3g} {r['mean_abs_diff']:>10.3g} "
+            f"{r['max_rel_diff']:>10.3g} {100.0 * r['disagreement']:>8.2f}%"
+        )
+    lines.append("-" * len(header))
+    lines.append(f"wall-clock: {results['wall_clock']:.1f} s (one pass)")
+    return "\n".join(lines)
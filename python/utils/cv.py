@@ -0,0 +1,262 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import torch
+from torch.utils.data import ConcatDataset, DataLoader, Subset
+
+from utils.binfile import load_arrays_and_labels_memmap, read_bin_header
+from utils.dataset import SeizureDataset
+from utils.models import FCN2, fcn2_from_state_dict
+from utils.samplers import BalancedBatchSampler
+from utils.tools import train, validate
+
+
+# A fold is a dict {"name", "train", "test"} where "train" and "test" are
+# lists of (filename, start, stop) ranges of contiguous windows. Ranges are
+# tiny to pickle and every worker maps the files itself.
+
+
+def recording_folds(files):
+    """
+    Leave-one-recording-out folds: each file is the test set once.
+    """
+    sizes = {f: read_bin_header(f)[0] for f in files}
+    folds = []
+    for test_file in files:
+        folds.append(
+            {
+                "name": os.path.basename(test_file),
+                "train": [(f, 0, sizes[f]) for f in files if f != test_file],
+                "test": [(test_file, 0, sizes[test_file])],
+            }
+        )
+    return folds
+
+
+def time_block_folds(filename, k=5, gap=1):
+    """
+    Split one recording into `k` contiguous blocks of windows; each block is
+    the test set once. `gap` windows on both sides of the test block are
+    dropped from training so adjacent windows cannot leak across the split.
+    """
+    num_arrays = read_bin_header(filename)[0]
+    bounds = np.linspace(0, num_arrays, k + 1, dtype=np.int64)
+    folds = []
+    for i in range(k):
+        start, stop = int(bounds[i]), int(bounds[i + 1])
+        train_ranges = []
+        if start - gap > 0:
+            train_ranges.append((filename, 0, start - gap))
+        if stop + gap < num_arrays:
+            train_ranges.append((filename, stop + gap, num_arrays))
+        folds.append(
+            {
+                "name": f"{os.path.basename(filename)}[{start}:{stop}]",
+                "train": train_ranges,
+                "test": [(filename, start, stop)],
+            }
+        )
+    return folds
+
+
+_arrays = {}
+
+
+def _open(filename):
+    # One memmap per file and process, the page cache is shared by all
+    if filename not in _arrays:
+        _arrays[filename] = load_arrays_and_labels_memmap(filename)
+    return _arrays[filename]
+
+
+def _n_windows(ranges):
+    return sum(stop - start for _, start, stop in ranges)
+
+
+def check_fold(fold, val_fraction=0.1):
+    """
+    Raise a ValueError naming the fold if it leaves no windows to train,
+    validate or test on (e.g. a single recording for `recording_folds`, or
+    more blocks than windows for `time_block_folds`).
+    """
+    train_ranges, val_ranges = _split_validation(fold["train"], val_fraction)
+    for split, ranges in (
+        ("training", train_ranges),
+        ("validation", val_ranges),
+        ("test", fold["test"]),
+    ):
+        if _n_windows(ranges) <= 0:
+            raise ValueError(
+                f"fold {fold['name']} has no {split} windows "
+                f"(train ranges: {fold['train']}, test ranges: "
+                f"{fold['test']})"
+            )
+
+
+def _ranges_dataset(ranges):
+    datasets = []
+    labels = []
+    for filename, start, stop in ranges:
+        data, file_labels = _open(filename)
+        datasets.append(
+            Subset(SeizureDataset(data, file_labels), range(start, stop))
+        )
+        labels.append(file_labels[start:stop])
+    return ConcatDataset(datasets), np.concatenate(labels)
+
+
+def _split_validation(ranges, val_fraction):
+    # Hold out the tail of every training range for early stopping
+    train_ranges, val_ranges = [], []
+    for filename, start, stop in ranges:
+        if stop <= start:
+            continue
+        cut = stop - max(1, int((stop - start) * val_fraction))
+        if cut > start:
+            train_ranges.append((filename, start, cut))
+        val_ranges.append((filename, cut, stop))
+    return train_ranges, val_ranges
+
+
+def _init_worker(threads_per_worker):
+    torch.set_num_threads(threads_per_worker)
+
+
+def run_fold(fold, config):
+    """
+    Train on the training ranges of `fold` and evaluate on its test ranges.
+
+    Args:
+        fold (dict): See `recording_folds` / `time_block_folds`.
+        config (dict): checkpoint, epochs, patience, batch_size, pos_ratio,
+                       val_fraction and output_dir.
+
+    Returns:
+        dict: Test metrics of the fold plus its wall-clock time.
+    """
+    start_time = time.perf_counter()
+    device = "cpu"
+    batch_size = config.get("batch_size", 32)
+    check_fold(fold, config.get("val_fraction", 0.1))
+
+    train_ranges, val_ranges = _split_validation(
+        fold["train"], config.get("val_fraction", 0.1)
+    )
+    train_set, train_labels = _ranges_dataset(train_ranges)
+    val_set, _ = _ranges_dataset(val_ranges)
+    test_set, test_labels = _ranges_dataset(fold["test"])
+
+    if config.get("pos_ratio"):
+        train_loader = DataLoader(
+            train_set,
+            batch_sampler=BalancedBatchSampler(
+                train_labels, batch_size, pos_ratio=config["pos_ratio"]
+            ),
+        )
+    else:
+        train_loader = DataLoader(
+            train_set, batch_size=batch_size, shuffle=True
+        )
+    val_loader = DataLoader(val_set, batch_size=batch_size, shuffle=False)
+    test_loader = DataLoader(test_set, batch_size=batch_size, shuffle=False)
+
+    if config.get("checkpoint"):
+        model = fcn2_from_state_dict(
+            torch.load(config["checkpoint"], map_location=device)[
+                "state_dict"
+            ]
+        )
+    else:
+        model = FCN2(in_channels=18)
+
+    save_path = os.path.join(
+        config.get("output_dir", "models/cv"),
+        f"fold_{fold['name'].replace('/', '_')}.pth",
+    )
+    os.makedirs(os.path.dirname(save_path), exist_ok=True)
+    train(
+        train_loader,
+        val_loader,
+        model,
+        device=device,
+        epochs=config.get("epochs", 20),
+        patience=config.get("patience", 5),
+        save_path=save_path,
+    )
+    if os.path.exists(save_path):
+        model.load_state_dict(
+            torch.load(save_path, map_location=device)["state_dict"]
+        )
+
+    _, metrics = validate(test_loader, model, device)
+    positives = int((test_labels == 1).sum())
+    if positives == 0:
+        # Seizure-free test block: recall is undefined, not 0
+        metrics["recall"] = float("nan")
+    return {
+        "fold": fold["name"],
+        "windows": len(test_set),
+        "positives": positives,
+        "seconds": time.perf_counter() - start_time,
+        **metrics,
+    }
+
+
+def run_cross_validation(
+    folds, config, n_workers=None, threads_per_worker=1
+):
+    """
+    Run all folds in parallel worker processes.
+
+    Each worker is limited to `threads_per_worker` torch threads so that
+    `n_workers * threads_per_worker` matches the available cores instead of
+    oversubscribing them.
+
+    Returns:
+        list: Per-fold results, in fold order.
+    """
+    if not folds:
+        raise ValueError("no folds to run")
+    # Fail before any worker starts training
+    for fold in folds:
+        check_fold(fold, config.get("val_fraction", 0.1))
+    if n_workers is None:
+        n_workers = max(1, (os.cpu_count() or 1) // threads_per_worker)
+    n_workers = min(n_workers, len(folds))
+    with ProcessPoolExecutor(
+        max_workers=n_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(threads_per_worker,),
+    ) as pool:
+        futures = [pool.submit(run_fold, fold, config) for fold in folds]
+        return [future.result() for future in futures]
+
+
+def format_cv_report(results):
+    """
+    Per-fold table followed by the mean and standard deviation. Folds
+    without seizure windows have no recall and are left out of its mean.
+    """
+    header = (
+        f"{'fold':<28} {'windows':>8} {'F1':>7} {'Recall':>7} "
+        f"{'FPR':>7} {'sec':>8}"
+    )
+    lines = [header, "-" * len(header)]
+    for r in results:
+        lines.append(
+            f"{r['fold']:<28} {r['windows']:>8} {r['f1']:>7.4f} "
+            f"{r['recall']:>7.4f} {r['fpr']:>7.4f} {r['seconds']:>8.1f}"
+        )
+    lines.append("-" * len(header))
+    for name, reduce in (("mean", np.nanmean), ("std", np.nanstd)):
+        lines.append(
+            f"{name:<28} {'':>8} "
+            f"{reduce([r['f1'] for r in results]):>7.4f} "
+            f"{reduce([r['recall'] for r in results]):>7.4f} "
+            f"{reduce([r['fpr'] for r in results]):>7.4f}"
+        )
+    return "\n".join(lines)
@@ -1,3 +1,4 @@
+import numpy as np
 import torch
 from torch.utils.data import Dataset
 
@@ -39,3 +40,52 @@ class SeizureDataset(Dataset):
         label = torch.tensor(label, dtype=torch.long)
 
         return sample, label
+
+
+class DistillationDataset(SeizureDataset):
+    """
+    SeizureDataset that also returns the cached teacher logits of each
+    sample, so the teacher never has to run during student training.
+    """
+
+    def __init__(self, data, labels, teacher_logits, transform=None):
+        super().__init__(data, labels, transform=transform)
+        if len(teacher_logits) != len(data):
+            raise ValueError(
+                "teacher_logits and data must have the same length"
+            )
+        self.teacher_logits = teacher_logits
+
+    def __getitem__(self, idx):
+        sample, label = super().__getitem__(idx)
+        logits = torch.tensor(self.teacher_logits[idx], dtype=torch.float32)
+
+        return sample, label, logits
+
+
+class ContinuousDataset(SeizureDataset):
+    """
+    Windows of any length and hop cut from a continuous recording (see
+    `utils.recording`). The windows are strided views on the memory-mapped
+    signal, so overlapping windows are neither stored nor read twice; their
+    labels are derived from the sample or segment labels on the fly.
+    """
+
+    def __init__(
+        self, recording, window=1024, hop=512, min_overlap=0.5, transform=None
+    ):
+        """
+        Args:
+            recording (Recording): Continuous recording.
+            window (int): Window length in samples.
+            hop (int): Step between two window starts in samples.
+            min_overlap (float): Share of seizure samples that makes a
+                                 window positive.
+            transform (callable, optional): Applied on every sample.
+        """
+        windows = recording.windows(window, hop)
+        labels = recording.window_labels(window, hop, min_overlap)
+        if labels is None:
+            # Unlabelled recording
+            labels = np.full(len(windows), -1, dtype=np.int64)
+        super().__init__(windows, labels, transform=transform)
@@ -0,0 +1,341 @@
+import json
+import os
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from utils.streaming import BinChunkReader
+from utils.telemetry import REGISTRY, InferenceMetrics
+
+
+EXIT_NAMES = ("exit1", "exit2", "final")
+
+
+class EarlyExitLoss(nn.Module):
+    """
+    Weighted sum of the cross-entropies of the three outputs of an
+    `EarlyExitFCN2` in training mode. Plain logits (eval mode) get the
+    usual cross-entropy, so it can be passed as `train(criterion=...)`.
+    """
+
+    def __init__(self, weights=(0.3, 0.3, 1.0)):
+        super(EarlyExitLoss, self).__init__()
+        self.weights = weights
+        self.cross_entropy = nn.CrossEntropyLoss()
+
+    def forward(self, outputs, target):
+        if isinstance(outputs, torch.Tensor):
+            return self.cross_entropy(outputs, target)
+        return sum(
+            weight * self.cross_entropy(output, target)
+            for weight, output in zip(self.weights, outputs)
+        )
+
+
+def exit_probabilities(model, data, chunk_size=256):
+    """
+    p(seizure) of every window at every exit, all stages run.
+
+    Returns:
+        numpy.ndarray: (N, 3) probabilities, in `EXIT_NAMES` order.
+    """
+    model.eval()
+    probs = []
+    with torch.no_grad():
+        for start in range(0, len(data), chunk_size):
+            x = torch.from_numpy(
+                np.asarray(data[start:start + chunk_size], dtype=np.float32)
+            )
+            outputs = model.exits(x)
+            probs.append(
+                torch.stack(
+                    [torch.softmax(out, dim=1)[:, 1] for out in outputs],
+                    dim=1,
+                ).numpy()
+            )
+    return np.concatenate(probs)
+
+
+def calibrate_exits(model, data, labels, target_recall=0.99, chunk_size=256):
+    """
+    Set `model.thresholds` so that at most (1 - target_recall) of the
+    seizure windows of `data` leave at an early exit, half of that budget
+    per exit. Windows only leave early as negatives, so this bounds the
+    recall lost against running every window through the whole network.
+
+    Returns:
+        numpy.ndarray: The two thresholds.
+    """
+    probs = exit_probabilities(model, data, chunk_size)
+    positive = np.asarray(labels) == 1
+    n_pos = int(positive.sum())
+    if n_pos == 0:
+        raise ValueError("calibration needs seizure windows")
+    budget = int(np.floor((1.0 - target_recall) * n_pos))
+    budgets = (budget // 2, budget - budget // 2)
+
+    thresholds = np.zeros(2, dtype=np.float32)
+    remaining = np.ones(len(probs), dtype=bool)
+    for k, n_missed in enumerate(budgets):
+        scores = np.sort(probs[remaining & positive, k])
+        # Leaving means p < threshold: exactly n_missed positives (ties
+        # aside) fall below the n_missed-th smallest positive score
+        thresholds[k] = scores[n_missed] if n_missed < len(scores) else 1.0
+        remaining &= probs[:, k] >= thresholds[k]
+
+    model.thresholds.copy_(torch.from_numpy(thresholds))
+    return thresholds
+
+
+def early_exit_forward(model, x):
+    """
+    Gated inference on a batch: after each stage the windows whose exit
+    p(seizure) is below its threshold leave with that exit's logits, and
+    only the others go through the next stage.
+
+    Returns:
+        tuple: (B, 2) logits and (B,) index of the exit each window took.
+    """
+    logits = torch.empty(len(x), 2, dtype=x.dtype)
+    taken = torch.full((len(x),), len(EXIT_NAMES) - 1, dtype=torch.int64)
+    idx = torch.arange(len(x))
+    features = x
+    stages = ((model.stage1, model.exit1), (model.stage2, model.exit2))
+    for k, (stage, head) in enumerate(stages):
+        features = stage(features)
+        out = head(features)
+        leave = torch.softmax(out, dim=1)[:, 1] < model.thresholds[k]
+        logits[idx[leave]] = out[leave]
+        taken[idx[leave]] = k
+        stay = ~leave
+        idx, features = idx[stay], features[stay]
+        if len(idx) == 0:
+            return logits, taken
+    logits[idx] = model.classify(model.stage3(features))
+    return logits, taken
+
+
+def _exit_counters():
+    return [
+        REGISTRY.counter(
+            "seizureguard_early_exit_total",
+            "Windows by the exit they left the network at",
+            {"exit": name},
+        )
+        for name in EXIT_NAMES
+    ]
+
+
+def early_exit_score_fn(model, device="cpu"):
+    """
+    Score function (see `utils.streaming`) with gated early exits.
+    """
+    model.to(device)
+    model.eval()
+    telemetry = InferenceMetrics("torch-early-exit")
+    counters = _exit_counters()
+
+    def score(batch):
+        start = time.perf_counter()
+        with torch.no_grad():
+            logits, taken = early_exit_forward(
+                model, torch.from_numpy(batch).to(device)
+            )
+        telemetry.record_model(len(batch), time.perf_counter() - start)
+        for counter, n in zip(counters, np.bincount(taken.numpy(), None, 3)):
+            counter.inc(int(n))
+        return logits.cpu().numpy()
+
+    score.backend = "torch-early-exit"
+    return score
+
+
+class _Stage(nn.Module):
+    # Stage k of the model on its own, for export: the first two return
+    # (exit logits, features), the last one the final logits
+    def __init__(self, model, k):
+        super(_Stage, self).__init__()
+        self.model = model
+        self.k = k
+
+    def forward(self, x):
+        model = self.model
+        if self.k == 0:
+            features = model.stage1(x)
+            return model.exit1(features), features
+        if self.k == 1:
+            features = model.stage2(x)
+            return model.exit2(features), features
+        return model.classify(model.stage3(x))
+
+
+def export_early_exit_onnx(model, directory, opset_version=17):
+    """
+    Export an `EarlyExitFCN2` as three ONNX graphs the app runs one after
+    the other: stage1.onnx (window -> exit logits, features), stage2.onnx
+    (features -> exit logits, features) and stage3.onnx (features -> final
+    logits), plus exits.json with the thresholds.
+    """
+    os.makedirs(directory, exist_ok=True)
+    model.eval()
+    x = torch.randn(1, model.conv1.in_channels, 1024)
+    paths = []
+    for k in range(3):
+        stage = _Stage(model, k).eval()
+        path = os.path.join(directory, f"stage{k + 1}.onnx")
+        outputs = ["exit", "features"] if k < 2 else ["output"]
+        torch.onnx.export(
+            stage,
+            x,
+            path,
+            input_names=["input"],
+            output_names=outputs,
+            dynamic_axes={
+                name: {0: "batch_size"} for name in ["input"] + outputs
+            },
+            opset_version=opset_version,
+        )
+        paths.append(path)
+        if k < 2:
+            with torch.no_grad():
+                x = stage(x)[1]
+
+    with open(os.path.join(directory, "exits.json"), "w") as f:
+        json.dump(
+            {
+                "stages": [os.path.basename(path) for path in paths],
+                "thresholds": model.thresholds.tolist(),
+            },
+            f,
+            indent=2,
+        )
+    return paths
+
+
+def onnx_early_exit_score_fn(directory):
+    """
+    Score function running the three stage graphs written by
+    `export_early_exit_onnx`, with the same gating as `early_exit_forward`.
+    """
+    from onnxruntime import InferenceSession
+
+    with open(os.path.join(directory, "exits.json")) as f:
+        config = json.load(f)
+    sessions = [
+        InferenceSession(
+            os.path.join(directory, name), providers=["CPUExecutionProvider"]
+        )
+        for name in config["stages"]
+    ]
+    thresholds = config["thresholds"]
+    telemetry = InferenceMetrics("onnx-early-exit")
+    counters = _exit_counters()
+
+    def score(batch):
+        start = time.perf_counter()
+        logits = np.empty((len(batch), 2), dtype=np.float32)
+        idx = np.arange(len(batch))
+        features = batch
+        for k, session in enumerate(sessions):
+            if k == len(sessions) - 1:
+                logits[idx] = session.run(None, {"input": features})[0]
+                counters[k].inc(len(idx))
+                break
+            out, features = session.run(None, {"input": features})
+            # Softmax over two classes: p(seizure) = sigmoid(l1 - l0), in
+            # the tanh form that cannot overflow on large logits
+            p = 0.5 * (1.0 + np.tanh(0.5 * (out[:, 1] - out[:, 0])))
+            leave = p < thresholds[k]
+            logits[idx[leave]] = out[leave]
+            counters[k].inc(int(leave.sum()))
+            idx = idx[~leave]
+            features = np.ascontiguousarray(features[~leave])
+            if len(idx) == 0:
+                break
+        telemetry.record_model(len(batch), time.perf_counter() - start)
+        return logits
+
+    score.backend = "onnx-early-exit"
+    return score
+
+
+def evaluate_early_exit(filename, model, chunk_size=256):
+    """
+    Run the whole network and the gated one over a labelled .bin file.
+
+    Returns:
+        dict: exit shares, recall and FPR of both, recall_loss (seizure
+              windows the whole network detects but an early exit drops,
+              as a share of all seizure windows) and ms per window of both.
+    """
+    model.eval()
+    counts = np.zeros(3, dtype=np.int64)
+    n_windows = n_positives = 0
+    detected = {"full": 0, "gated": 0, "lost": 0}
+    false_alarms = {"full": 0, "gated": 0}
+    seconds = {"full": 0.0, "gated": 0.0}
+
+    with torch.no_grad():
+        for _, batch, labels in BinChunkReader(filename, chunk_size):
+            if labels is None:
+                raise ValueError(f"{filename} has no labels")
+            x = torch.from_numpy(batch)
+            positive = labels == 1
+
+            start = time.perf_counter()
+            full = model(x).argmax(dim=1).numpy() == 1
+            seconds["full"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            logits, taken = early_exit_forward(model, x)
+            seconds["gated"] += time.perf_counter() - start
+            gated = logits.argmax(dim=1).numpy() == 1
+
+            counts += np.bincount(taken.numpy(), minlength=3)
+            n_windows += len(batch)
+            n_positives += int(positive.sum())
+            for name, preds in (("full", full), ("gated", gated)):
+                detected[name] += int((preds & positive).sum())
+                false_alarms[name] += int((preds & ~positive).sum())
+            detected["lost"] += int((full & ~gated & positive).sum())
+
+    n_pos = max(n_positives, 1)
+    n_neg = max(n_windows - n_positives, 1)
+    return {
+        "windows": n_windows,
+        "exit_shares": counts / max(n_windows, 1),
+        "full_recall": detected["full"] / n_pos,
+        "gated_recall": detected["gated"] / n_pos,
+        "recall_loss": detected["lost"] / n_pos,
+        "full_fpr": false_alarms["full"] / n_neg,
+        "gated_fpr": false_alarms["gated"] / n_neg,
+        "full_ms": 1000.0 * seconds["full"] / max(n_windows, 1),
+        "gated_ms": 1000.0 * seconds["gated"] / max(n_windows, 1),
+    }
+
+
+def format_early_exit_report(result, target_recall=None):
+    speedup = result["full_ms"] / max(result["gated_ms"], 1e-9)
+    shares = ", ".join(
+        f"{name} {100.0 * share:.1f}%"
+        for name, share in zip(EXIT_NAMES, result["exit_shares"])
+    )
+    lines = [
+        f"windows: {result['windows']}, exits: {shares}",
+        f"recall: {result['full_recall']:.4f} (full) -> "
+        f"{result['gated_recall']:.4f} (early exit), "
+        f"loss {result['recall_loss']:.4f}",
+        f"FPR: {result['full_fpr']:.4f} (full) -> "
+        f"{result['gated_fpr']:.4f} (early exit)",
+        f"cost: {result['full_ms']:.3f} -> {result['gated_ms']:.3f} "
+        f"ms/window ({speedup:.1f}x)",
+    ]
+    if target_recall is not None:
+        guaranteed = result["recall_loss"] <= 1.0 - target_recall
+        lines.append(
+            f"recall loss budget {1.0 - target_recall:.4f} (calibrated): "
+            f"{'met' if guaranteed else 'NOT met'} on this file"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,135 @@
+import time
+
+import torch
+import torch.nn as nn
+
+from utils.models import fcn2_from_state_dict
+from utils.telemetry import InferenceMetrics
+
+
+def _stack_conv(convs, groups):
+    # Per-model convs side by side: conv1 (groups=1) reads the shared input,
+    # later ones (groups=N) only read their own model's channels
+    first = convs[0]
+    stacked = nn.Conv1d(
+        first.in_channels * (1 if groups == 1 else len(convs)),
+        first.out_channels * len(convs),
+        kernel_size=first.kernel_size,
+        padding=first.padding,
+        groups=groups,
+    )
+    stacked.weight.data = torch.cat([c.weight.data for c in convs])
+    stacked.bias.data = torch.cat([c.bias.data for c in convs])
+    return stacked
+
+
+def _stack_bn(bns):
+    stacked = nn.BatchNorm1d(bns[0].num_features * len(bns), eps=bns[0].eps)
+    for name in ("weight", "bias"):
+        getattr(stacked, name).data = torch.cat(
+            [getattr(bn, name).data for bn in bns]
+        )
+    for name in ("running_mean", "running_var"):
+        setattr(stacked, name, torch.cat([getattr(bn, name) for bn in bns]))
+    return stacked
+
+
+class StackedFCN2(nn.Module):
+    """
+    N FCN2 models of the same widths fused into one network: the first conv
+    of every model reads the shared input, the following layers are grouped
+    convolutions (groups=N) so each model only sees its own channels. One
+    forward pass computes the logits of all N models.
+    """
+
+    def __init__(self, models):
+        super(StackedFCN2, self).__init__()
+        widths = {
+            (
+                m.conv1.in_channels,
+                m.conv1.out_channels,
+                m.classifier[0].out_channels,
+            )
+            for m in models
+        }
+        if len(widths) != 1:
+            raise ValueError(
+                f"models must have the same widths, got {sorted(widths)}"
+            )
+        self.n_models = n = len(models)
+
+        self.conv1 = _stack_conv([m.conv1 for m in models], groups=1)
+        self.bn1 = _stack_bn([m.bn1 for m in models])
+        self.conv2 = _stack_conv([m.conv2 for m in models], groups=n)
+        self.bn2 = _stack_bn([m.bn2 for m in models])
+        self.conv3 = _stack_conv([m.conv3 for m in models], groups=n)
+        self.bn3 = _stack_bn([m.bn3 for m in models])
+        self.relu = nn.ReLU()
+        self.pool = nn.MaxPool1d(kernel_size=4, padding=0)
+        self.classifier = nn.Sequential(
+            _stack_conv([m.classifier[0] for m in models], groups=n),
+            _stack_conv([m.classifier[1] for m in models], groups=n),
+        )
+
+    def forward(self, x):
+        """
+        Returns:
+            torch.Tensor: (N, B, 2) logits, model by model in the order they
+                          were given (same layout as each FCN2's output).
+        """
+        out = self.pool(self.relu(self.bn1(self.conv1(x))))
+        out = self.pool(self.relu(self.bn2(self.conv2(out))))
+        out = self.pool(self.relu(self.bn3(self.conv3(out))))
+        out = self.classifier(out)  # b x (N*2) x t
+        b, _, t = out.size()
+        out = out.view(b, self.n_models, 2, t).permute(1, 0, 3, 2)
+        return out.reshape(self.n_models, b * t, 2)
+
+
+def combine_logits(logits, method="mean"):
+    """
+    Combine (N, B, 2) per-model logits into (B, 2) scores.
+
+    "mean" averages the softmax probabilities of the models, "vote" returns
+    the share of models predicting each class (ties go to class 0).
+    """
+    if method == "mean":
+        return torch.softmax(logits, dim=2).mean(dim=0)
+    if method == "vote":
+        votes = logits.argmax(dim=2)
+        positive = votes.float().mean(dim=0)
+        return torch.stack([1.0 - positive, positive], dim=1)
+    raise ValueError(f"unknown combination method {method!r}")
+
+
+def load_ensemble(checkpoints):
+    models = [
+        fcn2_from_state_dict(
+            torch.load(path, map_location=torch.device("cpu"))["state_dict"]
+        )
+        for path in checkpoints
+    ]
+    model = StackedFCN2(models)
+    model.eval()
+    return model
+
+
+def ensemble_score_fn(checkpoints, method="mean", device="cpu"):
+    """
+    Score function (see `utils.streaming`) of an ensemble of FCN2
+    checkpoints: every batch is read once and goes through all models in a
+    single `StackedFCN2` call.
+    """
+    model = load_ensemble(checkpoints).to(device)
+    telemetry = InferenceMetrics("torch-ensemble")
+
+    def score(batch):
+        start = time.perf_counter()
+        with torch.no_grad():
+            logits = model(torch.from_numpy(batch).to(device))
+            scores = combine_logits(logits, method).cpu().numpy()
+        telemetry.record_model(len(batch), time.perf_counter() - start)
+        return scores
+
+    score.backend = "torch-ensemble"
+    return score
@@ -0,0 +1,12 @@
+import hashlib
+
+
+def sha256_file(path, chunk_size=1 << 20):
+    """
+    SHA-256 of a file, read in chunks.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,209 @@
+import hashlib
+import time
+
+import numpy as np
+
+from utils.telemetry import InferenceMetrics
+
+
+# Parameters changed by on-device personalization (the `requires_grad`
+# list of exports_for_on_device_training.py)
+HEAD_PARAMS = (
+    "classifier.0.weight",
+    "classifier.0.bias",
+    "classifier.1.weight",
+    "classifier.1.bias",
+)
+
+
+def head_state(path):
+    """
+    float32 head parameters of a .pth FCN2 checkpoint or an .onnx model
+    (e.g. one exported by `OrtTrainer.export_model_for_inferencing`).
+    """
+    if path.endswith(".onnx"):
+        import onnx
+        from onnx import numpy_helper
+
+        initializers = {
+            init.name: init for init in onnx.load(path).graph.initializer
+        }
+        return {
+            name: numpy_helper.to_array(initializers[name]).astype(np.float32)
+            for name in HEAD_PARAMS
+        }
+
+    import torch
+
+    state_dict = torch.load(path, map_location=torch.device("cpu"))
+    state_dict = state_dict["state_dict"]
+    return {name: state_dict[name].numpy() for name in HEAD_PARAMS}
+
+
+def head_fingerprint(head):
+    """
+    Short hash of head parameters, stored in a delta to check it is applied
+    to the base it was computed against.
+    """
+    digest = hashlib.sha256()
+    for name in HEAD_PARAMS:
+        digest.update(name.encode())
+        digest.update(np.ascontiguousarray(head[name], "<f4").tobytes())
+    return digest.hexdigest()[:16]
+
+
+def export_head_delta(finetuned, base, out_path):
+    """
+    Write the difference between a fine-tuned head and the base one,
+    quantized to int8 with one scale per output channel and deflated
+    (`np.savez_compressed`). A personalized model then takes a few KB
+    instead of a full ONNX file or checkpoint.
+
+    Args:
+        finetuned (dict): Fine-tuned head, see `head_state`.
+        base (dict): Head of the shared base model.
+        out_path (str): .npz file to write.
+
+    Returns:
+        dict: bytes written and the largest reconstruction error.
+    """
+    arrays = {"base": np.array(head_fingerprint(base))}
+    max_error = 0.0
+    for name in HEAD_PARAMS:
+        delta = finetuned[name].astype(np.float32) - base[name]
+        rows = delta.reshape(len(delta), -1)
+        scale = np.abs(rows).max(axis=1) / 127.0
+        scale[scale == 0] = 1.0
+        q = np.round(rows / scale[:, None]).astype(np.int8)
+        arrays[name] = q.reshape(delta.shape)
+        arrays[name + ".scale"] = scale.astype(np.float32)
+        error = np.abs(q * scale[:, None] - rows).max(initial=0.0)
+        max_error = max(max_error, float(error))
+
+    with open(out_path, "wb") as f:
+        np.savez_compressed(f, **arrays)
+        size = f.tell()
+    return {"bytes": size, "max_error": max_error}
+
+
+def load_head_delta(path, base):
+    """
+    Fine-tuned head rebuilt from a delta written by `export_head_delta`.
+    """
+    with np.load(path) as f:
+        if str(f["base"]) != head_fingerprint(base):
+            raise ValueError(
+                f"{path} was computed against another base head "
+                f"({f['base']} != {head_fingerprint(base)})"
+            )
+        head = {}
+        for name in HEAD_PARAMS:
+            q = f[name]
+            scale = f[name + ".scale"]
+            delta = q.reshape(len(q), -1) * scale[:, None]
+            head[name] = base[name] + delta.reshape(q.shape)
+    return head
+
+
+def patch_onnx(base_onnx, head, out_path=None):
+    """
+    Replace the head initializers of the base ONNX graph.
+
+    Returns:
+        bytes: The patched model (also written to `out_path` if given),
+               loadable with `InferenceSession(bytes)`.
+    """
+    import onnx
+    from onnx import numpy_helper
+
+    model = onnx.load(base_onnx)
+    for init in model.graph.initializer:
+        if init.name in head:
+            init.CopyFrom(
+                numpy_helper.from_array(
+                    np.asarray(head[init.name], np.float32), init.name
+                )
+            )
+    data = model.SerializeToString()
+    if out_path is not None:
+        with open(out_path, "wb") as f:
+            f.write(data)
+    return data
+
+
+def _backbone(base_onnx):
+    # Subgraph from the input to the tensor the first classifier conv reads
+    import onnx
+    from onnx.utils import Extractor
+
+    # The extractor needs the shapes of intermediate tensors
+    model = onnx.shape_inference.infer_shapes(onnx.load(base_onnx))
+    features = next(
+        node.input[0]
+        for node in model.graph.node
+        if HEAD_PARAMS[0] in node.input
+    )
+    backbone = Extractor(model).extract_model(["input"], [features])
+    return backbone.SerializeToString(), features
+
+
+class HeadScorer:
+    """
+    Score windows with per-patient heads on one shared backbone.
+
+    The backbone (everything up to the classifier) is cut out of the base
+    ONNX graph and loaded once. Heads are plain NumPy: both classifier
+    convs see a (n_filters, 16) input, so each is a single matmul, and
+    switching patients is a dictionary lookup.
+    """
+
+    def __init__(self, base_onnx, base_head=None):
+        from onnxruntime import InferenceSession
+
+        data, self.features_name = _backbone(base_onnx)
+        self.session = InferenceSession(
+            data, providers=["CPUExecutionProvider"]
+        )
+        self.base_head = base_head or head_state(base_onnx)
+        self.heads = {}
+        self.telemetry = InferenceMetrics("onnx-heads")
+
+    def add_head(self, name, head):
+        layers = []
+        for i in range(2):
+            weight = head[f"classifier.{i}.weight"]
+            bias = head[f"classifier.{i}.bias"]
+            # The conv kernel spans its whole input: an (in * k, out) matmul
+            weight = weight.reshape(len(weight), -1).T
+            layers.append((weight.astype(np.float32), bias.astype(np.float32)))
+        self.heads[name] = layers
+
+    def add_delta(self, name, delta_path):
+        self.add_head(name, load_head_delta(delta_path, self.base_head))
+
+    def remove_head(self, name):
+        del self.heads[name]
+
+    def features(self, batch):
+        return self.session.run([self.features_name], {"input": batch})[0]
+
+    def classify(self, features, name):
+        (w0, b0), (w1, b1) = self.heads[name]
+        hidden = features.reshape(len(features), -1) @ w0 + b0
+        return hidden @ w1 + b1
+
+    def score(self, batch, name):
+        """
+        (B, 2) logits of the head `name`.
+        """
+        start = time.perf_counter()
+        logits = self.classify(self.features(batch), name)
+        self.telemetry.record_model(len(batch), time.perf_counter() - start)
+        return logits
+
+    def score_all(self, batch):
+        """
+        Logits of every head from a single backbone pass.
+        """
+        features = self.features(batch)
+        return {name: self.classify(features, name) for name in self.heads}
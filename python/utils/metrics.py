@@ -0,0 +1,50 @@
+def compute_metrics(true_labels, pred_labels):
+    """
+    Compute evaluation metrics such as Precision, Recall, F1-Score, and False Positive Rate (FPR).
+    """
+    # sklearn is slow to import, only pay for it when metrics are computed
+    from sklearn.metrics import (
+        precision_score,
+        recall_score,
+        f1_score,
+        confusion_matrix,
+    )
+
+    # Calculate Precision, Recall, and F1-Score
+    precision = precision_score(true_labels, pred_labels, zero_division=0)
+    recall = recall_score(true_labels, pred_labels, zero_division=0)
+    f1 = f1_score(true_labels, pred_labels, zero_division=0)
+
+    # Compute confusion matrix, always 2x2 even if a class never occurs
+    tn, fp, fn, tp = confusion_matrix(
+        true_labels, pred_labels, labels=[0, 1]
+    ).ravel()
+
+    # Calculate False Positive Rate (FPR)
+    if fp + tn > 0:
+        fpr = fp / (fp + tn)
+    else:
+        fpr = 0.0  # Handle the case where there are no true negatives or false positives
+
+    # Return metrics, with f1 as the primary metric for evaluation
+    return {
+        "precision": precision,
+        "recall": recall,
+        "f1": f1,
+        "fpr": fpr,  # False Positive Rate
+    }
+
+
+def metrics_from_confusion(tn, fp, fn, tp):
+    """
+    Same metrics as `compute_metrics`, from confusion-matrix counts that
+    were accumulated batch by batch.
+    """
+    precision = tp / (tp + fp) if tp + fp > 0 else 0.0
+    recall = tp / (tp + fn) if tp + fn > 0 else 0.0
+    if precision + recall > 0:
+        f1 = 2 * precision * recall / (precision + recall)
+    else:
+        f1 = 0.0
+    fpr = fp / (fp + tn) if fp + tn > 0 else 0.0
+    return {"precision": precision, "recall": recall, "f1": f1, "fpr": fpr}
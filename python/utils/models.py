@@ -1,11 +1,11 @@
+import torch
 import torch.nn as nn
 
 
 class FCN2(nn.Module):
-    def __init__(self, in_channels=22):
+    def __init__(self, in_channels=22, n_filters=128, n_hidden=100):
         super(FCN2, self).__init__()
         # first convolutional block
-        n_filters = 128
         self.conv1 = nn.Conv1d(
             in_channels, n_filters, kernel_size=3, padding=1
         )
@@ -30,8 +30,8 @@ class FCN2(nn.Module):
 
         # Fully connected layers within the classifier sequential module
         self.classifier = nn.Sequential(
-            nn.Conv1d(n_filters, 100, kernel_size=16, padding=0),
-            nn.Conv1d(100, 2, kernel_size=1, padding=0),
+            nn.Conv1d(n_filters, n_hidden, kernel_size=16, padding=0),
+            nn.Conv1d(n_hidden, 2, kernel_size=1, padding=0),
         )
 
     def get_features(self, x):
@@ -43,8 +43,7 @@ class FCN2(nn.Module):
         out = self.pool3(out)
         return out
 
-    def forward(self, x):
-        features = self.get_features(x)
+    def classify(self, features):
         out = self.classifier(features)
         out = out.transpose(0, 1)  # nxbxt
         n, b, t = out.size()
@@ -53,3 +52,166 @@ class FCN2(nn.Module):
         out = out.t()  # (t*b)xn
 
         return out
+
+    def forward(self, x):
+        return self.classify(self.get_features(x))
+
+
+def fcn2_from_state_dict(state_dict, assign=False):
+    """
+    Build an FCN2 whose widths match a (possibly pruned) state dict and load
+    the weights into it.
+
+    With `assign`, the model is built on the meta device and takes the
+    state dict tensors as its parameters instead of copying them (e.g. to
+    keep a memory-mapped checkpoint mapped).
+    """
+    widths = dict(
+        in_channels=state_dict["conv1.weight"].shape[1],
+        n_filters=state_dict["conv1.weight"].shape[0],
+        n_hidden=state_dict["classifier.0.weight"].shape[0],
+    )
+    if not assign:
+        model = FCN2(**widths)
+        model.load_state_dict(state_dict)
+        return model
+    with torch.device("meta"):
+        model = FCN2(**widths)
+    model.load_state_dict(state_dict, assign=True)
+    return model
+
+
+class FCN2Head(nn.Module):
+    """
+    The classifier of an FCN2 on its own: (B, n_filters, 16) features from
+    `FCN2.get_features` in, (B, 2) logits out. The parameters keep their
+    FCN2 names (classifier.0.weight, ...).
+    """
+
+    def __init__(self, model):
+        super(FCN2Head, self).__init__()
+        self.classifier = model.classifier
+
+    def forward(self, features):
+        return FCN2.classify(self, features)
+
+
+class EarlyExitFCN2(FCN2):
+    """
+    FCN2 with two small auxiliary classifiers ("exits") after pool1 and
+    pool2, so confidently negative windows can skip the later blocks (see
+    `utils.early_exit`).
+
+    Like the auxiliary heads of GoogLeNet, the exits are only returned in
+    training mode: `forward` then gives (exit1, exit2, final) logits for
+    `utils.early_exit.EarlyExitLoss`. In eval mode it returns the final
+    logits, so the model drops in wherever an FCN2 is expected.
+    """
+
+    def __init__(self, in_channels=22, n_filters=128, n_hidden=100, n_exit=32):
+        super(EarlyExitFCN2, self).__init__(in_channels, n_filters, n_hidden)
+        self.exit1 = self._exit_head(n_filters, n_exit)
+        self.exit2 = self._exit_head(n_filters, n_exit)
+        # p(seizure) below which a window leaves at exit 1 / 2 (0: never)
+        self.register_buffer("thresholds", torch.zeros(2))
+
+    @staticmethod
+    def _exit_head(n_filters, n_hidden):
+        return nn.Sequential(
+            nn.AdaptiveMaxPool1d(1),
+            nn.Conv1d(n_filters, n_hidden, kernel_size=1),
+            nn.ReLU(),
+            nn.Conv1d(n_hidden, 2, kernel_size=1),
+            nn.Flatten(),
+        )
+
+    @classmethod
+    def from_fcn2(cls, model, n_exit=32):
+        """
+        Early-exit model sharing the trained weights of an FCN2, with new
+        (untrained) exits.
+        """
+        early_exit = cls(
+            in_channels=model.conv1.in_channels,
+            n_filters=model.conv1.out_channels,
+            n_hidden=model.classifier[0].out_channels,
+            n_exit=n_exit,
+        )
+        early_exit.load_state_dict(model.state_dict(), strict=False)
+        return early_exit
+
+    def stage1(self, x):
+        return self.pool1(self.relu1(self.bn1(self.conv1(x))))
+
+    def stage2(self, x):
+        return self.pool2(self.relu2(self.bn2(self.conv2(x))))
+
+    def stage3(self, x):
+        return self.pool3(self.relu3(self.bn3(self.conv3(x))))
+
+    def exits(self, x):
+        features1 = self.stage1(x)
+        features2 = self.stage2(features1)
+        final = self.classify(self.stage3(features2))
+        return self.exit1(features1), self.exit2(features2), final
+
+    def forward(self, x):
+        if self.training:
+            return self.exits(x)
+        return super(EarlyExitFCN2, self).forward(x)
+
+
+class SeparableConv1d(nn.Module):
+    """
+    Depthwise conv followed by a pointwise (1x1) conv.
+    """
+
+    def __init__(self, in_channels, out_channels, kernel_size=3, padding=1):
+        super(SeparableConv1d, self).__init__()
+        self.depthwise = nn.Conv1d(
+            in_channels,
+            in_channels,
+            kernel_size=kernel_size,
+            padding=padding,
+            groups=in_channels,
+        )
+        self.pointwise = nn.Conv1d(in_channels, out_channels, kernel_size=1)
+
+    def forward(self, x):
+        return self.pointwise(self.depthwise(x))
+
+
+class TinyFCN(nn.Module):
+    """
+    Small student version of FCN2 built from depthwise-separable convs.
+    Same input (B, C, 1024) and output (B, 2) as FCN2.
+    """
+
+    def __init__(self, in_channels=22, n_filters=32, n_hidden=32):
+        super(TinyFCN, self).__init__()
+        self.block1 = self._block(in_channels, n_filters)
+        self.block2 = self._block(n_filters, n_filters)
+        self.block3 = self._block(n_filters, n_filters)
+
+        self.classifier = nn.Sequential(
+            nn.Conv1d(n_filters, n_hidden, kernel_size=16, padding=0),
+            nn.Conv1d(n_hidden, 2, kernel_size=1, padding=0),
+        )
+
+    @staticmethod
+    def _block(in_channels, out_channels):
+        return nn.Sequential(
+            SeparableConv1d(in_channels, out_channels),
+            nn.BatchNorm1d(out_channels),
+            nn.ReLU(),
+            nn.MaxPool1d(kernel_size=4, padding=0),
+        )
+
+    def get_features(self, x):
+        return self.block3(self.block2(self.block1(x)))
+
+    # Same classifier layout as FCN2, so the same logits reshaping
+    classify = FCN2.classify
+
+    def forward(self, x):
+        return self.classify(self.get_features(x))
@@ -0,0 +1,168 @@
+import itertools
+import os
+import time
+
+import numpy as np
+import onnxruntime.training.api as orttraining
+
+from utils.metrics import compute_metrics
+
+
+class OrtTrainer:
+    """
+    Persistent ORT on-device training session.
+
+    The training, eval and optimizer graphs are loaded once and share the
+    same CheckpointState, so evaluating never requires exporting and
+    reloading an inference model. Batches are plain NumPy arrays, see
+    `utils.binfile.iter_bin_batches`.
+    """
+
+    def __init__(
+        self, artifact_directory="training_artifacts", checkpoint_path=None
+    ):
+        """
+        Args:
+            artifact_directory (str): Directory produced by
+                                      `utils.artifacts.build_training_artifacts`.
+            checkpoint_path (str, optional): CheckpointState to resume from.
+                                             Defaults to the artifact one.
+        """
+        if checkpoint_path is None:
+            checkpoint_path = os.path.join(artifact_directory, "checkpoint")
+        self.state = orttraining.CheckpointState.load_checkpoint(
+            checkpoint_path
+        )
+        self.module = orttraining.Module(
+            os.path.join(artifact_directory, "training_model.onnx"),
+            self.state,
+            os.path.join(artifact_directory, "eval_model.onnx"),
+        )
+        self.optimizer = orttraining.Optimizer(
+            os.path.join(artifact_directory, "optimizer_model.onnx"),
+            self.module,
+        )
+        # Progress survives checkpoint round trips through the state
+        properties = self.state.properties
+        self.step = properties["step"] if "step" in properties else 0
+        self.epoch = properties["epoch"] if "epoch" in properties else 0
+        # Batches of the current epoch already applied, and their summed loss
+        self.batch = properties["batch"] if "batch" in properties else 0
+        self.epoch_loss = (
+            properties["epoch_loss"] if "epoch_loss" in properties else 0.0
+        )
+
+    def set_learning_rate(self, lr):
+        self.optimizer.set_learning_rate(lr)
+
+    def train_step(self, data, target):
+        outputs = self.module(data, target)
+        self.optimizer.step()
+        self.module.lazy_reset_grad()
+        self.step += 1
+        loss = outputs[0] if isinstance(outputs, (list, tuple)) else outputs
+        return float(loss)
+
+    def train_epoch(self, batches, checkpoint_path=None, checkpoint_every=0):
+        """
+        Run one pass over `batches`.
+
+        After resuming from a mid-epoch checkpoint, `batches` must replay the
+        interrupted epoch in the same order (e.g. `iter_bin_batches` with the
+        same seed): the batches already applied are skipped.
+
+        Args:
+            batches (iterable): Yields (data, target) NumPy arrays.
+            checkpoint_path (str, optional): Where to save the state.
+            checkpoint_every (int): Save the state every N steps (0 only
+                                    saves at the end of the epoch).
+
+        Returns:
+            dict: Mean loss, number of windows and windows per second.
+        """
+        self.module.train()
+        n_windows = 0
+        batches = itertools.islice(batches, self.batch, None)
+        if self.batch:
+            print(f"resuming: epoch {self.epoch + 1}, batch {self.batch}")
+        start = time.perf_counter()
+        for data, target in batches:
+            self.epoch_loss += self.train_step(data, target)
+            self.batch += 1
+            n_windows += len(data)
+            if (
+                checkpoint_path
+                and checkpoint_every
+                and self.step % checkpoint_every == 0
+            ):
+                self.save_checkpoint(checkpoint_path)
+        elapsed = time.perf_counter() - start
+        loss = self.epoch_loss / max(self.batch, 1)
+
+        self.epoch += 1
+        self.batch, self.epoch_loss = 0, 0.0
+        if checkpoint_path:
+            self.save_checkpoint(checkpoint_path)
+
+        return {
+            "loss": loss,
+            "windows": n_windows,
+            "windows_per_s": n_windows / elapsed if elapsed > 0 else 0.0,
+        }
+
+    def evaluate(self, batches):
+        """
+        Evaluate with the eval graph of the current session.
+
+        Metrics are only available when the artifacts were generated with
+        `additional_output_names=["output"]`; otherwise just the loss is
+        reported.
+        """
+        self.module.eval()
+        total_loss = 0.0
+        n_batches = 0
+        n_windows = 0
+        all_preds = []
+        all_targets = []
+        start = time.perf_counter()
+        for data, target in batches:
+            outputs = self.module(data, target)
+            if isinstance(outputs, (list, tuple)):
+                total_loss += float(outputs[0])
+                if len(outputs) > 1:
+                    all_preds.append(np.argmax(outputs[1], axis=1))
+                    all_targets.append(target)
+            else:
+                total_loss += float(outputs)
+            n_batches += 1
+            n_windows += len(data)
+        elapsed = time.perf_counter() - start
+
+        results = {
+            "loss": total_loss / max(n_batches, 1),
+            "windows": n_windows,
+            "windows_per_s": n_windows / elapsed if elapsed > 0 else 0.0,
+        }
+        if all_preds:
+            results.update(
+                compute_metrics(
+                    np.concatenate(all_targets), np.concatenate(all_preds)
+                )
+            )
+        return results
+
+    def save_checkpoint(self, checkpoint_path):
+        """
+        Save the CheckpointState, replacing the previous one atomically so an
+        interruption never leaves a truncated checkpoint behind.
+        """
+        self.state.properties["step"] = self.step
+        self.state.properties["epoch"] = self.epoch
+        self.state.properties["batch"] = self.batch
+        self.state.properties["epoch_loss"] = self.epoch_loss
+        tmp_path = checkpoint_path + ".tmp"
+        orttraining.CheckpointState.save_checkpoint(self.state, tmp_path)
+        os.replace(tmp_path, checkpoint_path)
+
+    def export_model_for_inferencing(self, onnx_model_path):
+        self.module.export_model_for_inferencing(onnx_model_path, ["output"])
@@ -0,0 +1,167 @@
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from utils.models import FCN2
+
+
+def rank_filters(bn):
+    """
+    Rank the channels of a BatchNorm layer by the magnitude of their gamma.
+
+    Args:
+        bn (nn.BatchNorm1d): BatchNorm layer following the conv to prune.
+
+    Returns:
+        torch.Tensor: Channel indices, most important first.
+    """
+    return torch.argsort(bn.weight.detach().abs(), descending=True)
+
+
+def rank_hidden_units(conv):
+    """
+    Rank the output channels of the first classifier conv by the L1 norm of
+    their weights (there is no BatchNorm to read a gamma from).
+    """
+    scores = conv.weight.detach().abs().sum(dim=(1, 2))
+    return torch.argsort(scores, descending=True)
+
+
+def _copy_conv(src, dst, out_idx, in_idx):
+    dst.weight.data.copy_(src.weight.data[out_idx][:, in_idx])
+    dst.bias.data.copy_(src.bias.data[out_idx])
+
+
+def _copy_bn(src, dst, idx):
+    dst.weight.data.copy_(src.weight.data[idx])
+    dst.bias.data.copy_(src.bias.data[idx])
+    dst.running_mean.copy_(src.running_mean[idx])
+    dst.running_var.copy_(src.running_var[idx])
+    dst.num_batches_tracked.copy_(src.num_batches_tracked)
+
+
+def prune_fcn2(model, n_filters, n_hidden=None):
+    """
+    Structured channel pruning of an FCN2.
+
+    The `n_filters` channels with the largest BN gamma are kept in each conv
+    block and copied, together with the matching input slices of the next
+    layer, into a freshly built FCN2 of the reduced width.
+
+    Args:
+        model (FCN2): Trained model to prune.
+        n_filters (int): Number of filters to keep in every conv block.
+        n_hidden (int, optional): Width of the first classifier conv. Scaled
+                                  with `n_filters` when not given.
+
+    Returns:
+        FCN2: Pruned model, same interface as the original one.
+    """
+    old_filters = model.conv1.out_channels
+    old_hidden = model.classifier[0].out_channels
+    if n_hidden is None:
+        n_hidden = max(1, round(old_hidden * n_filters / old_filters))
+    if n_filters > old_filters or n_hidden > old_hidden:
+        raise ValueError(
+            f"Cannot prune a {old_filters}/{old_hidden} model "
+            f"to {n_filters}/{n_hidden}"
+        )
+
+    pruned = FCN2(
+        in_channels=model.conv1.in_channels,
+        n_filters=n_filters,
+        n_hidden=n_hidden,
+    )
+
+    # Keep the surviving channels in their original order
+    idx1 = rank_filters(model.bn1)[:n_filters].sort().values
+    idx2 = rank_filters(model.bn2)[:n_filters].sort().values
+    idx3 = rank_filters(model.bn3)[:n_filters].sort().values
+    idx_h = rank_hidden_units(model.classifier[0])[:n_hidden].sort().values
+    all_in = torch.arange(model.conv1.in_channels)
+    all_out = torch.arange(2)
+
+    with torch.no_grad():
+        _copy_conv(model.conv1, pruned.conv1, idx1, all_in)
+        _copy_bn(model.bn1, pruned.bn1, idx1)
+        _copy_conv(model.conv2, pruned.conv2, idx2, idx1)
+        _copy_bn(model.bn2, pruned.bn2, idx2)
+        _copy_conv(model.conv3, pruned.conv3, idx3, idx2)
+        _copy_bn(model.bn3, pruned.bn3, idx3)
+        _copy_conv(model.classifier[0], pruned.classifier[0], idx_h, idx3)
+        _copy_conv(model.classifier[1], pruned.classifier[1], all_out, idx_h)
+
+    return pruned
+
+
+def count_parameters(model):
+    return sum(p.numel() for p in model.parameters())
+
+
+def count_macs(model, input_shape=(1, 18, 1024)):
+    """
+    Count multiply-accumulate operations of the conv layers for one forward
+    pass over an input of `input_shape`, normalised per window.
+    """
+    macs = []
+
+    def hook(module, inputs, output):
+        kernel = module.kernel_size[0] * module.in_channels // module.groups
+        macs.append(output.numel() * kernel)
+
+    handles = [
+        m.register_forward_hook(hook)
+        for m in model.modules()
+        if isinstance(m, nn.Conv1d)
+    ]
+    was_training = model.training
+    model.eval()
+    with torch.no_grad():
+        model(torch.zeros(input_shape))
+    model.train(was_training)
+    for handle in handles:
+        handle.remove()
+
+    return sum(macs) // input_shape[0]
+
+
+def measure_latency(
+    model, batch_size=1, n_runs=50, warmup=10, in_shape=(18, 1024)
+):
+    """
+    Median CPU wall time of one forward pass, in milliseconds per window.
+    The model is timed in eval mode and left in the mode it was in.
+    """
+    was_training = model.training
+    model.eval()
+    x = torch.randn(batch_size, *in_shape)
+    timings = []
+    with torch.no_grad():
+        for i in range(warmup + n_runs):
+            start = time.perf_counter()
+            model(x)
+            if i >= warmup:
+                timings.append(time.perf_counter() - start)
+    model.train(was_training)
+
+    return 1000.0 * float(np.median(timings)) / batch_size
+
+
+def format_report(rows):
+    """
+    Format the per-width results as a plain text table.
+    """
+    header = (
+        f"{'filters':>8} {'hidden':>7} {'params':>9} {'MACs':>12} "
+        f"{'ms/win':>8} {'F1':>7} {'Recall':>7} {'FPR':>7}"
+    )
+    lines = [header, "-" * len(header)]
+    for r in rows:
+        lines.append(
+            f"{r['n_filters']:>8} {r['n_hidden']:>7} {r['params']:>9} "
+            f"{r['macs']:>12} {r['latency_ms']:>8.3f} {r['f1']:>7.4f} "
+            f"{r['recall']:>7.4f} {r['fpr']:>7.4f}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,247 @@
+import os
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from utils.binfile import load_arrays_and_labels_memmap
+
+
+# Continuous recording file (.rec):
+#   header  5 x int64: n_channels, n_samples, fs, label_kind, n_labels
+#   data    float32 (n_channels, n_samples), channel-major
+#   labels  label_kind 0: none
+#           label_kind 1: int8 (n_samples,) per-sample labels
+#           label_kind 2: int64 (n_labels, 2) [start, stop) seizure segments
+REC_HEADER_SIZE = 40
+NO_LABELS, SAMPLE_LABELS, SEGMENT_LABELS = 0, 1, 2
+
+
+class Recording:
+    """
+    One continuous (n_channels, n_samples) recording, memory-mapped, with
+    optional per-sample labels or seizure segments.
+    """
+
+    def __init__(self, data, fs=256, sample_labels=None, segments=None):
+        if sample_labels is not None and segments is not None:
+            raise ValueError("give either sample_labels or segments")
+        self.data = data
+        self.fs = fs
+        self.sample_labels = sample_labels
+        self.segments = segments
+        self._cumulative = None
+
+    @property
+    def n_samples(self):
+        return self.data.shape[1]
+
+    @property
+    def has_labels(self):
+        return self.sample_labels is not None or self.segments is not None
+
+    def window_starts(self, window, hop):
+        return np.arange(0, self.n_samples - window + 1, hop, dtype=np.int64)
+
+    def windows(self, window=1024, hop=1024):
+        """
+        (n_windows, n_channels, window) strided view on the recording: no
+        sample is copied, overlapping windows share memory.
+        """
+        view = sliding_window_view(self.data, window, axis=1)[:, ::hop]
+        return view.transpose(1, 0, 2)
+
+    def _seizure_samples_before(self, t):
+        # Number of seizure samples in [0, t) for every t of the array
+        if self.sample_labels is not None:
+            if self._cumulative is None:
+                self._cumulative = np.concatenate(
+                    [[0], np.cumsum(self.sample_labels == 1, dtype=np.int64)]
+                )
+            return self._cumulative[t]
+        if len(self.segments) == 0:
+            return np.zeros_like(t)
+        starts, stops = self.segments[:, 0], self.segments[:, 1]
+        lengths = stops - starts
+        before = np.concatenate([[0], np.cumsum(lengths)])
+        j = np.maximum(np.searchsorted(starts, t, side="right") - 1, 0)
+        inside = np.clip(t - starts[j], 0, lengths[j])
+        return np.where(t > starts[0], before[j] + inside, 0)
+
+    def window_labels(self, window=1024, hop=1024, min_overlap=0.5):
+        """
+        Label of every window: 1 if at least `min_overlap` of its samples
+        are seizure samples. None if the recording has no labels.
+        """
+        if not self.has_labels:
+            return None
+        starts = self.window_starts(window, hop)
+        seizure = self._seizure_samples_before(
+            starts + window
+        ) - self._seizure_samples_before(starts)
+        return (seizure >= min_overlap * window).astype(np.int64)
+
+
+def save_recording(filename, data, fs=256, sample_labels=None, segments=None):
+    """
+    Write a continuous recording.
+
+    Parameters:
+    - data: (n_channels, n_samples) array.
+    - fs: Sampling rate in Hz.
+    - sample_labels: Optional (n_samples,) labels.
+    - segments: Optional (n, 2) [start, stop) sample ranges of seizures.
+    """
+    n_channels, n_samples = data.shape
+    label_kind, n_labels = NO_LABELS, 0
+    if sample_labels is not None:
+        label_kind, n_labels = SAMPLE_LABELS, n_samples
+    elif segments is not None:
+        segments = _sorted_segments(segments)
+        label_kind, n_labels = SEGMENT_LABELS, len(segments)
+
+    header = np.array(
+        [n_channels, n_samples, fs, label_kind, n_labels], dtype="<i8"
+    )
+    with open(filename, "wb") as f:
+        header.tofile(f)
+        np.asarray(data, dtype="<f4").tofile(f)
+        if label_kind == SAMPLE_LABELS:
+            np.asarray(sample_labels, dtype=np.int8).tofile(f)
+        elif label_kind == SEGMENT_LABELS:
+            segments.tofile(f)
+
+
+def _sorted_segments(segments):
+    segments = np.asarray(segments, dtype="<i8").reshape(-1, 2)
+    return segments[np.argsort(segments[:, 0], kind="stable")]
+
+
+def load_recording(filename):
+    """
+    Memory-map a continuous recording written by `save_recording`.
+    """
+    header = np.fromfile(filename, dtype="<i8", count=5)
+    if len(header) < 5:
+        raise ValueError("Header is incomplete or file is corrupted.")
+    n_channels, n_samples, fs, label_kind, n_labels = (int(v) for v in header)
+    data_bytes = n_channels * n_samples * 4
+    labels_offset = REC_HEADER_SIZE + data_bytes
+    expected = labels_offset
+    if label_kind == SAMPLE_LABELS:
+        expected += n_samples
+    elif label_kind == SEGMENT_LABELS:
+        expected += n_labels * 16
+    if os.path.getsize(filename) < expected:
+        raise ValueError("Data is incomplete or file is corrupted.")
+
+    data = np.memmap(
+        filename,
+        dtype="<f4",
+        mode="r",
+        offset=REC_HEADER_SIZE,
+        shape=(n_channels, n_samples),
+    )
+    sample_labels = segments = None
+    if label_kind == SAMPLE_LABELS:
+        sample_labels = np.memmap(
+            filename,
+            dtype=np.int8,
+            mode="r",
+            offset=labels_offset,
+            shape=(n_samples,),
+        )
+    elif label_kind == SEGMENT_LABELS:
+        segments = np.fromfile(
+            filename, dtype="<i8", count=2 * n_labels, offset=labels_offset
+        ).reshape(-1, 2)
+    return Recording(data, fs, sample_labels=sample_labels, segments=segments)
+
+
+def bin_to_recording(bin_file, rec_file, hop=None, fs=256, chunk_size=256):
+    """
+    Convert pre-cut .bin windows back into one continuous recording.
+
+    The windows are assumed to be consecutive with a step of `hop` samples
+    (default: the window length, i.e. no overlap); only the first `hop`
+    samples of every window but the last are kept. Window labels become
+    seizure segments covering the whole extent of positive windows
+    (overlapping ones merged), and the labels `window_labels` derives from
+    them are checked against the original ones: every positive window
+    comes back positive, but with overlapping windows a negative window
+    mostly covered by its positive neighbours may not, which is reported.
+
+    Returns:
+        Recording: The converted recording, memory-mapped.
+    """
+    data, labels = load_arrays_and_labels_memmap(bin_file)
+    num_arrays, n_channels, window = data.shape
+    hop = hop or window
+    if hop > window:
+        raise ValueError("hop cannot be larger than the window")
+    n_samples = (num_arrays - 1) * hop + window if num_arrays else 0
+
+    segments = None
+    if labels is not None:
+        segments = _window_segments(np.asarray(labels), hop, window)
+
+    header = np.array(
+        [
+            n_channels,
+            n_samples,
+            fs,
+            NO_LABELS if segments is None else SEGMENT_LABELS,
+            0 if segments is None else len(segments),
+        ],
+        dtype="<i8",
+    )
+    with open(rec_file, "wb") as f:
+        header.tofile(f)
+        f.truncate(REC_HEADER_SIZE + n_channels * n_samples * 4)
+    out = np.memmap(
+        rec_file,
+        dtype="<f4",
+        mode="r+",
+        offset=REC_HEADER_SIZE,
+        shape=(n_channels, n_samples),
+    )
+    for start in range(0, num_arrays, chunk_size):
+        chunk = np.asarray(data[start:start + chunk_size])
+        stop = start + len(chunk)
+        # New samples of every window of the chunk, in time order
+        step = chunk[:, :, :hop].transpose(1, 0, 2).reshape(n_channels, -1)
+        out[:, start * hop:stop * hop] = step
+        if stop == num_arrays:
+            out[:, (num_arrays - 1) * hop:] = chunk[-1]
+    out.flush()
+    del out
+
+    if segments is not None:
+        with open(rec_file, "ab") as f:
+            segments.tofile(f)
+
+    print(f"{bin_file} -> {rec_file}: {n_samples} samples")
+    recording = load_recording(rec_file)
+    if segments is not None:
+        relabelled = recording.window_labels(window, hop)
+        changed = np.flatnonzero(relabelled != labels)
+        if len(changed):
+            print(
+                f"warning: {len(changed)} negative windows of {bin_file} "
+                f"are labelled positive in {rec_file} (first: {changed[0]})"
+            )
+    return recording
+
+
+def _window_segments(labels, hop, window):
+    # Runs of positive windows -> [start, stop) sample ranges spanning whole
+    # windows; runs closer than a window overlap and are merged
+    positive = np.concatenate([[0], labels == 1, [0]]).astype(np.int8)
+    edges = np.flatnonzero(np.diff(positive))
+    first, last = edges[0::2], edges[1::2] - 1
+    segments = np.stack([first * hop, last * hop + window], axis=1)
+    if len(segments) > 1:
+        overlaps = segments[1:, 0] <= segments[:-1, 1]
+        keep = np.concatenate([[True], ~overlaps])
+        stops = np.maximum.reduceat(segments[:, 1], np.flatnonzero(keep))
+        segments = np.stack([segments[keep, 0], stops], axis=1)
+    return segments.astype("<i8")
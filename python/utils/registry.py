@@ -0,0 +1,162 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from utils.hashing import sha256_file
+
+
+class ModelRegistry:
+    """
+    In-process cache of ready-to-run models, keyed by (absolute path,
+    SHA-256 of the file), so a checkpoint rewritten on disk (e.g.
+    `best_model.pth` during training) is never served stale.
+
+    - `.pth` FCN2 checkpoints are loaded with `torch.load(mmap=True)` and
+      `load_state_dict(assign=True)`: the weights stay mapped from the file
+      instead of being read and copied. Checkpoints must therefore be
+      replaced, never rewritten in place (`utils.tools.save_checkpoint`
+      renames a new file over the old one, whose pages stay valid for the
+      models still mapping them); truncating a mapped file kills the
+      process with SIGBUS.
+    - `.onnx` models become CPU `InferenceSession`s.
+
+    Entries are kept in LRU order; the least recently used ones are evicted
+    once their estimated size exceeds `max_bytes`. `prewarm` loads models
+    on a background thread ahead of use.
+
+    Returned models are shared between callers: treat them as read-only
+    and copy them (or use `state_dict`) before training.
+    """
+
+    def __init__(self, max_bytes=512 * 2**20, n_workers=1):
+        self.max_bytes = max_bytes
+        self.n_workers = n_workers
+        self._entries = OrderedDict()  # key -> (object, nbytes)
+        self._loading = {}  # key -> Future of an in-flight load
+        self._hashes = {}  # path -> ((mtime_ns, size), sha256)
+        self._lock = threading.Lock()
+        self._pool = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def nbytes(self):
+        with self._lock:
+            return sum(nbytes for _, nbytes in self._entries.values())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def key(self, path):
+        # Hashing is only redone when the file's mtime or size changed
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._hashes.get(path)
+        if cached is None or cached[0] != signature:
+            # Hashed without the lock, concurrent callers may both do it
+            cached = (signature, sha256_file(path))
+            with self._lock:
+                self._hashes[path] = cached
+        return path, cached[1]
+
+    def state_dict(self, path):
+        """
+        Memory-mapped state dict of a .pth checkpoint (not cached).
+        """
+        import torch
+
+        checkpoint = torch.load(
+            path, map_location=torch.device("cpu"), mmap=True
+        )
+        return checkpoint["state_dict"]
+
+    def _load(self, path):
+        if path.endswith(".onnx"):
+            from onnxruntime import InferenceSession
+
+            session = InferenceSession(
+                path, providers=["CPUExecutionProvider"]
+            )
+            return session, os.path.getsize(path)
+
+        from utils.models import fcn2_from_state_dict
+
+        model = fcn2_from_state_dict(self.state_dict(path), assign=True)
+        model.eval()
+        nbytes = sum(
+            t.numel() * t.element_size()
+            for t in list(model.parameters()) + list(model.buffers())
+        )
+        return model, nbytes
+
+    def get(self, path):
+        """
+        Model (.pth) or InferenceSession (.onnx) of `path`, loaded at most
+        once per content hash even when several threads ask concurrently.
+        """
+        key = self.key(path)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            future = self._loading.get(key)
+            owner = future is None
+            if owner:
+                future = self._loading[key] = Future()
+                self.misses += 1
+        if not owner:
+            return future.result()
+
+        try:
+            obj, nbytes = self._load(path)
+        except BaseException as e:
+            with self._lock:
+                del self._loading[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._loading[key]
+            # Older contents of the same file will not be asked for again
+            for stale in [k for k in self._entries if k[0] == key[0]]:
+                del self._entries[stale]
+            self._entries[key] = (obj, nbytes)
+            self._evict()
+        future.set_result(obj)
+        return obj
+
+    def _evict(self):
+        # Called with the lock held; the newest entry always stays
+        total = sum(nbytes for _, nbytes in self._entries.values())
+        while total > self.max_bytes and len(self._entries) > 1:
+            _, (_, nbytes) = self._entries.popitem(last=False)
+            total -= nbytes
+            self.evictions += 1
+
+    def prewarm(self, paths):
+        """
+        Load `paths` in the background. Returns the futures.
+        """
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(
+                max_workers=self.n_workers, thread_name_prefix="prewarm"
+            )
+        return [self._pool.submit(self.get, path) for path in paths]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def summary(self):
+        return (
+            f"{len(self._entries)} models, {self.nbytes / 2**20:.1f} MiB, "
+            f"{self.hits} hits, {self.misses} misses, "
+            f"{self.evictions} evictions"
+        )
+
+
+MODELS = ModelRegistry()
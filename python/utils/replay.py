@@ -0,0 +1,193 @@
+import json
+
+import numpy as np
+
+
+class ReplayBuffer:
+    """
+    Fixed-size store of labelled windows for continual fine-tuning.
+
+    Every class has its own reservoir of `quotas[c] * capacity` slots filled
+    by reservoir sampling: after any number of `add` calls each reservoir
+    holds a uniform random sample of all the windows of that class seen so
+    far, so months-old seizures are kept with the same probability as
+    yesterday's. Memory is allocated once, in `dtype` (float16 by default).
+
+    Items can be raw (C, T) windows or cached features (e.g. the
+    (n_filters, 16) output of `FCN2.get_features`, see `feature_fn`), which
+    are about 9x smaller and only need a head-only training graph
+    (`build_training_artifacts(..., head_only=True)`).
+    """
+
+    def __init__(
+        self,
+        capacity,
+        item_shape=(18, 1024),
+        quotas=None,
+        dtype=np.float16,
+        seed=0,
+    ):
+        """
+        Args:
+            capacity (int): Total number of stored items.
+            item_shape (tuple): Shape of one item.
+            quotas (dict, optional): Share of the capacity per class,
+                                     defaults to half seizure, half not.
+            dtype: Storage dtype.
+            seed (int): Seed of the reservoir draws.
+        """
+        quotas = quotas or {0: 0.5, 1: 0.5}
+        self.classes = sorted(quotas)
+        sizes = [int(capacity * quotas[c]) for c in self.classes]
+        sizes[0] += capacity - sum(sizes)  # rounding leftovers
+        offsets = np.concatenate([[0], np.cumsum(sizes)])
+        # Slots [offset, offset + size) of `items` belong to a class
+        self.slots = {
+            c: (int(offsets[i]), sizes[i]) for i, c in enumerate(self.classes)
+        }
+        self.items = np.zeros((capacity, *item_shape), dtype=dtype)
+        self.seen = {c: 0 for c in self.classes}
+        self.rng = np.random.default_rng(seed)
+
+    @property
+    def capacity(self):
+        return len(self.items)
+
+    @property
+    def nbytes(self):
+        return self.items.nbytes
+
+    def count(self, c):
+        return min(self.seen[c], self.slots[c][1])
+
+    def __len__(self):
+        return sum(self.count(c) for c in self.classes)
+
+    def add(self, items, labels):
+        """
+        Offer a batch of items; every class is handled with one vectorised
+        Algorithm R step (later items win slot collisions, as they would
+        one at a time). Items of classes without a quota are ignored.
+        """
+        labels = np.asarray(labels)
+        for c in self.classes:
+            idx = np.flatnonzero(labels == c)
+            if len(idx) == 0:
+                continue
+            offset, size = self.slots[c]
+            # Position of every new item in the class stream
+            position = self.seen[c] + np.arange(len(idx))
+            slot = np.where(
+                position < size,
+                position,
+                self.rng.integers(0, position + 1),
+            )
+            keep = slot < size
+            self.items[offset + slot[keep]] = items[idx[keep]]
+            self.seen[c] += len(idx)
+
+    def _indices(self, c):
+        offset, _ = self.slots[c]
+        return offset + np.arange(self.count(c))
+
+    def batches(self, batch_size=32, n_batches=10, pos_ratio=0.5, seed=None):
+        """
+        `n_batches` random (data, target) batches for
+        `OrtTrainer.train_epoch`: float32 items and int64 labels. The cost
+        of a round only depends on `n_batches * batch_size`, never on how
+        much history went through the buffer.
+
+        Args:
+            pos_ratio (float): Share of seizure (class 1) items per batch,
+                               when both classes are available.
+        """
+        rng = np.random.default_rng(seed) if seed is not None else self.rng
+        pools = {c: self._indices(c) for c in self.classes}
+        pools = {c: idx for c, idx in pools.items() if len(idx)}
+        if not pools:
+            raise ValueError("the replay buffer is empty")
+        n_pos = int(round(batch_size * pos_ratio)) if 1 in pools else 0
+        if len(pools) == 1:
+            n_pos = batch_size if 1 in pools else 0
+        negatives = [c for c in pools if c != 1]
+
+        for _ in range(n_batches):
+            idx = []
+            if n_pos:
+                idx.append(rng.choice(pools[1], n_pos))
+            if batch_size - n_pos:
+                pool = np.concatenate([pools[c] for c in negatives])
+                idx.append(rng.choice(pool, batch_size - n_pos))
+            idx = np.sort(np.concatenate(idx))
+            yield (
+                self.items[idx].astype(np.float32),
+                self.labels_of(idx),
+            )
+
+    def labels_of(self, idx):
+        labels = np.empty(len(idx), dtype=np.int64)
+        for c, (offset, size) in self.slots.items():
+            labels[(idx >= offset) & (idx < offset + size)] = c
+        return labels
+
+    def save(self, path):
+        # Only the filled slots are written
+        filled = np.concatenate([self._indices(c) for c in self.classes])
+        np.savez(
+            path,
+            items=self.items[filled],
+            labels=self.labels_of(filled),
+            classes=np.array(self.classes),
+            sizes=np.array([self.slots[c][1] for c in self.classes]),
+            seen=np.array([self.seen[c] for c in self.classes]),
+            rng=np.array(json.dumps(self.rng.bit_generator.state)),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            classes = [int(c) for c in f["classes"]]
+            sizes = f["sizes"]
+            capacity = int(sizes.sum())
+            buffer = cls(
+                capacity,
+                f["items"].shape[1:],
+                quotas={c: s / capacity for c, s in zip(classes, sizes)},
+                dtype=f["items"].dtype,
+            )
+            # Quotas were stored as exact slot counts
+            offsets = np.concatenate([[0], np.cumsum(sizes)])
+            buffer.slots = {
+                c: (int(offsets[i]), int(sizes[i]))
+                for i, c in enumerate(classes)
+            }
+            buffer.seen = {c: int(n) for c, n in zip(classes, f["seen"])}
+            items, labels = f["items"], f["labels"]
+            for c in classes:
+                stored = items[labels == c]
+                offset = buffer.slots[c][0]
+                buffer.items[offset:offset + len(stored)] = stored
+            buffer.rng.bit_generator.state = json.loads(str(f["rng"]))
+        return buffer
+
+
+def feature_fn(model, batch_size=256):
+    """
+    NumPy (B, C, T) -> (B, n_filters, 16) `get_features` of a torch FCN2,
+    to store features instead of windows.
+    """
+    import torch
+
+    model.eval()
+
+    def features(batch):
+        out = []
+        with torch.no_grad():
+            for start in range(0, len(batch), batch_size):
+                x = torch.from_numpy(
+                    np.asarray(batch[start:start + batch_size], np.float32)
+                )
+                out.append(model.get_features(x).numpy())
+        return np.concatenate(out)
+
+    return features
@@ -0,0 +1,149 @@
+import numpy as np
+from torch.utils.data import Sampler
+
+from utils.binfile import read_bin_labels
+
+
+def _index_dtype(n):
+    return np.int32 if n < np.iinfo(np.int32).max else np.int64
+
+
+class BalancedBatchSampler(Sampler):
+    """
+    Batch sampler drawing a fixed share of seizure windows in every batch.
+
+    The per-class index arrays are built once; each batch is then drawn in
+    O(batch_size) by sampling positions (with replacement) in those arrays,
+    so nothing proportional to the dataset is materialised per epoch.
+    Use with `DataLoader(dataset, batch_sampler=sampler)`.
+    """
+
+    def __init__(
+        self, labels, batch_size, pos_ratio=0.25, num_batches=None, seed=0
+    ):
+        """
+        Args:
+            labels (numpy.ndarray): Labels of the dataset the sampler indexes
+                                    (e.g. `labels[subset.indices]`).
+            batch_size (int): Windows per batch.
+            pos_ratio (float): Fraction of positive windows per batch.
+            num_batches (int, optional): Batches per epoch, defaults to
+                                         len(labels) // batch_size.
+            seed (int): Base seed, combined with the epoch number.
+        """
+        labels = np.asarray(labels)
+        dtype = _index_dtype(len(labels))
+        self.pos_idx = np.flatnonzero(labels == 1).astype(dtype)
+        self.neg_idx = np.flatnonzero(labels != 1).astype(dtype)
+        if len(self.neg_idx) == 0:
+            raise ValueError("BalancedBatchSampler needs negative samples")
+
+        self.batch_size = batch_size
+        self.n_pos = 0
+        if len(self.pos_idx):
+            self.n_pos = min(
+                batch_size - 1, max(1, round(batch_size * pos_ratio))
+            )
+        self.num_batches = num_batches or max(1, len(labels) // batch_size)
+        self.seed = seed
+        self.epoch = 0
+        self.start = 0
+
+    @classmethod
+    def from_bin(cls, filename, batch_size, indices=None, **kwargs):
+        """
+        Build the sampler from the label section of a .bin file only; the
+        data section is never read. `indices` restricts it to a subset
+        (e.g. the training part of a `random_split`).
+        """
+        labels = read_bin_labels(filename)
+        if labels is None:
+            raise ValueError(f"{filename} has no labels")
+        if indices is not None:
+            labels = labels[np.asarray(indices)]
+        return cls(labels, batch_size, **kwargs)
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def skip(self, n_batches):
+        """
+        Start the next iteration `n_batches` into the epoch (to resume an
+        interrupted one). The skipped batches are drawn but never loaded.
+        """
+        self.start = n_batches
+
+    def state_dict(self):
+        return {"seed": self.seed, "epoch": self.epoch}
+
+    def load_state_dict(self, state):
+        self.seed = state["seed"]
+        self.epoch = state["epoch"]
+
+    def __len__(self):
+        return self.num_batches
+
+    def __iter__(self):
+        rng = np.random.default_rng([self.seed, self.epoch])
+        n_neg = self.batch_size - self.n_pos
+        start, self.start = self.start, 0
+        for i in range(self.num_batches):
+            pos = self.pos_idx[:0]
+            if self.n_pos:
+                pos = self.pos_idx[
+                    rng.integers(0, len(self.pos_idx), self.n_pos)
+                ]
+            neg = self.neg_idx[rng.integers(0, len(self.neg_idx), n_neg)]
+            batch = np.concatenate([pos, neg])
+            rng.shuffle(batch)
+            if i >= start:
+                yield batch.tolist()
+        self.epoch += 1
+
+
+class ResumableRandomSampler(Sampler):
+    """
+    Drop-in replacement for `DataLoader(..., shuffle=True)` whose order only
+    depends on (seed, epoch), so an interrupted epoch can be replayed
+    exactly and resumed in the middle.
+    Use with `DataLoader(dataset, batch_size=..., sampler=sampler)`.
+    """
+
+    def __init__(self, n_samples, seed=0):
+        """
+        Args:
+            n_samples (int): Length of the dataset the sampler indexes.
+            seed (int): Base seed, combined with the epoch number.
+        """
+        self.n_samples = n_samples
+        self.seed = seed
+        self.epoch = 0
+        self.start = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def skip(self, n_samples):
+        """
+        Start the next iteration after the first `n_samples` indices.
+        """
+        self.start = n_samples
+
+    def state_dict(self):
+        return {"seed": self.seed, "epoch": self.epoch}
+
+    def load_state_dict(self, state):
+        self.seed = state["seed"]
+        self.epoch = state["epoch"]
+
+    def __len__(self):
+        return self.n_samples
+
+    def __iter__(self):
+        rng = np.random.default_rng([self.seed, self.epoch])
+        order = rng.permutation(self.n_samples).astype(
+            _index_dtype(self.n_samples)
+        )
+        start, self.start = self.start, 0
+        yield from order[start:].tolist()
+        self.epoch += 1
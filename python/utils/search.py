@@ -0,0 +1,270 @@
+import hashlib
+import itertools
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, Subset
+
+from utils.binfile import load_arrays_and_labels_memmap
+from utils.dataset import SeizureDataset
+from utils.models import FCN2, FCN2Head
+from utils.pruning import prune_fcn2
+from utils.tools import train
+
+
+DEFAULT_SPACE = {
+    "lr": [1e-3, 3e-4, 1e-4, 3e-5],
+    "batch_size": [32, 64, 128],
+    "n_filters": [128, 64, 32],
+    "unfreeze": [0, 1, 2, 3],
+}
+
+# Conv blocks in the order they are unfrozen, starting from the classifier
+_BLOCKS = [
+    ("conv3", "bn3"),
+    ("conv2", "bn2"),
+    ("conv1", "bn1"),
+]
+
+
+def sample_configs(space, n_trials, seed=0):
+    """
+    Random sample (without repetition) of the grid spanned by `space`.
+    """
+    keys = sorted(space)
+    grid = list(itertools.product(*(space[k] for k in keys)))
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(grid))[:n_trials]
+    return [dict(zip(keys, grid[i])) for i in order]
+
+
+class MedianPruner:
+    """
+    Stop a trial whose validation F1 after an epoch is below the median of
+    what the other trials reached after the same epoch.
+
+    The history lives in a `multiprocessing.Manager` dict so that trials
+    running in different processes see each other's progress.
+    """
+
+    def __init__(self, history, lock, warmup_epochs=2, min_trials=3):
+        self.history = history
+        self.lock = lock
+        self.warmup_epochs = warmup_epochs
+        self.min_trials = min_trials
+
+    def report(self, epoch, val_f1):
+        with self.lock:
+            previous = list(self.history.get(epoch, []))
+            self.history[epoch] = previous + [val_f1]
+        if epoch < self.warmup_epochs or len(previous) < self.min_trials:
+            return False
+        return val_f1 < float(np.median(previous))
+
+
+_cache = {}
+
+
+def _open(filename):
+    # One memmap per file and process, shared by every trial of the worker
+    if filename not in _cache:
+        _cache[filename] = load_arrays_and_labels_memmap(filename)
+    return _cache[filename]
+
+
+def _build_model(checkpoint, n_filters, unfreeze):
+    model = FCN2(in_channels=18)
+    model.load_state_dict(
+        torch.load(checkpoint, map_location=torch.device("cpu"))["state_dict"]
+    )
+    if n_filters < model.conv1.out_channels:
+        model = prune_fcn2(model, n_filters)
+
+    for param in model.parameters():
+        param.requires_grad = False
+    for param in model.classifier.parameters():
+        param.requires_grad = True
+    for conv, bn in _BLOCKS[:unfreeze]:
+        for param in itertools.chain(
+            getattr(model, conv).parameters(), getattr(model, bn).parameters()
+        ):
+            param.requires_grad = True
+    return model
+
+
+def _features(model, data, cache_dir, key):
+    """
+    `get_features` of the frozen backbone over all windows, cached on disk
+    so every classifier-only trial with the same width reuses them.
+    """
+    path = os.path.join(cache_dir, f"features_{key}.npy")
+    if os.path.exists(path):
+        return np.load(path, mmap_mode="r")
+
+    model.eval()
+    chunks = []
+    with torch.no_grad():
+        for start in range(0, len(data), 256):
+            batch = np.ascontiguousarray(data[start:start + 256])
+            batch = torch.from_numpy(batch)
+            chunks.append(model.get_features(batch).numpy())
+    features = np.concatenate(chunks)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = path + f".{os.getpid()}.tmp.npy"
+    np.save(tmp_path, features)
+    os.replace(tmp_path, path)
+    return np.load(path, mmap_mode="r")
+
+
+def _cache_key(data_file, checkpoint, n_filters):
+    parts = [n_filters]
+    for path in (data_file, checkpoint):
+        stat = os.stat(path)
+        parts += [os.path.abspath(path), stat.st_size, stat.st_mtime_ns]
+    source = ":".join(str(part) for part in parts)
+    return hashlib.sha256(source.encode()).hexdigest()[:16]
+
+
+def run_trial(trial_id, config, settings, history, lock):
+    """
+    Train one configuration and report its best validation F1.
+
+    Args:
+        trial_id (int): Index of the trial.
+        config (dict): lr, batch_size, n_filters and unfreeze (number of
+                       conv blocks trained on top of the classifier).
+        settings (dict): data_file, checkpoint, epochs, patience,
+                         val_fraction, cache_dir, output_dir.
+        history, lock: Shared state of the `MedianPruner`.
+    """
+    start_time = time.perf_counter()
+    data, labels = _open(settings["data_file"])
+    n_val = max(1, int(len(data) * settings.get("val_fraction", 0.2)))
+    train_idx = range(0, len(data) - n_val)
+    val_idx = range(len(data) - n_val, len(data))
+
+    model = _build_model(
+        settings["checkpoint"], config["n_filters"], config["unfreeze"]
+    )
+    if config["unfreeze"] == 0:
+        # Backbone is frozen: train the classifier on cached features
+        features = _features(
+            model,
+            data,
+            settings.get("cache_dir", "cache"),
+            _cache_key(
+                settings["data_file"],
+                settings["checkpoint"],
+                config["n_filters"],
+            ),
+        )
+        dataset = SeizureDataset(features, labels)
+        model_to_train = FCN2Head(model)
+    else:
+        dataset = SeizureDataset(data, labels)
+        model_to_train = model
+
+    train_loader = DataLoader(
+        Subset(dataset, train_idx),
+        batch_size=config["batch_size"],
+        shuffle=True,
+    )
+    val_loader = DataLoader(
+        Subset(dataset, val_idx), batch_size=256, shuffle=False
+    )
+
+    pruner = MedianPruner(history, lock)
+    pruned = []
+
+    def callback(epoch, val_f1, metrics):
+        if pruner.report(epoch, val_f1):
+            pruned.append(epoch + 1)
+            return True
+        return False
+
+    output_dir = settings.get("output_dir", "models/search")
+    os.makedirs(output_dir, exist_ok=True)
+    best_f1 = train(
+        train_loader,
+        val_loader,
+        model_to_train,
+        device="cpu",
+        epochs=settings.get("epochs", 20),
+        patience=settings.get("patience", 5),
+        save_path=os.path.join(output_dir, f"trial_{trial_id}.pth"),
+        lr=config["lr"],
+        callback=callback,
+    )
+
+    return {
+        "trial": trial_id,
+        **config,
+        "f1": best_f1,
+        "pruned_at": pruned[0] if pruned else None,
+        "seconds": time.perf_counter() - start_time,
+    }
+
+
+def _init_worker(threads_per_worker):
+    torch.set_num_threads(threads_per_worker)
+
+
+def run_search(configs, settings, n_workers=None, threads_per_worker=1):
+    """
+    Run the trials concurrently, `threads_per_worker` torch threads each.
+
+    Returns:
+        list: Trial results sorted by best validation F1.
+    """
+    if n_workers is None:
+        n_workers = max(1, (os.cpu_count() or 1) // threads_per_worker)
+    context = multiprocessing.get_context("spawn")
+    with context.Manager() as manager:
+        history = manager.dict()
+        lock = manager.Lock()
+        with ProcessPoolExecutor(
+            max_workers=min(n_workers, len(configs)),
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(threads_per_worker,),
+        ) as pool:
+            futures = [
+                pool.submit(run_trial, i, config, settings, history, lock)
+                for i, config in enumerate(configs)
+            ]
+            results = [future.result() for future in futures]
+
+    return sorted(results, key=lambda r: r["f1"], reverse=True)
+
+
+def format_search_report(results, wall_clock):
+    header = (
+        f"{'trial':>5} {'lr':>8} {'batch':>5} {'filters':>7} "
+        f"{'unfreeze':>8} {'F1':>7} {'pruned':>6} {'sec':>7}"
+    )
+    lines = [header, "-" * len(header)]
+    for r in results:
+        pruned = "-" if r["pruned_at"] is None else f"@{r['pruned_at']}"
+        lines.append(
+            f"{r['trial']:>5} {r['lr']:>8.0e} {r['batch_size']:>5} "
+            f"{r['n_filters']:>7} {r['unfreeze']:>8} {r['f1']:>7.4f} "
+            f"{pruned:>6} {r['seconds']:>7.1f}"
+        )
+    best = results[0]
+    cpu_seconds = sum(r["seconds"] for r in results)
+    lines.append("-" * len(header))
+    lines.append(
+        f"best: lr={best['lr']:.0e}, batch_size={best['batch_size']}, "
+        f"n_filters={best['n_filters']}, unfreeze={best['unfreeze']} "
+        f"(F1 = {best['f1']:.4f})"
+    )
+    lines.append(
+        f"wall-clock: {wall_clock:.1f} s, summed trial time: "
+        f"{cpu_seconds:.1f} s"
+    )
+    return "\n".join(lines)
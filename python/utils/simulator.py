@@ -0,0 +1,332 @@
+import heapq
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from utils.binfile import load_arrays_and_labels_memmap
+
+
+DEFAULT_CONFIG = {
+    "name": "default",
+    "fs": 256,
+    "window": 1024,  # samples per inference window
+    "hop": 256,  # samples between two window starts
+    "batch_size": 1,  # windows per inference call
+    "packet_samples": 32,  # samples per BLE notification
+    "buffer_s": 30.0,  # ring buffer on the phone
+    "train_every_s": 0.0,  # ORT fine-tuning period, 0 disables it
+    "train_steps": 10,  # optimizer steps per fine-tuning round
+    "train_batch": 32,
+    "reload_after_training": True,  # export + reload the inference model
+    "alarm_consecutive": 1,  # positive windows in a row to raise an alarm
+    "slowdown": 1.0,  # device time per host second
+    "threads": 1,
+    "max_seconds": None,  # only replay the start of the recording
+    "inference_model": "inference_artifacts/inference.onnx",
+    "training_artifacts": "training_artifacts",
+}
+
+_PACKET, _TRAIN, _DONE = 0, 1, 2
+
+
+class _Signal:
+    """
+    Continuous view of a .bin file whose windows are consecutive and do not
+    overlap, as they are cut on the device.
+    """
+
+    def __init__(self, filename):
+        self.data, self.labels = load_arrays_and_labels_memmap(filename)
+        self.stored_window = self.data.shape[2]
+        self.n_samples = len(self.data) * self.stored_window
+
+    def window(self, start, length):
+        out = np.empty((self.data.shape[1], length), dtype=np.float32)
+        done = 0
+        while done < length:
+            i, offset = divmod(start + done, self.stored_window)
+            n = min(length - done, self.stored_window - offset)
+            out[:, done:done + n] = self.data[i, :, offset:offset + n]
+            done += n
+        return out
+
+    def episodes(self):
+        # Runs of positive stored windows as [start, stop) sample ranges
+        if self.labels is None:
+            return np.zeros((0, 2), dtype=np.int64)
+        positive = np.concatenate([[0], self.labels == 1, [0]])
+        edges = np.flatnonzero(np.diff(positive.astype(np.int8)))
+        return edges.reshape(-1, 2) * self.stored_window
+
+
+class _Models:
+    """
+    The real models: `inference.onnx` through onnxruntime and, when
+    fine-tuning is enabled, the ORT training artifacts.
+    """
+
+    def __init__(self, config):
+        from onnxruntime import InferenceSession, SessionOptions
+
+        self.config = config
+        self.options = SessionOptions()
+        self.options.intra_op_num_threads = config["threads"]
+        self.session = InferenceSession(
+            config["inference_model"],
+            self.options,
+            providers=["CPUExecutionProvider"],
+        )
+        self.trainer = None
+        if config["train_every_s"]:
+            try:
+                from utils.ort_training import OrtTrainer
+            except ImportError:
+                print(
+                    f"{config['name']}: onnxruntime-training is not "
+                    "installed, fine-tuning rounds are skipped"
+                )
+                return
+            self.trainer = OrtTrainer(config["training_artifacts"])
+            fd, self.exported = tempfile.mkstemp(suffix=".onnx")
+            os.close(fd)
+
+    def predict(self, batch):
+        logits = self.session.run(["output"], {"input": batch})[0]
+        return logits.argmax(axis=1)
+
+    def fine_tune(self, signal, available, rng):
+        from onnxruntime import InferenceSession
+
+        for _ in range(self.config["train_steps"]):
+            idx = np.sort(rng.choice(available, self.config["train_batch"]))
+            data = np.ascontiguousarray(signal.data[idx])
+            target = np.asarray(signal.labels[idx], dtype=np.int64)
+            self.trainer.train_step(data, target)
+        if self.config["reload_after_training"]:
+            # What the app does after a round: new model, new session
+            self.trainer.export_model_for_inferencing(self.exported)
+            self.session = InferenceSession(
+                self.exported,
+                self.options,
+                providers=["CPUExecutionProvider"],
+            )
+
+    def close(self):
+        if self.trainer is not None:
+            os.remove(self.exported)
+
+
+def _run_job(job):
+    # Run a job for real; returns (host wall seconds, CPU seconds, result)
+    cpu, wall = time.process_time(), time.perf_counter()
+    result = job()
+    return time.perf_counter() - wall, time.process_time() - cpu, result
+
+
+def simulate(filename, config=None):
+    """
+    Discrete-event simulation of the phone pipeline on a replayed recording.
+
+    Samples arrive in BLE packets at the real sample rate (simulated clock).
+    Every `hop` samples a window is queued; every `batch_size` windows an
+    inference job is submitted to a single compute core, which also runs
+    the periodic fine-tuning rounds (inference first). Jobs execute for real
+    and take their measured time times `slowdown` on the simulated clock.
+    Windows whose samples were overwritten in the ring buffer before their
+    job started are dropped.
+
+    Returns:
+        dict: Detection latency per seizure episode, CPU seconds per hour of
+              recording, peak RSS and queueing statistics.
+    """
+    config = dict(DEFAULT_CONFIG, **(config or {}))
+    fs, window, hop = config["fs"], config["window"], config["hop"]
+    signal = _Signal(filename)
+    models = _Models(config)
+    rng = np.random.default_rng(0)
+
+    n_samples = signal.n_samples
+    if config["max_seconds"]:
+        n_samples = min(n_samples, int(config["max_seconds"] * fs))
+    capacity = int(config["buffer_s"] * fs)
+
+    events = []
+    seq = 0
+
+    def push(t, kind, payload=None):
+        nonlocal seq
+        heapq.heappush(events, (t, seq, kind, payload))
+        seq += 1
+
+    packet = config["packet_samples"]
+    for end in range(packet, n_samples + packet, packet):
+        push(min(end, n_samples) / fs, _PACKET, min(end, n_samples))
+    if models.trainer is not None:
+        period = config["train_every_s"]
+        for k in range(1, int(n_samples / fs / period) + 1):
+            push(k * period, _TRAIN)
+
+    received = 0
+    next_window = 0
+    pending = []  # window starts waiting for a batch
+    inference_jobs = []  # batches of window starts
+    training_jobs = 0
+    busy = False
+    stats = {
+        "windows": 0,
+        "cpu_seconds": 0.0,
+        "inference_cpu": 0.0,
+        "training_cpu": 0.0,
+        "max_lag": 0.0,
+        "max_queue": 0,
+    }
+    alarms = []  # (time, window start)
+    streak = 0
+
+    def start_next(now):
+        # Skip jobs with nothing left to do until one actually starts, or
+        # the core would idle with work queued
+        nonlocal busy, training_jobs
+        oldest = received - capacity
+        while inference_jobs or training_jobs:
+            if inference_jobs:
+                # Samples older than the ring buffer are gone: drop them
+                starts = [s for s in inference_jobs.pop(0) if s >= oldest]
+                if not starts:
+                    continue
+                batch = np.stack([signal.window(s, window) for s in starts])
+                wall, cpu, preds = _run_job(lambda: models.predict(batch))
+                stats["inference_cpu"] += cpu
+                done = ("infer", starts, preds)
+            else:
+                training_jobs -= 1
+                available = np.arange(received // signal.stored_window)
+                if len(available) == 0:
+                    continue
+                wall, cpu, _ = _run_job(
+                    lambda: models.fine_tune(signal, available, rng)
+                )
+                stats["training_cpu"] += cpu
+                done = ("train", None, None)
+            push(now + wall * config["slowdown"], _DONE, done)
+            stats["cpu_seconds"] += cpu
+            busy = True
+            return
+
+    while events:
+        now, _, kind, payload = heapq.heappop(events)
+        if kind == _PACKET:
+            received = payload
+            while next_window + window <= received:
+                pending.append(next_window)
+                next_window += hop
+            while len(pending) >= config["batch_size"]:
+                inference_jobs.append(pending[: config["batch_size"]])
+                pending = pending[config["batch_size"]:]
+            if received == n_samples and pending:
+                inference_jobs.append(pending)
+                pending = []
+        elif kind == _TRAIN:
+            training_jobs += 1
+        else:
+            busy = False
+            job, starts, preds = payload
+            if job == "infer":
+                stats["windows"] += len(starts)
+                for start, pred in zip(starts, preds):
+                    # Lag: window fully received -> its prediction
+                    stats["max_lag"] = max(
+                        stats["max_lag"], now - (start + window) / fs
+                    )
+                    streak = streak + 1 if pred == 1 else 0
+                    if streak >= config["alarm_consecutive"]:
+                        alarms.append((now, start))
+        queued = sum(len(j) for j in inference_jobs)
+        stats["max_queue"] = max(stats["max_queue"], queued)
+        if not busy:
+            start_next(now)
+
+    models.close()
+    expected = len(range(0, n_samples - window + 1, hop))
+    stats["dropped"] = expected - stats["windows"]
+    hours = n_samples / fs / 3600.0
+
+    latencies = []
+    missed = 0
+    episodes = signal.episodes()
+    for onset, stop in episodes:
+        if onset >= n_samples:
+            continue
+        hits = [t for t, s in alarms if s < stop and s + window > onset]
+        if hits:
+            latencies.append(min(hits) - onset / fs)
+        else:
+            missed += 1
+
+    return {
+        "name": config["name"],
+        "hop": hop,
+        "batch_size": config["batch_size"],
+        "train_every_s": config["train_every_s"],
+        "hours": hours,
+        "windows": stats["windows"],
+        "dropped": stats["dropped"],
+        "episodes": len(latencies) + missed,
+        "missed": missed,
+        "latency_mean": float(np.mean(latencies)) if latencies else None,
+        "latency_max": float(np.max(latencies)) if latencies else None,
+        "false_alarms": sum(
+            1
+            for _, s in alarms
+            if not ((s < episodes[:, 1]) & (s + window > episodes[:, 0])).any()
+        ),
+        "cpu_s_per_hour": stats["cpu_seconds"] * config["slowdown"] / hours,
+        "inference_cpu_s": stats["inference_cpu"],
+        "training_cpu_s": stats["training_cpu"],
+        "max_lag": stats["max_lag"],
+        "max_queue": stats["max_queue"],
+        "buffer_bytes": capacity * signal.data.shape[1] * 4,
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        / 1024.0,
+    }
+
+
+def run_simulations(filename, configs):
+    """
+    Simulate every configuration in a fresh process (one after the other so
+    they do not compete for the CPU), which makes the peak RSS of each run
+    its own.
+    """
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for config in configs:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            results.append(pool.submit(simulate, filename, config).result())
+    return results
+
+
+def format_simulation_report(results):
+    header = (
+        f"{'config':<16} {'hop':>5} {'batch':>5} {'train/s':>7} "
+        f"{'lat mean':>8} {'lat max':>8} {'missed':>6} {'false':>5} "
+        f"{'CPU-s/h':>8} "
+        f"{'lag max':>8} {'dropped':>7} {'RSS MB':>7}"
+    )
+    lines = [header, "-" * len(header)]
+    for r in results:
+        mean = "-" if r["latency_mean"] is None else f"{r['latency_mean']:.2f}"
+        worst = "-" if r["latency_max"] is None else f"{r['latency_max']:.2f}"
+        lines.append(
+            f"{r['name']:<16} {r['hop']:>5} {r['batch_size']:>5} "
+            f"{r['train_every_s']:>7g} {mean:>8} {worst:>8} "
+            f"{r['missed']:>3}/{r['episodes']:<2} {r['false_alarms']:>5} "
+            f"{r['cpu_s_per_hour']:>8.1f} "
+            f"{r['max_lag']:>8.2f} {r['dropped']:>7} {r['peak_rss_mb']:>7.0f}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,204 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from utils.binfile import load_arrays_and_labels_memmap, read_bin_header
+
+
+DEFAULT_PERCENTILES = (0.5, 1, 5, 25, 50, 75, 95, 99, 99.5)
+
+
+class ChannelStats:
+    """
+    Mergeable per-channel statistics of (N, C, T) windows.
+
+    Mean and variance use the parallel form of Welford's algorithm (Chan et
+    al.), so shards can be processed independently and merged exactly.
+    Percentiles are estimated from a strided subsample of every chunk.
+    """
+
+    def __init__(self, n_channels):
+        self.count = 0
+        self.mean = np.zeros(n_channels)
+        self.m2 = np.zeros(n_channels)
+        self.min = np.full(n_channels, np.inf)
+        self.max = np.full(n_channels, -np.inf)
+        self.samples = []
+
+    def update(self, chunk, sample_stride=1):
+        """
+        Fold a chunk of windows of shape (n, C, T) into the statistics.
+        """
+        chunk = np.asarray(chunk, dtype=np.float64)
+        n = chunk.shape[0] * chunk.shape[2]
+        if n == 0:
+            return
+        mean = chunk.mean(axis=(0, 2))
+        m2 = ((chunk - mean[None, :, None]) ** 2).sum(axis=(0, 2))
+        self._merge(n, mean, m2)
+        self.min = np.minimum(self.min, chunk.min(axis=(0, 2)))
+        self.max = np.maximum(self.max, chunk.max(axis=(0, 2)))
+
+        per_channel = chunk.transpose(1, 0, 2).reshape(chunk.shape[1], -1)
+        sample = per_channel[:, ::sample_stride].astype(np.float32)
+        self.samples.append(sample)
+
+    def merge(self, other):
+        if other.count:
+            self._merge(other.count, other.mean, other.m2)
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+        self.samples.extend(other.samples)
+
+    def _merge(self, n, mean, m2):
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean = self.mean + delta * n / total
+        self.m2 = self.m2 + m2 + delta**2 * self.count * n / total
+        self.count = total
+
+    @property
+    def var(self):
+        return self.m2 / max(self.count, 1)
+
+    def to_dict(self, percentiles=DEFAULT_PERCENTILES):
+        sample = np.concatenate(self.samples, axis=1)
+        levels = np.percentile(sample, percentiles, axis=1).T
+        return {
+            "count": np.int64(self.count),
+            "mean": self.mean.astype(np.float32),
+            "var": self.var.astype(np.float32),
+            "std": np.sqrt(self.var).astype(np.float32),
+            "min": self.min.astype(np.float32),
+            "max": self.max.astype(np.float32),
+            "percentile_levels": np.asarray(percentiles, dtype=np.float32),
+            "percentiles": levels.astype(np.float32),  # (C, n_levels)
+        }
+
+
+def _shard_stats(filename, start, stop, chunk_size, sample_stride):
+    # Each worker maps the file itself, nothing large crosses processes
+    data, _ = load_arrays_and_labels_memmap(filename, cache=True)
+    stats = ChannelStats(data.shape[1])
+    for chunk_start in range(start, stop, chunk_size):
+        chunk_stop = min(chunk_start + chunk_size, stop)
+        stats.update(data[chunk_start:chunk_stop], sample_stride)
+    return stats
+
+
+def stats_path(filename):
+    return filename + ".stats.npz"
+
+
+def compute_channel_stats(
+    filename,
+    chunk_size=256,
+    n_workers=None,
+    max_samples=200_000,
+    percentiles=DEFAULT_PERCENTILES,
+):
+    """
+    Compute per-channel statistics of a .bin file in one chunked pass,
+    sharded over a process pool, and store them in a sidecar file.
+
+    Args:
+        filename (str): .bin file to scan.
+        chunk_size (int): Windows read at once by each worker.
+        n_workers (int, optional): Worker processes (default: CPU count).
+        max_samples (int): Approximate number of values per channel kept for
+                           the percentile estimates.
+        percentiles (tuple): Percentile levels to report.
+
+    Returns:
+        dict: Statistics as saved to `<filename>.stats.npz`.
+    """
+    num_arrays, n_channels, n_samples, _ = read_bin_header(filename)
+    # Time-major files get their channel-major copy here, not in every
+    # worker, and the workers map it instead of each transposing the file
+    load_arrays_and_labels_memmap(filename, cache=True)
+    n_workers = n_workers or os.cpu_count() or 1
+    sample_stride = max(1, -(-num_arrays * n_samples // max_samples))
+
+    bounds = np.linspace(0, num_arrays, n_workers + 1, dtype=np.int64)
+    shards = [
+        (int(start), int(stop))
+        for start, stop in zip(bounds[:-1], bounds[1:])
+        if stop > start
+    ]
+
+    stats = ChannelStats(n_channels)
+    if len(shards) <= 1:
+        stats.merge(
+            _shard_stats(filename, 0, num_arrays, chunk_size, sample_stride)
+        )
+    else:
+        with ProcessPoolExecutor(max_workers=len(shards)) as pool:
+            futures = [
+                pool.submit(
+                    _shard_stats,
+                    filename,
+                    start,
+                    stop,
+                    chunk_size,
+                    sample_stride,
+                )
+                for start, stop in shards
+            ]
+            # Merge in file order so results do not depend on scheduling
+            for future in futures:
+                stats.merge(future.result())
+
+    result = stats.to_dict(percentiles)
+    save_channel_stats(filename, result)
+    return result
+
+
+def save_channel_stats(filename, stats):
+    """
+    Write the sidecar, tagged with the size and mtime of the .bin file so a
+    rewritten file invalidates it.
+    """
+    source = os.stat(filename)
+    path = stats_path(filename)
+    tmp_path = path + ".tmp.npz"
+    np.savez(
+        tmp_path,
+        source_size=np.int64(source.st_size),
+        source_mtime_ns=np.int64(source.st_mtime_ns),
+        **stats,
+    )
+    os.replace(tmp_path, path)
+
+
+def load_channel_stats(filename):
+    """
+    Load the sidecar statistics of `filename`, or None if they are missing
+    or stale.
+    """
+    path = stats_path(filename)
+    if not os.path.exists(path):
+        return None
+    source = os.stat(filename)
+    with np.load(path) as f:
+        if (
+            int(f["source_size"]) != source.st_size
+            or int(f["source_mtime_ns"]) != source.st_mtime_ns
+        ):
+            return None
+        return {
+            key: f[key]
+            for key in f.files
+            if key not in ("source_size", "source_mtime_ns")
+        }
+
+
+def get_channel_stats(filename, **kwargs):
+    """
+    Sidecar statistics of `filename`, computed only if they are not cached.
+    """
+    stats = load_channel_stats(filename)
+    if stats is None:
+        print(f"Computing channel statistics of {filename}")
+        stats = compute_channel_stats(filename, **kwargs)
+    return stats
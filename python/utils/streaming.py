@@ -0,0 +1,266 @@
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from utils.binfile import (
+    HEADER_SIZE,
+    has_labels,
+    layout_of,
+    read_bin_header,
+    transpose_windows,
+)
+from utils.metrics import metrics_from_confusion
+from utils.telemetry import REGISTRY, InferenceMetrics
+
+
+class BinChunkReader:
+    """
+    Sequential reader of a .bin file in fixed-size chunks of windows.
+
+    A background thread `readinto`s the file into `n_buffers` preallocated
+    buffers while the caller processes the previous chunk (double
+    buffering with the default of 2). Nothing is memory-mapped and no
+    buffer is ever allocated per chunk, so the resident memory is bounded
+    by `n_buffers * chunk_size` windows whatever the size of the file.
+
+    Iterating yields (start, data, labels) where `data` is a view on one of
+    the reused buffers: it is only valid until the next chunk is requested.
+    Data is always channel-major (n, dim1, dim2); time-major files are
+    transposed chunk by chunk in the reader thread.
+    """
+
+    def __init__(self, filename, chunk_size=256, n_buffers=2):
+        self.filename = filename
+        self.chunk_size = chunk_size
+        self.n_buffers = n_buffers
+        header = read_bin_header(filename)
+        self.num_arrays, self.dim1, self.dim2, flags = header
+        self.has_labels = has_labels(flags)
+        self.time_major = layout_of(flags) == "time"
+        self.bytes_read = 0
+        self.queue_depth = REGISTRY.gauge(
+            "seizureguard_queue_depth", "Chunks read ahead of the model"
+        )
+        self.bytes_counter = REGISTRY.counter(
+            "seizureguard_bytes_read_total", "Bytes read from .bin files"
+        )
+
+    def __len__(self):
+        return self.num_arrays
+
+    def _read(self, free, filled, stop):
+        window_bytes = self.dim1 * self.dim2 * 4
+        labels_offset = HEADER_SIZE + self.num_arrays * window_bytes
+        scratch = None
+        if self.time_major:
+            scratch = np.empty((self.chunk_size, self.dim2, self.dim1), "<f4")
+        try:
+            with open(self.filename, "rb", buffering=0) as f:
+                f.seek(HEADER_SIZE)
+                for start in range(0, self.num_arrays, self.chunk_size):
+                    buffer = free.get()
+                    if stop.is_set():
+                        return
+                    count = min(self.chunk_size, self.num_arrays - start)
+                    target = buffer if scratch is None else scratch
+                    view = memoryview(target.reshape(-1).view(np.uint8))
+                    nbytes = count * window_bytes
+                    done = 0
+                    while done < nbytes:
+                        n = f.readinto(view[done:nbytes])
+                        if not n:
+                            raise ValueError(
+                                "Data is incomplete or file is corrupted."
+                            )
+                        done += n
+                    if scratch is not None:
+                        transpose_windows(scratch[:count], buffer[:count])
+
+                    labels = None
+                    if self.has_labels:
+                        raw = os.pread(
+                            f.fileno(), count * 4, labels_offset + start * 4
+                        )
+                        labels = np.frombuffer(raw, dtype="<i4")
+                        done += len(raw)
+                    self.bytes_read += done
+                    self.bytes_counter.inc(done)
+                    filled.put((start, count, buffer, labels))
+        except Exception as e:
+            filled.put(e)
+            return
+        filled.put(None)
+
+    def __iter__(self):
+        free = queue.Queue()
+        filled = queue.Queue()
+        stop = threading.Event()
+        for _ in range(self.n_buffers):
+            free.put(
+                np.empty((self.chunk_size, self.dim1, self.dim2), "<f4")
+            )
+        reader = threading.Thread(
+            target=self._read, args=(free, filled, stop), daemon=True
+        )
+        reader.start()
+        try:
+            while True:
+                item = filled.get()
+                self.queue_depth.set(filled.qsize())
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                start, count, buffer, labels = item
+                yield start, buffer[:count], labels
+                free.put(buffer)
+        finally:
+            # Unblock the reader if the caller stopped early
+            stop.set()
+            free.put(None)
+            reader.join()
+
+
+def torch_score_fn(model, device="cpu"):
+    """
+    Wrap a PyTorch model as a score function: float32 batch -> logits.
+    """
+    import torch
+
+    model.to(device)
+    model.eval()
+    telemetry = InferenceMetrics("torch")
+
+    def score(batch):
+        start = time.perf_counter()
+        with torch.no_grad():
+            logits = model(torch.from_numpy(batch).to(device)).cpu().numpy()
+        telemetry.record_model(len(batch), time.perf_counter() - start)
+        return logits
+
+    score.backend = "torch"
+    return score
+
+
+def onnx_score_fn(model_path, session=None):
+    """
+    Wrap an exported ONNX model (input "input", output "output"), or an
+    already created `session` of it.
+    """
+    if session is None:
+        from onnxruntime import InferenceSession
+
+        session = InferenceSession(
+            model_path, providers=["CPUExecutionProvider"]
+        )
+    telemetry = InferenceMetrics("onnx")
+
+    def score(batch):
+        start = time.perf_counter()
+        logits = session.run(["output"], {"input": batch})[0]
+        telemetry.record_model(len(batch), time.perf_counter() - start)
+        return logits
+
+    score.backend = "onnx"
+    return score
+
+
+def load_score_fn(model_path, registry=None):
+    """
+    Score function of a .onnx model or a .pth FCN2 checkpoint, taken from
+    `registry` (see `utils.registry.ModelRegistry`) if one is given.
+    """
+    if registry is not None:
+        model = registry.get(model_path)
+        if model_path.endswith(".onnx"):
+            return onnx_score_fn(model_path, session=model)
+        return torch_score_fn(model)
+    if model_path.endswith(".onnx"):
+        return onnx_score_fn(model_path)
+
+    import torch
+    from utils.models import fcn2_from_state_dict
+
+    model = fcn2_from_state_dict(
+        torch.load(model_path, map_location=torch.device("cpu"))["state_dict"]
+    )
+    return torch_score_fn(model)
+
+
+def stream_score(
+    filename,
+    score_fn,
+    out_path=None,
+    chunk_size=256,
+    n_buffers=2,
+    preprocess=None,
+):
+    """
+    Score every window of a .bin file with bounded memory.
+
+    Args:
+        filename (str): .bin file, possibly much larger than RAM.
+        score_fn (callable): float32 (n, C, T) batch -> (n, 2) logits, see
+                             `torch_score_fn` / `onnx_score_fn`.
+        out_path (str, optional): CSV of per-window predictions and logits,
+                                  appended to chunk by chunk.
+        chunk_size (int): Windows per read and per model call.
+        n_buffers (int): Read buffers (2: double buffering).
+        preprocess (callable, optional): Applied to each batch before
+                                         `score_fn` (e.g. z-scoring).
+
+    Returns:
+        dict: windows, bytes_read, seconds, windows_per_s, plus precision,
+              recall, f1 and fpr when the file has labels.
+    """
+    reader = BinChunkReader(filename, chunk_size, n_buffers)
+    confusion = np.zeros((2, 2), dtype=np.int64)
+    out = None
+    if out_path is not None:
+        directory = os.path.dirname(out_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        out = open(out_path, "w")
+        out.write("window,prediction,logit_0,logit_1\n")
+
+    telemetry = InferenceMetrics(getattr(score_fn, "backend", "custom"))
+    start_time = loaded = time.perf_counter()
+    try:
+        for start, batch, labels in reader:
+            telemetry.load_seconds.observe(time.perf_counter() - loaded)
+            if preprocess is not None:
+                batch = preprocess(batch)
+            logits = np.asarray(score_fn(batch))
+            done = time.perf_counter()
+            preds = logits.argmax(axis=1)
+            telemetry.record_predictions(preds)
+            if labels is not None:
+                cells = 2 * (labels == 1) + (preds == 1)
+                confusion += np.bincount(cells, minlength=4).reshape(2, 2)
+            if out is not None:
+                rows = np.column_stack(
+                    [np.arange(start, start + len(preds)), preds, logits]
+                )
+                np.savetxt(
+                    out, rows, fmt=["%d", "%d", "%.6f", "%.6f"], delimiter=","
+                )
+            loaded = time.perf_counter()
+            telemetry.postprocess_seconds.observe(loaded - done)
+    finally:
+        if out is not None:
+            out.close()
+    seconds = time.perf_counter() - start_time
+
+    result = {
+        "windows": len(reader),
+        "bytes_read": reader.bytes_read,
+        "seconds": seconds,
+        "windows_per_s": len(reader) / seconds if seconds > 0 else 0.0,
+    }
+    if reader.has_labels:
+        (tn, fp), (fn, tp) = confusion
+        result.update(metrics_from_confusion(tn, fp, fn, tp))
+    return result
@@ -0,0 +1,235 @@
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from utils.binfile import BinWriter
+
+
+# 18-channel bipolar "double banana" montage: four chains of four channels
+# (left/right temporal, left/right parasagittal) and Fz-Cz, Cz-Pz
+CHAINS = [
+    [0, 1, 2, 3],
+    [4, 5, 6, 7],
+    [8, 9, 10, 11],
+    [12, 13, 14, 15],
+    [16, 17],
+]
+FRONTAL = [0, 4, 8, 12]  # Fp1-F7, Fp2-F8, Fp1-F3, Fp2-F4: blink channels
+
+
+def _mixing_matrix(n_channels):
+    # Neighbouring derivations of a chain share a common electrode, which
+    # makes them correlated
+    mixing = np.eye(n_channels, dtype=np.float32)
+    for chain in CHAINS:
+        for a, b in zip(chain[:-1], chain[1:]):
+            if b < n_channels:
+                mixing[a, b] = mixing[b, a] = 0.4
+    return mixing / np.linalg.norm(mixing, axis=1, keepdims=True)
+
+
+def background(rng, n, n_channels=18, n_samples=1024, fs=256.0):
+    """
+    Band-limited (0.5-70 Hz) 1/f noise with an alpha peak around 10 Hz,
+    shaped in the frequency domain and spatially correlated along the
+    montage chains. Amplitudes are in microvolts.
+    """
+    freqs = np.fft.rfftfreq(n_samples, d=1.0 / fs).astype(np.float32)
+    alpha = rng.uniform(8.0, 12.0, size=(n, 1, 1)).astype(np.float32)
+    shape = 1.0 / np.maximum(freqs, 0.5) + 0.3 * np.exp(
+        -0.5 * ((freqs - alpha) / 1.0) ** 2
+    )
+    shape = shape * ((freqs >= 0.5) & (freqs <= 70.0))
+
+    # Complex white noise, drawn as interleaved real and imaginary parts
+    spectrum = rng.standard_normal(
+        (n, n_channels, len(freqs), 2), dtype=np.float32
+    ).view(np.complex64)[..., 0]
+    spectrum *= shape
+    signal = np.fft.irfft(spectrum, n=n_samples, axis=-1)
+    signal = np.matmul(_mixing_matrix(n_channels), signal)
+
+    # Expected std from the spectrum (Parseval; the mixing rows have unit
+    # norm), cheaper than measuring it on the signal
+    weight = np.full(len(freqs), 2.0, dtype=np.float32)
+    weight[0] = weight[-1] = 1.0
+    std = np.sqrt(2.0 * (weight * shape**2).sum(axis=-1, keepdims=True))
+    std = std / n_samples
+    gain = rng.uniform(10.0, 40.0, size=(n, n_channels, 1))
+    signal *= (gain / std).astype(np.float32)
+    return signal
+
+
+def add_artifacts(rng, signal, prob=0.05, fs=256.0):
+    """
+    Add eye blinks (slow bumps on the frontal channels), muscle bursts
+    (high-frequency noise) and electrode pops (spike with slow decay) to a
+    random `prob` share of the windows, in place.
+    """
+    n, n_channels, n_samples = signal.shape
+    t = np.arange(n_samples, dtype=np.float32)
+
+    blink = np.flatnonzero(rng.random(n) < prob)
+    if len(blink):
+        center = rng.uniform(0, n_samples, size=(len(blink), 1))
+        width = rng.uniform(0.1, 0.2, size=(len(blink), 1)) * fs
+        bump = np.exp(-0.5 * ((t - center) / width) ** 2)
+        amplitude = rng.uniform(80.0, 200.0, size=(len(blink), 1))
+        frontal = [c for c in FRONTAL if c < n_channels]
+        signal[blink[:, None], frontal] += (amplitude * bump)[:, None, :]
+
+    muscle = np.flatnonzero(rng.random(n) < prob)
+    if len(muscle):
+        start = rng.integers(0, n_samples // 2, size=(len(muscle), 1))
+        length = rng.integers(n_samples // 8, n_samples // 2, (len(muscle), 1))
+        burst = ((t >= start) & (t < start + length)).astype(np.float32)
+        noise = rng.standard_normal(
+            (len(muscle), n_channels, n_samples), dtype=np.float32
+        )
+        # First difference whitens the noise towards high frequencies
+        noise[..., 1:] -= noise[..., :-1].copy()
+        signal[muscle] += 15.0 * noise * burst[:, None, :]
+
+    pop = np.flatnonzero(rng.random(n) < prob)
+    if len(pop):
+        channel = rng.integers(0, n_channels, size=len(pop))
+        onset = rng.integers(0, n_samples, size=(len(pop), 1))
+        decay = np.where(t >= onset, np.exp(-(t - onset) / (0.3 * fs)), 0.0)
+        amplitude = rng.choice([-1.0, 1.0], size=(len(pop), 1)) * 300.0
+        signal[pop, channel] += (amplitude * decay).astype(np.float32)
+    return signal
+
+
+def add_seizures(rng, signal, labels, fs=256.0):
+    """
+    Add a rhythmic spike-and-wave discharge (3-8 Hz fundamental plus
+    harmonics, growing amplitude) on a focal group of channels of every
+    window whose label is 1, in place.
+    """
+    idx = np.flatnonzero(labels == 1)
+    if len(idx) == 0:
+        return signal
+    n_channels, n_samples = signal.shape[1:]
+    t = np.arange(n_samples, dtype=np.float32) / fs
+
+    f0 = rng.uniform(3.0, 8.0, size=(len(idx), 1))
+    phase = rng.uniform(0, 2 * np.pi, size=(len(idx), 1))
+    wave = (
+        np.sin(2 * np.pi * f0 * t + phase)
+        + 0.5 * np.sin(4 * np.pi * f0 * t + 2 * phase)
+        + 0.25 * np.sin(6 * np.pi * f0 * t + 3 * phase)
+    )
+    ramp = np.linspace(0.6, 1.0, n_samples, dtype=np.float32)
+    amplitude = rng.uniform(60.0, 150.0, size=(len(idx), 1))
+
+    # Focal onset: one chain, spreading to the others with lower gain
+    focus = rng.integers(0, len(CHAINS), size=len(idx))
+    involvement = rng.uniform(0.0, 0.4, size=(len(idx), n_channels))
+    for k, chain in enumerate(CHAINS):
+        chain = [c for c in chain if c < n_channels]
+        involvement[np.ix_(focus == k, chain)] = 1.0
+
+    discharge = (amplitude * wave * ramp).astype(np.float32)
+    signal[idx] += involvement[:, :, None].astype(np.float32) * discharge[
+        :, None, :
+    ]
+    return signal
+
+
+def episode_labels(rng, n, seizure_fraction=0.1, mean_length=20):
+    """
+    Window labels made of seizure episodes of consecutive windows (lengths
+    uniform in [mean_length / 2, 3 * mean_length / 2]) covering about
+    `seizure_fraction` of the recording.
+    """
+    labels = np.zeros(n, dtype=np.int32)
+    n_episodes = int(round(n * seizure_fraction / mean_length))
+    if n_episodes == 0:
+        return labels
+    lengths = rng.integers(
+        max(1, mean_length // 2), 3 * mean_length // 2 + 1, size=n_episodes
+    )
+    starts = rng.integers(0, max(1, n - lengths.max()), size=n_episodes)
+    # +1 at every start, -1 after every end, then a running sum
+    edges = np.zeros(n + 1, dtype=np.int32)
+    np.add.at(edges, starts, 1)
+    np.add.at(edges, np.minimum(starts + lengths, n), -1)
+    labels[np.cumsum(edges[:-1]) > 0] = 1
+    return labels
+
+
+def generate_windows(
+    rng,
+    labels,
+    n_channels=18,
+    n_samples=1024,
+    fs=256.0,
+    artifact_prob=0.05,
+):
+    """
+    Synthetic EEG windows of shape (len(labels), n_channels, n_samples).
+    """
+    signal = background(rng, len(labels), n_channels, n_samples, fs)
+    add_artifacts(rng, signal, artifact_prob, fs)
+    add_seizures(rng, signal, labels, fs)
+    return signal
+
+
+def write_synthetic_bin(
+    filename,
+    n_windows,
+    seed=0,
+    chunk_size=1024,
+    seizure_fraction=0.1,
+    artifact_prob=0.05,
+    n_channels=18,
+    n_samples=1024,
+    fs=256.0,
+    n_workers=None,
+):
+    """
+    Generate a labelled synthetic recording chunk by chunk straight into a
+    .bin file. Chunks are generated by a thread pool (NumPy releases the GIL
+    in the RNG, FFT and matmul) and written in order; at most two chunks per
+    worker are in memory at any time.
+
+    The output only depends on `seed` and `chunk_size`: every chunk uses
+    its own generator seeded with (seed, chunk index).
+
+    Returns:
+        dict: windows, positives, bytes and seconds.
+    """
+    start_time = time.perf_counter()
+    n_workers = n_workers or os.cpu_count() or 1
+    labels = episode_labels(
+        np.random.default_rng([seed, 0xE915]), n_windows, seizure_fraction
+    )
+    starts = range(0, n_windows, chunk_size)
+
+    def generate(i):
+        chunk_labels = labels[starts[i]:starts[i] + chunk_size]
+        rng = np.random.default_rng([seed, i])
+        windows = generate_windows(
+            rng, chunk_labels, n_channels, n_samples, fs, artifact_prob
+        )
+        return windows, chunk_labels
+
+    with BinWriter(filename, n_channels, n_samples) as writer:
+        with ThreadPoolExecutor(max_workers=n_workers) as pool:
+            pending = deque()
+            for i in range(len(starts)):
+                pending.append(pool.submit(generate, i))
+                if len(pending) >= 2 * n_workers:
+                    writer.write(*pending.popleft().result())
+            while pending:
+                writer.write(*pending.popleft().result())
+
+    return {
+        "windows": n_windows,
+        "positives": int(labels.sum()),
+        "bytes": os.path.getsize(filename),
+        "seconds": time.perf_counter() - start_time,
+    }
@@ -0,0 +1,291 @@
+import bisect
+import contextlib
+import os
+import threading
+import time
+import weakref
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Upper bounds of the histogram buckets; +Inf is implicit
+LATENCY_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+
+class _Owner:
+    # Held in one thread's local storage only: collected when that thread
+    # exits, which triggers folding its cell into the retired total
+    __slots__ = ("cell", "__weakref__")
+
+
+class _Cells:
+    """
+    Per-thread storage of a metric. A thread only ever writes its own cell,
+    so updates take no lock; readers add the cells up. The lock is only
+    taken the first time a thread touches the metric and when it exits:
+    the cell of a finished thread is added to a shared total and dropped,
+    so thread churn does not grow the number of cells.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.local = threading.local()
+        self.cells = []
+        self.retired = [0] * size
+        self.lock = threading.Lock()
+
+    def get(self):
+        try:
+            return self.local.owner.cell
+        except AttributeError:
+            owner = _Owner()
+            owner.cell = [0] * self.size
+            with self.lock:
+                self.cells.append(owner.cell)
+            weakref.finalize(owner, self._retire, owner.cell)
+            self.local.owner = owner
+            return owner.cell
+
+    def _retire(self, cell):
+        with self.lock:
+            self.retired = [a + b for a, b in zip(self.retired, cell)]
+            self.cells = [c for c in self.cells if c is not cell]
+
+    def total(self):
+        with self.lock:
+            cells = list(self.cells) + [self.retired]
+        return [sum(values) for values in zip(*cells)]
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels):
+        self.name, self.help, self.labels = name, help, labels
+        self._cells = _Cells(1)
+
+    def inc(self, amount=1):
+        self._cells.get()[0] += amount
+
+    @property
+    def value(self):
+        return self._cells.total()[0]
+
+    def samples(self):
+        yield self.name, self.labels, self.value
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name, help, labels):
+        self.name, self.help, self.labels = name, help, labels
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self):
+        yield self.name, self.labels, self.value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels, buckets):
+        self.name, self.help, self.labels = name, help, labels
+        self.buckets = tuple(sorted(buckets))
+        # One count per bucket, one for +Inf, then the sum
+        self._cells = _Cells(len(self.buckets) + 2)
+
+    def observe(self, value):
+        cell = self._cells.get()
+        cell[bisect.bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+    @contextlib.contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def samples(self):
+        totals = self._cells.total()
+        cumulative = 0
+        for bound, count in zip(self.buckets + ("+Inf",), totals[:-1]):
+            cumulative += count
+            labels = dict(self.labels, le=str(bound))
+            yield self.name + "_bucket", labels, cumulative
+        yield self.name + "_sum", self.labels, totals[-1]
+        yield self.name + "_count", self.labels, cumulative
+
+
+class Registry:
+    """
+    Set of named metrics, rendered in the Prometheus text format.
+
+    Getting a metric that already exists (same name and labels) returns it,
+    so modules can ask for their metrics where they use them.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help, labels, *args):
+        labels = dict(labels or {})
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self._metrics:
+                self._metrics[key] = cls(name, help, labels, *args)
+            metric = self._metrics[key]
+        if not isinstance(metric, cls):
+            raise ValueError(f"{name} is already a {metric.kind}")
+        return metric
+
+    def counter(self, name, help, labels=None):
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name, help, labels=None):
+        return self._get(Gauge, name, help, labels)
+
+    def histogram(self, name, help, labels=None, buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, help, labels, buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        lines = []
+        previous = None
+        for (name, _), metric in metrics:
+            if name != previous:
+                lines.append(f"# HELP {name} {metric.help}")
+                lines.append(f"# TYPE {name} {metric.kind}")
+                previous = name
+            for sample, labels, value in metric.samples():
+                lines.append(f"{sample}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    return "{" + pairs + "}"
+
+
+REGISTRY = Registry()
+
+
+class InferenceMetrics:
+    """
+    The metrics of one inference backend ("torch", "onnx", ...): windows
+    and alarms (windows predicted as seizure), the batch-size distribution
+    and the time spent loading data, running the model and post-processing.
+    """
+
+    def __init__(self, backend, registry=None):
+        registry = registry or REGISTRY
+        labels = {"backend": backend}
+        self.windows = registry.counter(
+            "seizureguard_windows_total", "Windows scored", labels
+        )
+        self.alarms = registry.counter(
+            "seizureguard_alarms_total",
+            "Windows predicted as seizure",
+            labels,
+        )
+        self.batch_size = registry.histogram(
+            "seizureguard_batch_size",
+            "Windows per model call",
+            labels,
+            BATCH_SIZE_BUCKETS,
+        )
+        self.load_seconds = registry.histogram(
+            "seizureguard_load_seconds",
+            "Time waiting for the next batch of windows",
+            labels,
+        )
+        self.model_seconds = registry.histogram(
+            "seizureguard_model_seconds", "Model execution per batch", labels
+        )
+        self.window_seconds = registry.histogram(
+            "seizureguard_window_latency_seconds",
+            "Model execution per window",
+            labels,
+        )
+        self.postprocess_seconds = registry.histogram(
+            "seizureguard_postprocess_seconds",
+            "Post-processing per batch (argmax, metrics, output)",
+            labels,
+        )
+
+    def record_model(self, n_windows, seconds):
+        self.batch_size.observe(n_windows)
+        self.model_seconds.observe(seconds)
+        if n_windows:
+            self.window_seconds.observe(seconds / n_windows)
+
+    def record_predictions(self, preds):
+        self.windows.inc(len(preds))
+        self.alarms.inc(int((preds == 1).sum()))
+
+
+def write_textfile(path, registry=None):
+    """
+    Write the metrics for e.g. the node_exporter textfile collector. The
+    file is replaced atomically so a scrape never sees half of it.
+    """
+    registry = registry or REGISTRY
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(registry.render())
+    os.replace(tmp_path, path)
+
+
+def start_http_server(port, addr="127.0.0.1", registry=None):
+    """
+    Serve the metrics on http://addr:port/metrics from a daemon thread.
+
+    Returns:
+        ThreadingHTTPServer: Call `shutdown()` on it to stop serving.
+    """
+    registry = registry or REGISTRY
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header(
+                "Content-Type", "text/plain; version=0.0.4; charset=utf-8"
+            )
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((addr, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -1,41 +1,36 @@
+import os
+import random
+import time
 import numpy as np
 import torch
-from sklearn.metrics import (
-    precision_score,
-    recall_score,
-    f1_score,
-    confusion_matrix,
+from utils.metrics import compute_metrics
+from utils.telemetry import InferenceMetrics
+from utils.binfile import (  # noqa: F401  (re-exported for the scripts)
+    save_arrays_and_labels_to_bin,
+    load_arrays_and_labels_from_bin,
+    read_bin_header,
+    read_bin_labels,
+    load_arrays_and_labels_memmap,
+    iter_bin_batches,
 )
 
 
-def compute_metrics(true_labels, pred_labels):
-    """
-    Compute evaluation metrics such as Precision, Recall, F1-Score, and False Positive Rate (FPR).
-    """
-    # Calculate Precision, Recall, and F1-Score
-    precision = precision_score(true_labels, pred_labels, zero_division=0)
-    recall = recall_score(true_labels, pred_labels, zero_division=0)
-    f1 = f1_score(true_labels, pred_labels, zero_division=0)
-
-    # Compute confusion matrix
-    tn, fp, fn, tp = confusion_matrix(true_labels, pred_labels).ravel()
-
-    # Calculate False Positive Rate (FPR)
-    if fp + tn > 0:
-        fpr = fp / (fp + tn)
-    else:
-        fpr = 0.0  # Handle the case where there are no true negatives or false positives
-
-    # Return metrics, with f1 as the primary metric for evaluation
-    return {
-        "precision": precision,
-        "recall": recall,
-        "f1": f1,
-        "fpr": fpr,  # False Positive Rate
-    }
-
-
-def train(train_loader, val_loader, model, device, epochs, patience=5):
+def train(
+    train_loader,
+    val_loader,
+    model,
+    device,
+    epochs,
+    patience=5,
+    save_path="models/best_model.pth",
+    transform=None,
+    lr=1e-4,
+    callback=None,
+    state_path=None,
+    checkpoint_every=0,
+    criterion=None,
+    run_config=None,
+):
     """
     Train the model on the training dataset.
 
@@ -43,18 +38,124 @@ def train(train_loader, val_loader, model, device, epochs, patience=5):
         train_loader (DataLoader): DataLoader for the training dataset.
         model (torch.nn.Module): Model to be trained.
         device: Device to train on (e.g. 'cpu' or 'cuda').
+        patience (int): Epochs without F1 improvement before stopping.
+        save_path (str): Where the best checkpoint is written.
+        transform (nn.Module, optional): Batch transform applied on the
+                                         device, see `utils.transforms`.
+        lr (float): Adam learning rate.
+        callback (callable, optional): Called as callback(epoch, val_f1,
+                                       metrics) after every validation;
+                                       returning True stops training.
+        state_path (str, optional): Resumable training state. If the file
+                                    exists and was saved for the same run
+                                    (see `run_config`), training continues
+                                    from it; it is rewritten after every
+                                    epoch and deleted once training ends.
+        checkpoint_every (int): Also write the state every this many
+                                batches (0: only at the end of epochs).
+        criterion (callable, optional): Loss of (model output, target),
+                                        defaults to cross-entropy. Items
+                                        of a training batch after (data,
+                                        target) are passed on to it.
+        run_config (dict, optional): What else the run depends on, e.g.
+                                     `file_signature` of the data file and
+                                     the batch size. Stored in the state
+                                     with the hyperparameters above; a
+                                     state saved for another config is
+                                     ignored.
 
     Returns:
-        torch.nn.Module: Trained model.
+        float: Best validation F1.
     """
-    criterion = torch.nn.CrossEntropyLoss()
-    optimizer = torch.optim.Adam(model.parameters(), lr=1e-4)
+    if criterion is None:
+        criterion = torch.nn.CrossEntropyLoss()
+    optimizer = torch.optim.Adam(
+        [p for p in model.parameters() if p.requires_grad], lr=lr
+    )
     prev_f1 = 0.0
-    for i in range(epochs):
+    remaining = patience
+    if transform is not None:
+        transform.to(device)
+
+    sampler, _ = _resumable_sampler(train_loader)
+    start_epoch, start_batch, start_loss = 0, 0, 0.0
+    epoch_rng = batch_rng = None
+    config = {
+        "epochs": epochs,
+        "patience": patience,
+        "lr": lr,
+        "save_path": save_path,
+        **(run_config or {}),
+    }
+    state = None
+    if state_path is not None and os.path.exists(state_path):
+        state = torch.load(state_path, map_location=device, weights_only=False)
+        if state.get("config") != config:
+            print(f"ignoring {state_path}: saved for another data or config")
+            state = None
+    if state is not None:
+        model.load_state_dict(state["state_dict"])
+        optimizer.load_state_dict(state["optimizer"])
+        if sampler is not None and state["sampler"] is not None:
+            sampler.load_state_dict(state["sampler"])
+        prev_f1, remaining = state["best_f1"], state["remaining"]
+        start_epoch, start_batch = state["epoch"], state["batch"]
+        start_loss = state["train_loss"]
+        epoch_rng, batch_rng = state["epoch_rng"], state["rng"]
+        print(f"resuming: epoch {start_epoch + 1}, batch {start_batch}")
+
+    def save_state(epoch, batch, train_loss):
+        save_checkpoint(
+            state_path,
+            {
+                "epoch": epoch,
+                "batch": batch,
+                "train_loss": train_loss,
+                "best_f1": prev_f1,
+                "remaining": remaining,
+                "config": config,
+                "state_dict": model.state_dict(),
+                "optimizer": optimizer.state_dict(),
+                "sampler": sampler.state_dict() if sampler else None,
+                "epoch_rng": epoch_rng,
+                "rng": _get_rng_state(),
+            },
+        )
+
+    for i in range(start_epoch, epochs):
+        # The shuffling of the epoch is derived from the RNG state at its
+        # start; a resumed epoch replays it and then skips ahead.
+        if epoch_rng is None:
+            epoch_rng = _get_rng_state()
+        else:
+            _set_rng_state(epoch_rng)
+        batches = _epoch_batches(train_loader, i, start_batch)
+        if batch_rng is not None:
+            _set_rng_state(batch_rng)
+
+        on_batch = None
+        if state_path is not None and checkpoint_every:
+
+            def on_batch(batch, train_loss):
+                if batch % checkpoint_every == 0:
+                    save_state(i, batch, train_loss)
+
         train_loss = train_one_epoch(
-            train_loader, model, criterion, optimizer, device
+            train_loader,
+            model,
+            criterion,
+            optimizer,
+            device,
+            transform,
+            batches=batches,
+            start_batch=start_batch,
+            start_loss=start_loss,
+            on_batch=on_batch,
         )
-        val_f1, metrics = validate(val_loader, model, device)
+        start_batch, start_loss = 0, 0.0
+        epoch_rng = batch_rng = None
+
+        val_f1, metrics = validate(val_loader, model, device, transform)
         print(
             f"Epoch {i+1}, Train Loss = {train_loss:.6f}, "
             f"Validation F1 = {val_f1:.4f}, "
@@ -63,53 +164,176 @@ def train(train_loader, val_loader, model, device, epochs, patience=5):
         )
         if prev_f1 < val_f1:
             prev_f1 = val_f1
-            patience = 5
-            print(f"reset: {patience}")
-        patience -= 1
+            remaining = patience
+            print(f"reset: {remaining}")
+        else:
+            remaining -= 1
         if prev_f1 == val_f1:
-            torch.save(
+            save_checkpoint(
+                save_path,
                 {
                     "state_dict": model.state_dict(),
                     "optimizer": optimizer.state_dict(),
                 },
-                f"models/best_model.pth",
             )
-            print(f"saving,  {patience}")
-
-        if patience == 0:
+            print(f"saving,  {remaining}")
+
+        stop = False
+        if callback is not None and callback(i, val_f1, metrics):
+            print("stopped by callback")
+            stop = True
+        stop = stop or remaining == 0
+        if stop:
             break
+        if state_path is not None:
+            epoch_rng = _get_rng_state()
+            save_state(i + 1, 0, 0.0)
+
+    # A finished run leaves no state: the next invocation trains again
+    if state_path is not None and os.path.exists(state_path):
+        os.remove(state_path)
+    return prev_f1
+
+
+def _resumable_sampler(loader):
+    """
+    The sampler of `loader` that supports set_epoch/skip (see
+    `utils.samplers`), and how many of its items make one batch.
+    """
+    if hasattr(loader.batch_sampler, "skip"):
+        return loader.batch_sampler, 1
+    if hasattr(loader.sampler, "skip"):
+        return loader.sampler, loader.batch_size
+    return None, None
+
+
+def _epoch_batches(loader, epoch, start_batch):
+    sampler, per_batch = _resumable_sampler(loader)
+    if sampler is not None:
+        sampler.set_epoch(epoch)
+        sampler.skip(start_batch * per_batch)
+        return iter(loader)
+    # Any other sampler: replay the order and discard the batches already
+    # trained on (this loads them once more)
+    batches = iter(loader)
+    for _ in range(start_batch):
+        next(batches)
+    return batches
+
+
+def _get_rng_state():
+    state = {
+        "torch": torch.get_rng_state(),
+        "numpy": np.random.get_state(),
+        "python": random.getstate(),
+    }
+    if torch.cuda.is_available():
+        state["cuda"] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def _set_rng_state(state):
+    torch.set_rng_state(state["torch"])
+    np.random.set_state(state["numpy"])
+    random.setstate(state["python"])
+    if "cuda" in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])
+
+
+def file_signature(path):
+    """
+    (size, mtime in ns) of a file, cheap enough for multi-GB data files.
+    """
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
 
 
-def train_one_epoch(train_loader, model, criterion, optimizer, device):
+def save_checkpoint(path, state):
+    """
+    `torch.save` to a temporary file renamed over `path`: an interruption
+    never leaves a truncated file, and readers that memory-mapped the
+    previous version (see `utils.registry`) keep its inode instead of
+    seeing it rewritten under them.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    torch.save(state, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def train_one_epoch(
+    train_loader,
+    model,
+    criterion,
+    optimizer,
+    device,
+    transform=None,
+    batches=None,
+    start_batch=0,
+    start_loss=0.0,
+    on_batch=None,
+):
     """
     Train the model for one epoch on the training dataset.
 
     Args:
         train_loader (DataLoader): DataLoader for the training dataset.
         model (torch.nn.Module): Model to be trained.
-        criterion: Loss function.
+        criterion: Loss of (output, target, *extra batch items).
         optimizer: Optimizer for the model.
         device: Device to train on (e.g. 'cpu' or 'cuda').
+        transform (nn.Module, optional): Batch transform, in training mode.
+        batches (iterator, optional): Iterator over `train_loader` that is
+                                      already `start_batch` batches in,
+                                      when resuming an epoch.
+        start_batch (int): Batches of the epoch already trained on.
+        start_loss (float): Summed loss of those batches.
+        on_batch (callable, optional): Called as on_batch(batches_done,
+                                       summed_loss) after every batch.
 
     Returns:
         float: Average loss for the epoch.
     """
     model.train()
-    train_loss = 0.0
-
-    for data, target in train_loader:
+    freeze_batchnorm_stats(model)
+    if transform is not None:
+        transform.train()
+    train_loss = start_loss
+    if batches is None:
+        batches = train_loader
+
+    for batch, (data, target, *extra) in enumerate(batches, start_batch + 1):
         data, target = data.to(device), target.to(device)
+        if transform is not None:
+            data = transform(data)
         optimizer.zero_grad()
         output = model(data)
-        loss = criterion(output, target)
+        loss = criterion(output, target, *[x.to(device) for x in extra])
         loss.backward()
         optimizer.step()
         train_loss += loss.item()
+        if on_batch is not None:
+            on_batch(batch, train_loss)
 
     return train_loss / len(train_loader)
 
 
-def validate(val_loader, model, device):
+def freeze_batchnorm_stats(model):
+    """
+    Put the BatchNorm layers whose parameters are all frozen in eval mode,
+    so fine-tuning the layers around them leaves their running statistics
+    untouched too. Call after `model.train()`.
+    """
+    for module in model.modules():
+        if not isinstance(module, torch.nn.modules.batchnorm._BatchNorm):
+            continue
+        if not any(p.requires_grad for p in module.parameters()):
+            module.eval()
+
+
+def validate(val_loader, model, device, transform=None):
     """
     Validate the model on the validation dataset, returning F1 score and additional metrics.
 
@@ -117,22 +341,37 @@ def validate(val_loader, model, device):
         val_loader (DataLoader): DataLoader for the validation dataset.
         model (torch.nn.Module): Model to be validated.
         device: Device to validate on (e.g. 'cpu' or 'cuda').
+        transform (nn.Module, optional): Batch transform, in eval mode so
+                                         random augmentations are skipped.
 
     Returns:
         tuple: Validation loss, F1 score, and a dictionary of other metrics.
     """
     model.eval()
+    if transform is not None:
+        transform.eval()
     all_preds = []
     all_targets = []
+    telemetry = InferenceMetrics("torch")
 
     with torch.no_grad():
+        loaded = time.perf_counter()
         for data, target in val_loader:
+            start = time.perf_counter()
+            telemetry.load_seconds.observe(start - loaded)
             data, target = data.to(device), target.to(device)
+            if transform is not None:
+                data = transform(data)
             output = model(data)
+            done = time.perf_counter()
+            telemetry.record_model(len(data), done - start)
 
-            preds = output.argmax(dim=1)
-            all_preds.append(preds.cpu().numpy())
+            preds = output.argmax(dim=1).cpu().numpy()
+            all_preds.append(preds)
             all_targets.append(target.cpu().numpy())
+            telemetry.record_predictions(preds)
+            loaded = time.perf_counter()
+            telemetry.postprocess_seconds.observe(loaded - done)
 
     all_preds = np.concatenate(all_preds)
     all_targets = np.concatenate(all_targets)
@@ -144,94 +383,148 @@ def validate(val_loader, model, device):
     return val_f1, metrics
 
 
-import numpy as np
-
-
-def save_arrays_and_labels_to_bin(array_list, labels_list, filename):
+def export_onnx(
+    model, onnx_model_path, in_shape=(18, 1024), opset_version=11
+):
     """
-    Saves a list of NumPy arrays and corresponding labels to a binary file with a header.
+    Export a model to ONNX with a dynamic batch dimension.
 
-    Parameters:
-    - array_list: List of NumPy arrays, each array should have the same shape and dtype.
-    - labels_list: List or NumPy array of labels corresponding to each array in array_list.
-    - filename: Name of the binary file to save the data to.
+    Args:
+        model (torch.nn.Module): Model to export.
+        onnx_model_path (str): Where to write the ONNX file.
+        in_shape (tuple): Shape of one input window.
+        opset_version (int): ONNX opset version.
     """
-    # Check that array_list and labels_list are not empty and have the same length
-    if len(array_list) != len(labels_list):
-        raise ValueError(
-            "array_list and labels_list must have the same length"
-        )
-
-    # Verify that all arrays have the same shape and dtype
-    first_shape = array_list[0].shape
-    first_dtype = array_list[0].dtype
-    for idx, arr in enumerate(array_list):
-        if arr.shape != first_shape:
-            raise ValueError(
-                f"All arrays must have the same shape. Array at index {idx} has shape {arr.shape}, expected {first_shape}"
-            )
-        if arr.dtype != first_dtype:
-            raise ValueError(
-                f"All arrays must have the same dtype. Array at index {idx} has dtype {arr.dtype}, expected {first_dtype}"
-            )
-
-    # Convert array_list to a single NumPy array
-    data = np.stack(array_list)  # Shape will be (num_arrays, dim1, dim2)
+    # Create a dummy input tensor with batch size 1
+    dummy_input = torch.randn(1, *in_shape)
+    torch.onnx.export(
+        model,
+        dummy_input,
+        onnx_model_path,
+        input_names=["input"],
+        output_names=["output"],
+        dynamic_axes={
+            "input": {0: "batch_size"},
+            "output": {0: "batch_size"},
+        },
+        opset_version=opset_version,
+    )
+
+
+def cache_teacher_logits(
+    teacher,
+    dataset,
+    cache_path,
+    device,
+    batch_size=256,
+    teacher_path=None,
+    data_file=None,
+):
+    """
+    Run the teacher once over `dataset` and store its logits in `cache_path`
+    (.npy). The cache is reused as long as the SHA-256 of the teacher
+    checkpoint and the size and mtime of the data file, recorded in
+    `<cache_path>.json`, still match, so the teacher is never rerun.
 
-    # Convert labels_list to a NumPy array
-    labels = np.array(labels_list, dtype=np.int32)
+    Args:
+        teacher_path (str, optional): Checkpoint the teacher was loaded from.
+        data_file (str, optional): .bin file `dataset` was read from.
 
-    # Get the dimensions
-    num_arrays, dim1, dim2 = data.shape
+    Returns:
+        numpy.ndarray: Teacher logits of shape (num_samples, 2).
+    """
+    from utils.artifacts import read_manifest, write_manifest
+    from utils.hashing import sha256_file
 
-    # Prepare header: [num_arrays, dim1, dim2, labels_present (1 for True)], stored as int32
-    header = np.array(
-        [num_arrays, dim1, dim2, 1], dtype=np.int32
-    )  # The '1' indicates labels are present
+    key = {
+        "teacher": sha256_file(teacher_path) if teacher_path else None,
+        "data": list(file_signature(data_file)) if data_file else None,
+        "windows": len(dataset),
+    }
+    manifest_path = cache_path + ".json"
+    if os.path.exists(cache_path):
+        if read_manifest(manifest_path) == key:
+            print(f"Using cached teacher logits from {cache_path}")
+            return np.load(cache_path, mmap_mode="r")
+        print(f"Stale teacher logits in {cache_path}, recomputing")
+
+    loader = torch.utils.data.DataLoader(
+        dataset, batch_size=batch_size, shuffle=False
+    )
+    teacher.eval()
+    all_logits = []
+    with torch.no_grad():
+        for data, _ in loader:
+            all_logits.append(teacher(data.to(device)).cpu().numpy())
+    logits = np.concatenate(all_logits).astype(np.float32)
 
-    # Open file in binary write mode
-    with open(filename, "wb") as f:
-        # Write header
-        header.tofile(f)
-        # Write data
-        data.tofile(f)
-        # Write labels
-        labels.tofile(f)
+    os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+    np.save(cache_path, logits)
+    write_manifest(manifest_path, key)
+    print(f"Teacher logits cached to {cache_path}")
 
-    print(f"Data and labels saved to {filename}")
+    return logits
 
 
-def load_arrays_and_labels_from_bin(filename):
+def distillation_loss(
+    student_logits, teacher_logits, target, temperature, alpha
+):
+    """
+    Hinton-style distillation loss: KL divergence to the softened teacher
+    distribution blended with the usual cross-entropy on the labels.
     """
-    Loads data and labels from a binary file with a header.
+    soft = torch.nn.functional.kl_div(
+        torch.nn.functional.log_softmax(student_logits / temperature, dim=1),
+        torch.nn.functional.softmax(teacher_logits / temperature, dim=1),
+        reduction="batchmean",
+    )
+    hard = torch.nn.functional.cross_entropy(student_logits, target)
+    return alpha * temperature**2 * soft + (1.0 - alpha) * hard
+
+
+def distill(
+    train_loader,
+    val_loader,
+    student,
+    device,
+    epochs,
+    patience=5,
+    temperature=4.0,
+    alpha=0.7,
+    lr=1e-3,
+    save_path="models/student.pth",
+):
+    """
+    Train a student model on cached teacher logits plus labels, with the
+    epoch, early stopping and checkpointing logic of `train`.
 
-    Parameters:
-    - filename: Name of the binary file to read the data from.
+    Args:
+        train_loader (DataLoader): Yields (data, target, teacher_logits),
+                                   see `utils.dataset.DistillationDataset`.
+        val_loader (DataLoader): Regular (data, target) validation loader.
+        student (torch.nn.Module): Model to be trained.
+        device: Device to train on (e.g. 'cpu' or 'cuda').
+        temperature (float): Softmax temperature applied to both models.
+        alpha (float): Weight of the soft-target term.
+        save_path (str): Where the best student checkpoint is written.
 
     Returns:
-    - data: NumPy array of shape (num_arrays, dim1, dim2)
-    - labels: NumPy array of shape (num_arrays,) containing the labels
-    """
-    with open(filename, "rb") as f:
-        # Read header
-        header = np.fromfile(f, dtype=np.int32, count=4)
-        if len(header) < 4:
-            raise ValueError("Header is incomplete or file is corrupted.")
-        num_arrays, dim1, dim2, labels_present = header
-
-        # Read data
-        num_floats = num_arrays * dim1 * dim2
-        data = np.fromfile(f, dtype="<f4", count=num_floats)
-        if data.size < num_floats:
-            raise ValueError("Data is incomplete or file is corrupted.")
-        data = data.reshape((num_arrays, dim1, dim2))
-
-        # Read labels if present
-        if labels_present == 1:
-            labels = np.fromfile(f, dtype="<i4", count=num_arrays)
-            if labels.size < num_arrays:
-                raise ValueError("Labels are incomplete or file is corrupted.")
-        else:
-            labels = None  # Or set default labels if necessary
+        float: Best validation F1.
+    """
+
+    def criterion(student_logits, target, teacher_logits):
+        return distillation_loss(
+            student_logits, teacher_logits, target, temperature, alpha
+        )
 
-    return data, labels
+    return train(
+        train_loader,
+        val_loader,
+        student,
+        device,
+        epochs,
+        patience=patience,
+        save_path=save_path,
+        lr=lr,
+        criterion=criterion,
+    )
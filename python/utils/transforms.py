@@ -0,0 +1,147 @@
+import torch
+import torch.nn as nn
+
+
+class Compose(nn.Sequential):
+    """
+    Chain batch transforms. Being an nn.Module, `train()` / `eval()`
+    switches all random augmentations on or off at once, and deterministic
+    parts (filtering, z-scoring) can be exported together with the model.
+
+    Every transform takes and returns a float tensor of shape (B, C, T).
+    """
+
+
+class FFTFilter(nn.Module):
+    """
+    Zero-phase band-pass and notch filtering of a whole batch with a single
+    rFFT / irFFT pair along time.
+
+    Args:
+        fs (float): Sampling rate in Hz.
+        low (float, optional): Lower cut-off of the pass band.
+        high (float, optional): Upper cut-off of the pass band.
+        notch (float, optional): Line-noise frequency to remove (e.g. 50),
+                                 together with its harmonics below Nyquist.
+        notch_width (float): Width of each notch in Hz.
+    """
+
+    def __init__(
+        self, fs=256.0, low=None, high=None, notch=None, notch_width=2.0
+    ):
+        super(FFTFilter, self).__init__()
+        self.fs = fs
+        self.low = low
+        self.high = high
+        self.notch = notch
+        self.notch_width = notch_width
+        self._masks = {}
+
+    def _mask(self, n_samples, device):
+        key = (n_samples, device)
+        if key not in self._masks:
+            freqs = torch.fft.rfftfreq(n_samples, d=1.0 / self.fs)
+            mask = torch.ones_like(freqs)
+            if self.low is not None:
+                mask[freqs < self.low] = 0.0
+            if self.high is not None:
+                mask[freqs > self.high] = 0.0
+            if self.notch is not None:
+                harmonic = self.notch
+                while harmonic < self.fs / 2:
+                    band = (freqs - harmonic).abs() <= self.notch_width / 2
+                    mask[band] = 0.0
+                    harmonic += self.notch
+            self._masks[key] = mask.to(device)
+        return self._masks[key]
+
+    def forward(self, x):
+        n_samples = x.shape[-1]
+        spectrum = torch.fft.rfft(x, dim=-1)
+        spectrum = spectrum * self._mask(n_samples, x.device)
+        return torch.fft.irfft(spectrum, n=n_samples, dim=-1)
+
+
+class ZScore(nn.Module):
+    """
+    Per-channel standardisation with precomputed dataset statistics.
+    """
+
+    def __init__(self, mean, std, eps=1e-6):
+        super(ZScore, self).__init__()
+        mean = torch.as_tensor(mean, dtype=torch.float32).reshape(1, -1, 1)
+        std = torch.as_tensor(std, dtype=torch.float32).reshape(1, -1, 1)
+        self.register_buffer("mean", mean)
+        self.register_buffer("scale", 1.0 / (std + eps))
+
+    @classmethod
+    def from_stats(cls, stats, eps=1e-6):
+        """
+        Build from the sidecar statistics of `utils.stats`.
+        """
+        return cls(stats["mean"], stats["std"], eps=eps)
+
+    def forward(self, x):
+        return (x - self.mean) * self.scale
+
+
+class RandomTimeShift(nn.Module):
+    """
+    Circularly shift every window by its own random offset in
+    [-max_shift, max_shift] samples. Identity in eval mode.
+    """
+
+    def __init__(self, max_shift=128):
+        super(RandomTimeShift, self).__init__()
+        self.max_shift = max_shift
+
+    def forward(self, x):
+        if not self.training or self.max_shift == 0:
+            return x
+        b, c, t = x.shape
+        shifts = torch.randint(
+            -self.max_shift, self.max_shift + 1, (b, 1), device=x.device
+        )
+        index = (torch.arange(t, device=x.device).unsqueeze(0) - shifts) % t
+        return torch.gather(x, 2, index.unsqueeze(1).expand(b, c, t))
+
+
+class RandomAmplitudeScale(nn.Module):
+    """
+    Multiply every window (or every channel of every window) by a random
+    factor drawn uniformly from [low, high]. Identity in eval mode.
+    """
+
+    def __init__(self, low=0.8, high=1.2, per_channel=False):
+        super(RandomAmplitudeScale, self).__init__()
+        self.low = low
+        self.high = high
+        self.per_channel = per_channel
+
+    def forward(self, x):
+        if not self.training:
+            return x
+        b, c, _ = x.shape
+        shape = (b, c, 1) if self.per_channel else (b, 1, 1)
+        scale = torch.empty(shape, device=x.device).uniform_(
+            self.low, self.high
+        )
+        return x * scale
+
+
+class ChannelDropout(nn.Module):
+    """
+    Zero out whole channels with probability `p`, independently for every
+    window. Identity in eval mode.
+    """
+
+    def __init__(self, p=0.1):
+        super(ChannelDropout, self).__init__()
+        self.p = p
+
+    def forward(self, x):
+        if not self.training or self.p == 0:
+            return x
+        b, c, _ = x.shape
+        keep = torch.rand((b, c, 1), device=x.device) >= self.p
+        return x * keep